@@ -0,0 +1,100 @@
+# agent_cache.py — per-user semantic response cache for the ReAct agent
+#
+# An entry is only served back under the same data version and the same
+# conversation context (a hash of the recent chat history the answer was built
+# from; None for answers that don't read the history). A near-identical query
+# (embedding similarity) must also name the same things: digits, quoted strings
+# and capitalised names, so "scores for exam 3" never gets exam 4's answer.
+import hashlib
+import os
+import re
+import time
+import threading
+import numpy as np
+
+CACHE_SIM_THRESHOLD = float(os.getenv("AGENT_CACHE_SIM", "0.95"))
+CACHE_TTL_SECONDS = int(os.getenv("AGENT_CACHE_TTL", "1800"))
+CACHE_MAX_PER_USER = int(os.getenv("AGENT_CACHE_MAX_PER_USER", "64"))
+
+# {user_id: [{"query", "vec": np.ndarray, "version", "context", "entities": frozenset, "response", "ts"}, ...]}
+_RESPONSE_CACHE = {}
+_LOCK = threading.Lock()
+
+def normalize_query(q: str) -> str:
+    s = (q or "").strip().lower()
+    s = re.sub(r"[^\w\s]", " ", s)
+    return re.sub(r"\s+", " ", s).strip()
+
+_QUOTED = re.compile(r"\"([^\"]+)\"|'([^']+)'|“([^”]+)”")
+_DIGITS = re.compile(r"\d+(?:[.,]\d+)?")
+_NAME = re.compile(r"(?<![.!?]\s)(?<!^)\b[A-Z][\w'-]+")
+
+def entities(raw_query: str) -> frozenset:
+    """Digits, quoted strings and capitalised words (not sentence-initial) of the raw query."""
+    q = raw_query or ""
+    out = {m for m in _DIGITS.findall(q)}
+    out |= {"'" + next(g for g in m if g).strip().lower() for m in _QUOTED.findall(q)}
+    out |= {"@" + m.lower() for m in _NAME.findall(q.strip())}
+    return frozenset(out)
+
+def context_key(history) -> str:
+    """Stable hash of the chat turns an answer was built from ("" for a fresh session)."""
+    if not history:
+        return ""
+    raw = "\n".join(f"{h.get('query', '')}\x1f{h.get('response', '')}" for h in history)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def _unit(vec) -> np.ndarray:
+    v = np.asarray(vec, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+def lookup_response(user_id: str, norm_query: str, query_vec, version, context="", ents=frozenset()):
+    """Return a cached reply for an identical or near-identical query, or None.
+
+    Entries stamped with another data version are dropped on the way through;
+    entries from another conversation context are skipped.
+    """
+    now = time.time()
+    q = _unit(query_vec)
+    with _LOCK:
+        entries = _RESPONSE_CACHE.get(user_id)
+        if not entries:
+            return None
+        fresh = [e for e in entries if e["version"] == version and now - e["ts"] < CACHE_TTL_SECONDS]
+        _RESPONSE_CACHE[user_id] = fresh
+        best, best_sim = None, -1.0
+        for e in fresh:
+            if e["context"] is not None and e["context"] != context:
+                continue
+            if e["query"] == norm_query:
+                return e["response"]
+            if e["entities"] != ents:
+                continue
+            sim = float(np.dot(q, e["vec"]))
+            if sim > best_sim:
+                best, best_sim = e, sim
+        if best is not None and best_sim >= CACHE_SIM_THRESHOLD:
+            return best["response"]
+    return None
+
+def store_response(user_id: str, norm_query: str, query_vec, version, response: str, context="", ents=frozenset()):
+    """context=None marks an answer that doesn't depend on the conversation (served in any session)."""
+    entry = {
+        "query": norm_query,
+        "vec": _unit(query_vec),
+        "version": version,
+        "context": context,
+        "entities": ents,
+        "response": response,
+        "ts": time.time(),
+    }
+    with _LOCK:
+        entries = [e for e in _RESPONSE_CACHE.get(user_id, [])
+                   if e["query"] != norm_query or e["context"] != context]
+        entries.append(entry)
+        _RESPONSE_CACHE[user_id] = entries[-CACHE_MAX_PER_USER:]
+
+def invalidate_user(user_id: str):
+    with _LOCK:
+        _RESPONSE_CACHE.pop(user_id, None)
@@ -1,22 +1,31 @@
 import os
 import json
 import re
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
 from datetime import datetime
 from bson import ObjectId
 from flask import Blueprint, request, jsonify, g
 from flask_cors import cross_origin
-import jwt
 import numpy as np
 from sentence_transformers import SentenceTransformer
 from dotenv import load_dotenv
-from groq import Groq 
+from groq import Groq, APITimeoutError
 from werkzeug.utils import secure_filename
 
 load_dotenv()
 
 # DB
 from mongo import exams_collection, submissions_collection, courses_collection
+from agent_cache import normalize_query, lookup_response, store_response, invalidate_user, entities, context_key
+from cache_bus import BUS
+from intent_router import classify as classify_intent
+import data_access as dal
+from auth import decode_token
+from metrics import observe_llm
+from percentiles import nearest_rank
+from structured_output import values as structured_values
 
 # Config
 JWT_SECRET = os.getenv("JWT_SECRET")
@@ -43,7 +52,7 @@ bp_ai = Blueprint("ai", __name__)
 
 # ---------- Auth ----------
 def _decode_jwt(token: str) -> dict:
-    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+    return decode_token(token, JWT_SECRET)
 
 def _require_auth():
     h = request.headers.get("Authorization") or ""
@@ -58,12 +67,27 @@ def _require_auth():
         return None, jsonify({"error": "invalid token"}), 401
 
 # ---------- TOOLS ----------
+# A tool thread can't be cancelled once its future times out, so the work itself is
+# bounded: _execute_tools sets the agent's deadline for the thread, and the Mongo
+# reads below pass what is left of it as maxTimeMS.
+_TOOL_CTX = threading.local()
+
+def _tool_ms() -> int:
+    deadline = getattr(_TOOL_CTX, "deadline", None)
+    left = AGENT_TOOL_TIMEOUT if deadline is None else min(AGENT_TOOL_TIMEOUT, deadline - time.monotonic())
+    return max(1, int(left * 1000))
+
+def _tool_time_left() -> bool:
+    deadline = getattr(_TOOL_CTX, "deadline", None)
+    return deadline is None or time.monotonic() < deadline
+
+def _owner(user_id):
+    # Agent tools always act as the (non-admin) caller, even for admin accounts
+    return {"sub": user_id}
+
 def tool_list_exams(user_id):
     try:
-        exams = list(exams_collection.find(
-            {"created_by": ObjectId(user_id)},
-            {"title": 1, "created_at": 1}
-        ).sort([("created_at", -1)]))
+        exams = list(dal.find_exams(_owner(user_id), {"title": 1, "created_at": 1}).max_time_ms(_tool_ms()))
         if not exams:
             return "No exams found."
         result = []
@@ -77,11 +101,11 @@ def tool_list_exams(user_id):
     except Exception as e:
         return f"Error listing exams: {str(e)}"
 
-def tool_get_exam(exam_id):
+def tool_get_exam(exam_id, user_id):
     try:
         if not exam_id:
             return "Exam ID is required."
-        exam = exams_collection.find_one({"_id": ObjectId(exam_id)})
+        exam = dal.find_exam(_owner(user_id), exam_id)
         if not exam:
             return "Exam not found."
         return json.dumps({
@@ -95,14 +119,16 @@ def tool_get_exam(exam_id):
     except Exception as e:
         return f"Error getting exam: {str(e)}"
 
-def tool_list_submissions(exam_id=None):
+def tool_list_submissions(exam_id=None, user_id=None):
     try:
-        if not exam_id:
-            latest = exams_collection.find_one(sort=[("created_at", -1)])
-            if not latest:
-                return "No exams found to list submissions for."
-            exam_id = str(latest["_id"])
-        subs = list(submissions_collection.find({"exam_id": ObjectId(exam_id)}).sort([("created_at", -1)]))
+        owner = _owner(user_id)
+        exam = dal.find_exam(owner, exam_id, {"_id": 1}) if exam_id else dal.latest_exam(owner, {"_id": 1})
+        if not exam:
+            return "Exam not found." if exam_id else "No exams found to list submissions for."
+        subs = list(dal.find_submissions(
+            owner, {"exam_id": exam["_id"]},
+            {"student_name": 1, "score": 1, "feedback": 1, "created_at": 1},
+        ).max_time_ms(_tool_ms()))
         if not subs:
             return "No submissions found for this exam."
         result = []
@@ -111,7 +137,7 @@ def tool_list_submissions(exam_id=None):
                 "id": str(s["_id"]),
                 "student": s.get("student_name", "Unknown Student"),
                 "score": s.get("score", "N/A"),
-                "feedback": s.get("feedback", "")[:100] + ("..." if len(s.get("feedback", "")) > 100 else ""),
+                "feedback": (s.get("feedback") or "")[:100] + ("..." if len(s.get("feedback") or "") > 100 else ""),
                 "created_at": s.get("created_at").isoformat() if s.get("created_at") else "Unknown"
             })
         return json.dumps(result, ensure_ascii=False)
@@ -121,8 +147,10 @@ def tool_list_submissions(exam_id=None):
 def tool_search_rag(query: str, user_id: str) -> str:
     try:
         docs = []
-        courses = courses_collection.find({"user_id": ObjectId(user_id)})
+        courses = courses_collection.find({"user_id": ObjectId(user_id)}).max_time_ms(_tool_ms())
         for course in courses:
+            if not _tool_time_left():
+                break  # rank what was embedded so far
             content = course.get("text", "")
             if not content.strip():
                 continue
@@ -148,13 +176,299 @@ def tool_search_rag(query: str, user_id: str) -> str:
     except Exception as e:
         return f"Error searching RAG: {str(e)}"
 
+# ---------- ANALYTICS TOOLS (server-side aggregations, compact results) ----------
+def _owned_exam(exam_id, user_id):
+    """Resolves exam_id (or the user's latest exam when empty) within the caller's scope."""
+    if exam_id:
+        return dal.find_exam(_owner(user_id), exam_id, {"title": 1})
+    return dal.latest_exam(_owner(user_id), {"title": 1})
+
+def tool_question_stats(user_id, exam_id=None, question_id=None):
+    try:
+        exam = _owned_exam(exam_id, user_id)
+        if not exam:
+            return "Exam not found."
+        pipeline = [
+            {"$match": {"exam_id": exam["_id"], "grading_details": {"$exists": True}}},
+            {"$project": {"student_name": 1, "grading_details.question_id": 1,
+                          "grading_details.points": 1, "grading_details.awarded": 1}},
+            {"$unwind": "$grading_details"},
+        ]
+        if question_id:
+            qid = str(question_id).strip()
+            alt = qid[1:] if qid.upper().startswith("Q") else f"Q{qid}"
+            pipeline.append({"$match": {"grading_details.question_id": {"$in": [qid, alt, qid.upper(), alt.upper()]}}})
+        pipeline += [
+            {"$addFields": {"missed": {"$lt": ["$grading_details.awarded", "$grading_details.points"]}}},
+            {"$group": {
+                "_id": "$grading_details.question_id",
+                "attempts": {"$sum": 1},
+                "misses": {"$sum": {"$cond": ["$missed", 1, 0]}},
+                "avg_awarded": {"$avg": "$grading_details.awarded"},
+                "points": {"$max": "$grading_details.points"},
+                "missed_by": {"$push": {"$cond": ["$missed", "$student_name", "$$REMOVE"]}},
+            }},
+            {"$project": {
+                "_id": 0,
+                "question_id": "$_id",
+                "attempts": 1,
+                "misses": 1,
+                "miss_rate": {"$round": [{"$divide": ["$misses", "$attempts"]}, 3]},
+                "avg_awarded": {"$round": ["$avg_awarded", 2]},
+                "points": 1,
+                "missed_by": {"$slice": ["$missed_by", 30]},
+            }},
+            {"$sort": {"miss_rate": -1, "question_id": 1}},
+        ]
+        rows = list(submissions_collection.aggregate(pipeline, maxTimeMS=_tool_ms()))
+        if not rows:
+            return "No graded submissions found for this exam."
+        return json.dumps({"exam": exam.get("title", "Untitled Exam"), "questions": rows}, ensure_ascii=False)
+    except Exception as e:
+        return f"Error computing question stats: {str(e)}"
+
+def tool_score_percentiles(user_id, exam_id=None):
+    try:
+        exam = _owned_exam(exam_id, user_id)
+        if not exam:
+            return "Exam not found."
+        row = next(submissions_collection.aggregate([
+            {"$match": {"exam_id": exam["_id"], "score": {"$type": "number"}}},
+            {"$sort": {"score": 1}},
+            {"$group": {
+                "_id": None,
+                "count": {"$sum": 1},
+                "avg": {"$avg": "$score"},
+                "min": {"$min": "$score"},
+                "max": {"$max": "$score"},
+                "stddev": {"$stdDevPop": "$score"},
+                "passed": {"$sum": {"$cond": [{"$gte": ["$score", 10]}, 1, 0]}},
+                "scores": {"$push": "$score"},
+            }},
+        ], maxTimeMS=_tool_ms()), None)
+        if not row:
+            return "No graded submissions found for this exam."
+        scores = row.pop("scores")
+        row.pop("_id", None)
+        return json.dumps({
+            "exam": exam.get("title", "Untitled Exam"),
+            **{k: round(float(v), 2) if isinstance(v, float) else v for k, v in row.items()},
+            "percentiles": {f"p{p}": nearest_rank(scores, p) for p in (10, 25, 50, 75, 90)},
+        }, ensure_ascii=False)
+    except Exception as e:
+        return f"Error computing score percentiles: {str(e)}"
+
+def tool_student_history(user_id, student):
+    try:
+        if not student:
+            return "Student name is required."
+        name = student.strip()
+        pattern = re.escape(name)
+        rows = list(submissions_collection.aggregate([
+            {"$match": {**dal.scope(_owner(user_id)),
+                        "$or": [{"student_name": {"$regex": pattern, "$options": "i"}}, {"student_number": name}]}},
+            {"$sort": {"created_at": -1}},
+            {"$limit": 20},
+            {"$lookup": {"from": exams_collection.name, "localField": "exam_id", "foreignField": "_id",
+                         "pipeline": [{"$project": {"title": 1}}], "as": "exam"}},
+            {"$project": {"_id": 0, "exam": {"$first": "$exam.title"}, "student": "$student_name", "score": 1,
+                          "questions_missed": {"$size": {"$filter": {
+                              "input": {"$ifNull": ["$grading_details", []]},
+                              "cond": {"$lt": ["$$this.awarded", "$$this.points"]},
+                          }}},
+                          "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$created_at"}}}},
+        ], maxTimeMS=_tool_ms()))
+        if not rows:
+            return f"No submissions found for '{student}'."
+        return json.dumps(rows, ensure_ascii=False)
+    except Exception as e:
+        return f"Error getting student history: {str(e)}"
+
+# ---------- RESPONSE CACHE ----------
+def _data_version(user_id):
+    # While the cache bus is live its per-owner event count is the stamp: no query at all.
+    bus_version = BUS.version(user_id)
+    if bus_version is not None:
+        return ("bus",) + bus_version
+    # Otherwise: exams get updated_at bumped whenever their submissions are added or graded,
+    # so (count, latest updated_at) over exams + courses stamps everything the tools read.
+    try:
+        owner = ObjectId(user_id)
+    except Exception:
+        return None
+    stamp = []
+    for coll, owner_field, ts_field in (
+        (exams_collection, "created_by", "updated_at"),
+        (courses_collection, "user_id", "uploaded_at"),
+    ):
+        row = next(coll.aggregate([
+            {"$match": {owner_field: owner}},
+            {"$group": {"_id": None, "n": {"$sum": 1}, "last": {"$max": f"${ts_field}"}}},
+        ]), None) or {}
+        stamp.append((row.get("n", 0), row.get("last")))
+    return tuple(stamp)
+
+def _drop_owner_responses(ev):
+    # stale entries would be skipped by version anyway; this frees them straight away
+    if ev.get("owner") is not None:
+        invalidate_user(str(ev["owner"]))
+
+BUS.subscribe(("exams", "submissions", "courses"), _drop_owner_responses)
+
+def _remember(session_id, user_query, answer):
+    SESSION_MEMORY[session_id].append({"query": user_query, "response": answer})
+    SESSION_MEMORY[session_id] = SESSION_MEMORY[session_id][-10:]
+
+# ---------- TOOL DISPATCH ----------
+AGENT_MAX_STEPS = int(os.getenv("AGENT_MAX_STEPS", "4"))
+AGENT_TIME_BUDGET = float(os.getenv("AGENT_TIME_BUDGET", "25"))
+AGENT_TOOL_TIMEOUT = float(os.getenv("AGENT_TOOL_TIMEOUT", "10"))
+AGENT_MAX_PARALLEL_TOOLS = int(os.getenv("AGENT_MAX_PARALLEL_TOOLS", "4"))
+
+TOOL_POOL = ThreadPoolExecutor(max_workers=AGENT_MAX_PARALLEL_TOOLS * 2, thread_name_prefix="agent-tool")
+
+def _run_tool(tool_name, args, user_id):
+    if tool_name == "list_exams":
+        return tool_list_exams(user_id)
+    if tool_name == "get_exam":
+        exam_id = args.get("exam_id")
+        return tool_get_exam(exam_id, user_id) if exam_id else "Missing exam_id argument."
+    if tool_name == "list_submissions":
+        return tool_list_submissions(args.get("exam_id"), user_id)
+    if tool_name == "question_stats":
+        return tool_question_stats(user_id, args.get("exam_id"), args.get("question_id"))
+    if tool_name == "score_percentiles":
+        return tool_score_percentiles(user_id, args.get("exam_id"))
+    if tool_name == "student_history":
+        return tool_student_history(user_id, args.get("student", ""))
+    if tool_name == "search_rag":
+        query = args.get("query", "")
+        return tool_search_rag(query, user_id) if query else "Missing query argument."
+    return f"Unknown tool: {tool_name}"
+
+def _run_tool_until(deadline, tool_name, args, user_id):
+    _TOOL_CTX.deadline = deadline
+    try:
+        return _run_tool(tool_name, args, user_id)
+    finally:
+        _TOOL_CTX.deadline = None
+
+def _parse_tool_calls(text):
+    """Accepts {"tool": ..}, {"tools": [..]}, a JSON list of calls, or one call per line."""
+    calls = []
+    for c in structured_values(text):
+        if isinstance(c, dict) and isinstance(c.get("tools"), list):
+            c = c["tools"]
+        for call in (c if isinstance(c, list) else [c]):
+            if isinstance(call, dict) and call.get("tool"):
+                args = call.get("args")
+                calls.append({"tool": str(call["tool"]), "args": args if isinstance(args, dict) else {}})
+    return calls[:AGENT_MAX_PARALLEL_TOOLS]
+
+def _execute_tools(calls, user_id, deadline, trace, step):
+    """Runs independent tool calls concurrently; returns observations in call order."""
+    futures = []
+    for call in calls:
+        started = time.perf_counter()
+        tool_deadline = min(deadline, time.monotonic() + AGENT_TOOL_TIMEOUT)
+        futures.append((call, started, TOOL_POOL.submit(_run_tool_until, tool_deadline, call["tool"], call["args"], user_id)))
+
+    observations = []
+    for call, started, fut in futures:
+        remaining = max(0.1, min(AGENT_TOOL_TIMEOUT, deadline - time.monotonic()))
+        try:
+            obs = fut.result(timeout=remaining)
+            status = "ok"
+        except FutureTimeout:
+            obs, status = f"Tool {call['tool']} timed out.", "timeout"
+        except Exception as e:
+            obs, status = f"Error: {str(e)}", "error"
+        trace.append({
+            "step": step,
+            "tool": call["tool"],
+            "args": call["args"],
+            "status": status,
+            "ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+        observations.append(f"[{call['tool']}({json.dumps(call['args'], ensure_ascii=False)})] {obs}")
+    return observations
+
+class AgentOutOfTime(Exception):
+    pass
+
+def _groq_complete(messages, step, temperature, max_tokens, timeout=None):
+    """timeout: seconds left in the agent's budget; AgentOutOfTime when the call outlives it."""
+    try:
+        with observe_llm("groq", GROQ_MODEL) as call:
+            response = groq_client.chat.completions.create(
+                model=GROQ_MODEL,
+                messages=messages,
+                temperature=temperature,
+                max_tokens=max_tokens,
+                timeout=timeout,
+            )
+            call.usage(response.usage)
+        return response.choices[0].message.content.strip()
+    except APITimeoutError as e:
+        raise AgentOutOfTime(f"Groq call timed out (step {step})") from e
+    except Exception as e:
+        raise Exception(f"Groq error (step {step}): {str(e)}")
+
+def _out_of_time_answer(messages):
+    # no budget left for another model call: hand back what the tools returned
+    seen = [m["content"] for m in messages if m["role"] == "user" and m["content"].startswith("Observation:")]
+    if not seen:
+        return "Sorry, that took too long to answer. Please try again or ask a narrower question."
+    return "I ran out of time before summarising, but here is what I found:\n" + seen[-1][len("Observation:"):].strip()[:1500]
+
+def _format_direct(intent, observation):
+    # Deterministic rendering for router-dispatched tools (no LLM round-trip)
+    try:
+        rows = json.loads(observation)
+    except Exception:
+        return observation
+    if intent == "list_exams":
+        lines = [f"• {r['title']} (created {r['created_at'][:10]})" for r in rows]
+        return f"You have {len(rows)} exam(s):\n" + "\n".join(lines)
+    if intent == "list_submissions":
+        lines = [f"• {r['student']}: {r['score'] if r['score'] is not None else 'not graded'}" for r in rows]
+        return f"Latest submissions ({len(rows)}):\n" + "\n".join(lines)
+    return observation
+
 # ---------- ReAct AGENT ----------
-def run_react_agent(user_query, user_id, session_id):
+def run_react_agent(user_query, user_id, session_id, trace=None):
     # Ensure session exists in memory
     if session_id not in SESSION_MEMORY:
         SESSION_MEMORY[session_id] = []
     
     history = SESSION_MEMORY[session_id]
+    trace = trace if trace is not None else []
+
+    # Repeated / near-duplicate questions against unchanged data skip the LLM entirely
+    # (keyed by the chat history too: the LLM answer reads it, so a follow-up isn't another session's reply)
+    norm_query = normalize_query(user_query)
+    version = _data_version(user_id)
+    query_vec = EMBEDDING_MODEL.encode(norm_query) if version is not None else None
+    context, ents = context_key(history[-10:]), entities(user_query)
+    if query_vec is not None:
+        cached = lookup_response(user_id, norm_query, query_vec, version, context, ents)
+        if cached is not None:
+            trace.append({"step": 0, "tool": "cache", "status": "hit", "ms": 0.0})
+            _remember(session_id, user_query, cached)
+            return cached
+
+    # Trivially recognizable requests go straight to their tool
+    intent, confidence, source = classify_intent(norm_query, query_vec, EMBEDDING_MODEL.encode)
+    if intent:
+        started = time.perf_counter()
+        observation = _run_tool(intent, {}, user_id)
+        trace.append({"step": 0, "tool": intent, "args": {}, "status": f"routed:{source}",
+                      "confidence": round(confidence, 3), "ms": round((time.perf_counter() - started) * 1000, 1)})
+        final_answer = _format_direct(intent, observation)
+        _remember(session_id, user_query, final_answer)
+        if query_vec is not None:  # routed tools don't read the history: valid in any session
+            store_response(user_id, norm_query, query_vec, version, final_answer, None, ents)
+        return final_answer
 
     # Build chat history from last 10 interactions
     chat_history_lines = []
@@ -172,12 +486,18 @@ TOOL SPECS:
 - get_exam(exam_id: str): Returns exam details including title, answer key, pages count
 - list_submissions(exam_id: str = None): Returns [{{"id": str, "student": str, "score": float, "feedback": str}}]
 - search_rag(query: str): Searches uploaded course material for relevant context
+- question_stats(exam_id: str = None, question_id: str = None): Per-question attempts, misses, miss_rate and missed_by students
+- score_percentiles(exam_id: str = None): Score count/avg/min/max/stddev/passed and p10..p90 for an exam
+- student_history(student: str): A student's past scores and number of questions missed across your exams
+Prefer these analytics tools over list_submissions for counts, averages and "who missed" questions.
 
 RULES:
 1. First, think step by step (Thought).
-2. If you need data, call ONE tool in JSON format ONLY: {{"tool": "tool_name", "args": {{...}}}}
+2. If you need data, reply with JSON ONLY: {{"tools": [{{"tool": "tool_name", "args": {{...}}}}, ...]}}
+   List several tools in one step when they do not depend on each other (e.g. list_submissions for three exams);
+   they run in parallel. You will receive an Observation for each and may call more tools afterwards.
 3. Do NOT add any other text before or after the JSON.
-4. If no tool is needed and you can answer directly, do so clearly.
+4. When you have enough information, answer directly without JSON.
 5. When returning tool results, make them human-readable and concise.
 
 CHAT HISTORY:
@@ -189,72 +509,53 @@ CHAT HISTORY:
         {"role": "user", "content": user_query},
     ]
 
-    try:
-        response = groq_client.chat.completions.create(
-            model=GROQ_MODEL,
-            messages=messages,
-            temperature=0.0,
-            max_tokens=200,
-        )
-        first_response = response.choices[0].message.content.strip()
-    except Exception as e:
-        raise Exception(f"Groq error (step 1): {str(e)}")
-
-    # Try to extract tool call
-    tool_call = None
-    try:
-        json_match = re.search(r'\{.*\}', first_response, re.DOTALL)
-        if json_match:
-            tool_call = json.loads(json_match.group())
-    except Exception:
-        pass  # Not a valid tool call
-
+    deadline = time.monotonic() + AGENT_TIME_BUDGET
     final_answer = ""
-    if tool_call and isinstance(tool_call, dict) and "tool" in tool_call:
-        tool_name = tool_call["tool"]
-        args = tool_call.get("args", {})
-        observation = "Tool execution failed."
-
+    cacheable = True
+    used_tools = False
+
+    step = 0  # AGENT_MAX_STEPS=0 skips the loop and goes straight to the forced answer
+    for step in range(1, AGENT_MAX_STEPS + 1):
+        left = deadline - time.monotonic()
+        if left <= 0:
+            break
         try:
-            if tool_name == "list_exams":
-                observation = tool_list_exams(user_id)
-            elif tool_name == "get_exam":
-                exam_id = args.get("exam_id")
-                observation = tool_get_exam(exam_id) if exam_id else "Missing exam_id argument."
-            elif tool_name == "list_submissions":
-                exam_id = args.get("exam_id")
-                observation = tool_list_submissions(exam_id)
-            elif tool_name == "search_rag":
-                query = args.get("query", "")
-                observation = tool_search_rag(query, user_id) if query else "Missing query argument."
-            else:
-                observation = f"Unknown tool: {tool_name}"
-        except Exception as e:
-            observation = f"Error: {str(e)}"
-
-        messages.append({"role": "assistant", "content": first_response})
-        messages.append({"role": "user", "content": f"Observation: {observation}"})
-        messages.append({"role": "user", "content": "Now give the final answer in a clear, concise, human-readable format."})
-
+            reply = _groq_complete(messages, step, temperature=0.0, max_tokens=300, timeout=left)
+        except AgentOutOfTime:
+            break
+        calls = _parse_tool_calls(reply)
+        if not calls:
+            final_answer = reply
+            break
+
+        used_tools = True
+        observations = _execute_tools(calls, user_id, deadline, trace, step)
+        messages.append({"role": "assistant", "content": reply})
+        messages.append({"role": "user", "content": "Observation:\n" + "\n\n".join(observations)})
+
+        if time.monotonic() >= deadline:
+            break
+
+    if not final_answer:
+        # Budget exhausted (or last step used tools): force an answer from what we have, if time allows
+        left = deadline - time.monotonic()
         try:
-            response = groq_client.chat.completions.create(
-                model=GROQ_MODEL,
-                messages=messages,
-                temperature=0.3,
-                max_tokens=500,
-            )
-            final_answer = response.choices[0].message.content.strip()
-        except Exception as e:
-            raise Exception(f"Groq error (step 2): {str(e)}")
-
-    else:
-        final_answer = first_response
+            if left <= 0:
+                raise AgentOutOfTime("agent time budget exhausted")
+            messages.append({"role": "user", "content": "Now give the final answer in a clear, concise, human-readable format."})
+            final_answer = _groq_complete(messages, step + 1, temperature=0.3, max_tokens=500, timeout=left)
+        except AgentOutOfTime:
+            final_answer, cacheable = _out_of_time_answer(messages), False
+            used_tools = True  # not a "didn't understand" reply: skip the help text below
+
+    if not used_tools:
         unclear_phrases = [
             "don't know", "do not know", "not sure", "unclear", "not clear",
             "cannot answer", "can't answer", "no information", "not enough",
             "i am not", "i'm not", "unable to", "sorry", "apologies"
         ]
         if any(phrase in final_answer.lower() for phrase in unclear_phrases) or len(final_answer.split()) < 4:
+            cacheable = False
             final_answer = (
                 "I'm here to help! You can ask me things like:\n"
                 "• \"List my exams\"\n"
@@ -265,11 +566,9 @@ CHAT HISTORY:
             )
 
     # ✅ Store the new interaction and keep only last 10
-    SESSION_MEMORY[session_id].append({
-        "query": user_query,
-        "response": final_answer
-    })
-    SESSION_MEMORY[session_id] = SESSION_MEMORY[session_id][-10:]
+    _remember(session_id, user_query, final_answer)
+    if cacheable and query_vec is not None:
+        store_response(user_id, norm_query, query_vec, version, final_answer, context, ents)
 
     return final_answer
 
@@ -288,11 +587,12 @@ def agent():
     if not message:
         return jsonify({"error": "message is required"}), 400
 
+    trace = []
     try:
-        reply = run_react_agent(message, user["sub"], session_id)
-        return jsonify({"handled": True, "reply": reply})
+        reply = run_react_agent(message, user["sub"], session_id, trace=trace)
+        return jsonify({"handled": True, "reply": reply, "trace": trace})
     except Exception as e:
-        return jsonify({"handled": True, "reply": f"Agent error: {str(e)}"}), 500
+        return jsonify({"handled": True, "reply": f"Agent error: {str(e)}", "trace": trace}), 500
 
 @bp_ai.route("/upload-course", methods=["POST"])
 @cross_origin()
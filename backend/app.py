@@ -1,11 +1,13 @@
 # app.py — MAIN BACKEND (auth + exams) on port 5006
 import os
+import hashlib
 from datetime import datetime, timedelta
 from bson import ObjectId
 from flask import Flask, jsonify, request, g
 from flask_cors import CORS
 from pymongo import MongoClient, DESCENDING
 from dotenv import load_dotenv
+from metrics import init_metrics, MONGO_LISTENER
 
 load_dotenv()
 
@@ -15,7 +17,7 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 if not JWT_SECRET:
     raise RuntimeError("❌ Missing JWT_SECRET in .env")
 
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, event_listeners=[MONGO_LISTENER])
 db = client["exam_system"]
 exams = db["exams"]
 submissions = db["submissions"]
@@ -23,10 +25,11 @@ users = db["users"]
 
 users.create_index("email", unique=True)
 exams.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
-exams.create_index("created_by")
+exams.create_index([("created_by", 1), ("created_at", DESCENDING), ("_id", DESCENDING)])
 
 # ---------- APP / CORS ----------
 app = Flask(__name__)
+init_metrics(app, "app")
 
 # Import and register AI blueprint from ai_assistant.py
 from ai_assistant import bp_ai
@@ -58,6 +61,10 @@ def _add_cors_headers(resp):
 def _preflight(_any=None):
     return ("", 200)
 
+import data_access as dal
+from cache_bus import BUS, InvalidatingCache
+BUS.start()  # one watcher thread per process, feeding the dashboard and agent caches
+
 # ---------- AUTH ----------
 from auth import make_auth_blueprint
 auth_bp, require_auth, require_role = make_auth_blueprint(db, jwt_secret=JWT_SECRET)
@@ -71,13 +78,14 @@ def _as_oid(s):
         return None
 
 def _exam_summary(d: dict):
-    has_key = bool(d.get("answer_key")) and len(d["answer_key"]) > 0
+    # has_key / pages_count are written with the arrays (dal.summary_fields); older exams only have the arrays
+    has_key = d["has_key"] if "has_key" in d else bool(d.get("answer_key"))
     return {
         "_id": str(d["_id"]),
         "title": d.get("title") or "Untitled exam",
         "hasKey": has_key,
         "status": "published" if has_key else "draft",
-        "pagesCount": len(d.get("pages") or []),
+        "pagesCount": d["pages_count"] if "pages_count" in d else len(d.get("pages") or []),
         "submissionsCount": (d.get("stats") or {}).get("submissions", 0),
         "createdBy": str(d.get("created_by")) if d.get("created_by") else None,
         "createdAt": d.get("created_at").isoformat() + "Z" if d.get("created_at") else None,
@@ -100,37 +108,40 @@ def api_create_exam():
     if not owner_oid:
         return jsonify({"error": "invalid user id"}), 400
 
-    doc = {
-        "title": title,
-        "answer_key": answer_key,
-        "pages": pages,
-        "created_by": owner_oid,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-        "stats": {"submissions": 0},
-    }
-    ins = exams.insert_one(doc)
-    doc["_id"] = ins.inserted_id
+    doc = dal.insert_exam(title, answer_key, pages, owner_oid)
     return jsonify(_exam_summary(doc)), 201
 
+LIST_PROJECTION = {"title": 1, "has_key": 1, "pages_count": 1, "stats.submissions": 1,
+                   "created_by": 1, "created_at": 1}
+LIST_VERSION = "1"  # bump when _exam_summary's output changes, so cached listings aren't reused
+
+def _list_etag(user, version) -> str:
+    count, latest = version
+    scope_tag = "admin" if user.get("role") == "admin" else str(dal.owner_oid(user))
+    raw = f"{LIST_VERSION}|{scope_tag}|{count}|{latest.isoformat() if latest else '-'}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
 @app.get("/api/exams")
 @require_auth
 def api_list_exams():
-    proj = {"title": 1, "answer_key": 1, "pages": 1, "stats": 1, "created_by": 1, "created_at": 1}
-    if g.user.get("role") == "admin":
-        q = {}
+    try:
+        etag = _list_etag(g.user, dal.exams_version(g.user))
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 400
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)  # nothing fetched, nothing serialized
     else:
-        user_oid = _as_oid(g.user.get("sub"))
-        user_str = g.user.get("sub")
-        q = {
-            "$or": [
-                {"created_by": user_oid},
-                {"created_by": user_str},
-                {"created_by": {"$exists": False}},
-            ]
-        }
-    docs = list(exams.find(q, proj).sort([("created_at", -1), ("_id", -1)]))
-    return jsonify([_exam_summary(d) for d in docs]), 200
+        docs = list(dal.find_exams(g.user, LIST_PROJECTION))
+        legacy = [d["_id"] for d in docs if "has_key" not in d or "pages_count" not in d]
+        if legacy:  # exams saved before the summary fields (run migrate_exam_summary.py once)
+            full = {d["_id"]: d for d in dal.find_exams(g.user, {"answer_key": 1, "pages": 1}, {"_id": {"$in": legacy}})}
+            for d in docs:
+                if d["_id"] in full:
+                    d.update(full[d["_id"]])
+        resp = jsonify([_exam_summary(d) for d in docs])
+    resp.set_etag(etag)
+    resp.headers["Cache-Control"] = "private, no-cache"  # the browser revalidates every time with If-None-Match
+    return resp
 
 @app.get("/ListExams")
 @require_auth
@@ -143,36 +154,24 @@ def api_get_exam(eid):
     oid = _as_oid(eid)
     if not oid:
         return jsonify({"error": "invalid id"}), 400
-    doc = exams.find_one({"_id": oid}, {"title": 1, "created_by": 1})
+    try:
+        doc = dal.find_exam(g.user, oid, {"title": 1})
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 400
     if not doc:
         return jsonify({"error": "not found"}), 404
-    if g.user.get("role") != "admin":
-        owner_ok = (
-            doc.get("created_by") == _as_oid(g.user.get("sub"))
-            or str(doc.get("created_by") or "") == g.user.get("sub")
-            or doc.get("created_by") is None
-        )
-        if not owner_ok:
-            return jsonify({"error": "forbidden"}), 403
     return jsonify({"_id": str(doc["_id"]), "title": doc.get("title")}), 200
 
 # ---------- DASHBOARD ----------
+# Per-owner summaries, dropped by the cache bus on any exam/submission write of that owner
+_DASHBOARD = InvalidatingCache(BUS, ("exams", "submissions"), by="owner", maxsize=512)
+
 def _start_of_week(d: datetime) -> datetime:
     monday = d - timedelta(days=d.weekday())
     return monday.replace(hour=0, minute=0, second=0, microsecond=0)
 
-@app.get("/api/dashboard/summary")
-@require_auth
-def api_dashboard_summary():
-    exam_id = request.args.get("examId")
-    match = {}
-    if exam_id:
-        oid = _as_oid(exam_id)
-        if not oid:
-            return jsonify({"error": "invalid examId"}), 400
-        match["examId"] = oid
-
-    exams_count = exams.count_documents({})
+def _dashboard_summary(user, match, sow):
+    exams_count = dal.count_exams(user)
     subs_count = submissions.count_documents(match)
     corrected_count = submissions.count_documents({**match, "corrected": True})
     avg_grade = 0.0
@@ -207,7 +206,6 @@ def api_dashboard_summary():
         {"bucket": "16–20", "count": buckets["16"]},
     ]
 
-    sow = _start_of_week(datetime.utcnow())
     week_counts = {i: 0 for i in range(1, 8)}
     for row in submissions.aggregate([
         {"$match": {**match, "created_at": {"$gte": sow}}},
@@ -256,7 +254,7 @@ def api_dashboard_summary():
         sid = str(row["_id"]) if row["_id"] else "Student"
         top_students.append({"name": sid[:12], "grade": round(float(row["grade"]), 1)})
 
-    return jsonify({
+    return {
         "kpis": {
             "exams": exams_count,
             "submissions": subs_count,
@@ -269,7 +267,30 @@ def api_dashboard_summary():
         "submissionsOverTime": submissions_over_time,
         "timeSaved": time_saved,
         "topStudents": top_students,
-    }), 200
+    }
+
+
+@app.get("/api/dashboard/summary")
+@require_auth
+def api_dashboard_summary():
+    exam_id = request.args.get("examId")
+    try:
+        match = dal.scope(g.user)
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 400
+    if exam_id:
+        oid = _as_oid(exam_id)
+        if not oid:
+            return jsonify({"error": "invalid examId"}), 400
+        match["examId"] = oid
+
+    user, sow = g.user, _start_of_week(datetime.utcnow())
+    if user.get("role") == "admin":
+        return jsonify(_dashboard_summary(user, match, sow)), 200  # spans every owner: not cached
+    # the week is part of the key so submissionsOverTime rolls over without an event
+    body = _DASHBOARD.get_or_load(dal.owner_oid(user), (exam_id or "", sow.isoformat()),
+                                  lambda: _dashboard_summary(user, match, sow))
+    return jsonify(body), 200
 
 if __name__ == "__main__":
     port = int(os.getenv("PORT", "5006"))
@@ -1,26 +1,104 @@
 # auth.py — Email/Password Auth Only (No Google)
 import time
 import functools
+import hashlib
 import os
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from flask import Blueprint, request, jsonify, g
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import DuplicateKeyError, BulkWriteError
 from flask_cors import cross_origin
 import jwt
 import bcrypt
 
+log = logging.getLogger("auth")
+
 def _now():
     return datetime.utcnow()
 
-def _hash_pw(pw: str) -> str:
-    return bcrypt.hashpw(pw.encode("utf-8"), bcrypt.gensalt()).decode("utf-8")
+# ---------- Password hashing (bounded worker pool) ----------
+# bcrypt releases the GIL, so a small pool hashes in parallel while the
+# semaphore caps how many requests may queue for it; beyond that we shed load.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", str(os.cpu_count() or 2)))
+BCRYPT_MAX_PENDING = int(os.getenv("BCRYPT_MAX_PENDING", str(BCRYPT_WORKERS * 8)))
+BCRYPT_QUEUE_TIMEOUT = float(os.getenv("BCRYPT_QUEUE_TIMEOUT", "5"))
+BULK_HASH_WINDOW = max(1, BCRYPT_WORKERS // 2)  # import rows hashing at once; the rest of the pool stays free for logins
 
-def _check_pw(pw: str, hashed: str) -> bool:
+_HASH_POOL = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_HASH_SLOTS = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+class HashPoolBusy(RuntimeError):
+    pass
+
+def _offload(fn, *args):
+    if not _HASH_SLOTS.acquire(timeout=BCRYPT_QUEUE_TIMEOUT):
+        raise HashPoolBusy("password hashing pool is saturated")
+    try:
+        return _HASH_POOL.submit(fn, *args).result()
+    finally:
+        _HASH_SLOTS.release()
+
+def _hashpw_sync(pw: str, rounds: int) -> str:
+    return bcrypt.hashpw(pw.encode("utf-8"), bcrypt.gensalt(rounds=rounds)).decode("utf-8")
+
+def _checkpw_sync(pw: str, hashed: str) -> bool:
     try:
         return bcrypt.checkpw(pw.encode("utf-8"), hashed.encode("utf-8"))
     except Exception:
         return False
 
+def _hash_pw(pw: str) -> str:
+    return _offload(_hashpw_sync, pw, BCRYPT_ROUNDS)
+
+def _hash_many(pws: list) -> list:
+    """Hashes a batch BULK_HASH_WINDOW at a time, each taking a queue slot like _hash_pw."""
+    out = []
+    for i in range(0, len(pws), BULK_HASH_WINDOW):
+        futs = []
+        for pw in pws[i:i + BULK_HASH_WINDOW]:
+            if not _HASH_SLOTS.acquire(timeout=BCRYPT_QUEUE_TIMEOUT):
+                raise HashPoolBusy("password hashing pool is saturated")
+            f = _HASH_POOL.submit(_hashpw_sync, pw, BCRYPT_ROUNDS)
+            f.add_done_callback(lambda _f: _HASH_SLOTS.release())
+            futs.append(f)
+        out += [f.result() for f in futs]
+    return out
+
+def _check_pw(pw: str, hashed: str) -> bool:
+    return _offload(_checkpw_sync, pw, hashed)
+
+def _hash_cost(hashed: str) -> int:
+    # "$2b$12$<salt+hash>" -> 12
+    try:
+        return int(hashed.split("$")[2])
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+def _rehash_in_background(users, user_id, pw: str, old_hash: str):
+    """Upgrades a stored hash to BCRYPT_ROUNDS without delaying the login response.
+
+    Only when a queue slot is free right now: during a login burst the upgrade is
+    skipped (the next login retries it) rather than queueing ahead of interactive hashes.
+    """
+    if not _HASH_SLOTS.acquire(blocking=False):
+        return
+    def _job():
+        try:
+            new_hash = _hashpw_sync(pw, BCRYPT_ROUNDS)
+            users.update_one({"_id": user_id, "password_hash": old_hash}, {"$set": {"password_hash": new_hash}})
+        except Exception:
+            log.exception("background rehash failed for user %s", user_id)
+    try:
+        fut = _HASH_POOL.submit(_job)
+    except Exception:
+        _HASH_SLOTS.release()
+        raise
+    fut.add_done_callback(lambda _f: _HASH_SLOTS.release())
+
 def _issue_jwt(user: dict, jwt_secret: str, jwt_ttl_hrs: int) -> str:
     payload = {
         "sub": str(user["_id"]),
@@ -32,32 +110,75 @@ def _issue_jwt(user: dict, jwt_secret: str, jwt_ttl_hrs: int) -> str:
     }
     return jwt.encode(payload, jwt_secret, algorithm="HS256")
 
-def _decode_jwt(token: str, jwt_secret: str) -> dict:
-    return jwt.decode(token, jwt_secret, algorithms=["HS256"])
+# ---------- Verified-token cache (shared by every service) ----------
+JWT_CACHE_SIZE = int(os.getenv("JWT_CACHE_SIZE", "4096"))
 
-def _bearer():
-    h = request.headers.get("Authorization") or ""
-    return h.split(" ", 1)[1].strip() if h.lower().startswith("bearer ") else None
+_TOKEN_CACHE = OrderedDict()   # sha256(secret, token) -> claims
+_TOKEN_LOCK = threading.Lock()
+AUTH_STATS = {"hits": 0, "misses": 0, "failures": 0, "verify_seconds": 0.0}
 
+def _token_digest(token: str, jwt_secret: str) -> bytes:
+    return hashlib.sha256(jwt_secret.encode("utf-8") + b"\0" + token.encode("utf-8")).digest()
 
-def make_auth_blueprint(db, jwt_secret: str):
-    JWT_TTL_HRS = int(os.getenv("JWT_TTL_HRS", "24"))
+def decode_token(token: str, jwt_secret: str = None) -> dict:
+    """HS256 decode with a bounded LRU of already-verified tokens.
 
-    users = db["users"]
-    users.create_index("email", unique=True)
+    Raises the same jwt exceptions as jwt.decode; cached claims are only
+    served while their `exp` is still in the future.
+    """
+    jwt_secret = jwt_secret or os.getenv("JWT_SECRET")
+    if not jwt_secret:
+        raise jwt.InvalidTokenError("JWT_SECRET not configured")
+    key = _token_digest(token, jwt_secret)
+    with _TOKEN_LOCK:
+        claims = _TOKEN_CACHE.get(key)
+        if claims is not None:
+            if claims.get("exp", 0) > time.time():
+                _TOKEN_CACHE.move_to_end(key)
+                AUTH_STATS["hits"] += 1
+                return dict(claims)
+            del _TOKEN_CACHE[key]
 
-    bp = Blueprint("auth", __name__)
-    ALLOWED_ORIGINS = [os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")]
+    started = time.perf_counter()
+    try:
+        claims = jwt.decode(token, jwt_secret, algorithms=["HS256"])
+    except Exception:
+        with _TOKEN_LOCK:
+            AUTH_STATS["failures"] += 1
+            AUTH_STATS["verify_seconds"] += time.perf_counter() - started
+        raise
+    with _TOKEN_LOCK:
+        AUTH_STATS["misses"] += 1
+        AUTH_STATS["verify_seconds"] += time.perf_counter() - started
+        if "exp" in claims:
+            _TOKEN_CACHE[key] = claims
+            while len(_TOKEN_CACHE) > JWT_CACHE_SIZE:
+                _TOKEN_CACHE.popitem(last=False)
+    return dict(claims)
 
-    def _cors_args():
-        return dict(
-            origins=ALLOWED_ORIGINS,
-            supports_credentials=False,
-            methods=["GET", "POST", "OPTIONS"],
-            allow_headers=["Content-Type", "Authorization"],
-            max_age=86400,
-        )
+def auth_cache_stats() -> dict:
+    with _TOKEN_LOCK:
+        return {**AUTH_STATS, "size": len(_TOKEN_CACHE), "capacity": JWT_CACHE_SIZE}
+
+def _decode_jwt(token: str, jwt_secret: str) -> dict:
+    return decode_token(token, jwt_secret)
+
+def _bearer():
+    h = request.headers.get("Authorization") or ""
+    return h.split(" ", 1)[1].strip() if h.lower().startswith("bearer ") else None
 
+def current_user():
+    """Claims for the request's bearer token, or None when missing/invalid."""
+    tok = _bearer()
+    if not tok:
+        return None
+    try:
+        return decode_token(tok)
+    except Exception:
+        return None
+
+def make_guards(jwt_secret: str = None):
+    """Returns (require_auth, require_role) decorators bound to jwt_secret (env JWT_SECRET if None)."""
     def require_auth(fn):
         @functools.wraps(fn)
         def wrapper(*a, **kw):
@@ -65,7 +186,7 @@ def make_auth_blueprint(db, jwt_secret: str):
             if not tok:
                 return jsonify({"error": "missing auth token"}), 401
             try:
-                g.user = _decode_jwt(tok, jwt_secret)
+                g.user = decode_token(tok, jwt_secret)
             except Exception:
                 return jsonify({"error": "invalid/expired token"}), 401
             return fn(*a, **kw)
@@ -79,7 +200,7 @@ def make_auth_blueprint(db, jwt_secret: str):
                 if not tok:
                     return jsonify({"error": "missing auth token"}), 401
                 try:
-                    data = _decode_jwt(tok, jwt_secret)
+                    data = decode_token(tok, jwt_secret)
                 except Exception:
                     return jsonify({"error": "invalid/expired token"}), 401
                 if data.get("role") not in roles:
@@ -89,6 +210,60 @@ def make_auth_blueprint(db, jwt_secret: str):
             return wrapper
         return deco
 
+    return require_auth, require_role
+
+# Module-level guards for services that don't build the auth blueprint (corrector.py)
+require_auth, require_role = make_guards()
+
+
+def make_auth_blueprint(db, jwt_secret: str):
+    JWT_TTL_HRS = int(os.getenv("JWT_TTL_HRS", "24"))
+
+    BULK_IMPORT_MAX = int(os.getenv("BULK_IMPORT_MAX", "1000"))
+
+    users = db["users"]
+    settings = db["settings"]
+    users.create_index("email", unique=True)
+
+    # Bootstrap (first account may register without admin auth) is decided by
+    # single-document lookups, then remembered in-process once a user exists.
+    # The settings claim alone isn't cached: a first registration that fails
+    # after claiming releases it (_release_bootstrap) so the next one can retry.
+    bootstrap = {"closed": False}
+
+    def _bootstrap_closed() -> bool:
+        if bootstrap["closed"]:
+            return True
+        if users.find_one({}, {"_id": 1}):
+            bootstrap["closed"] = True
+            return True
+        return settings.find_one({"_id": "bootstrap"}, {"_id": 1}) is not None
+
+    def _claim_bootstrap() -> bool:
+        # Atomic: only one concurrent first registration can insert this document
+        try:
+            settings.insert_one({"_id": "bootstrap", "closed_at": _now()})
+        except DuplicateKeyError:
+            return False
+        return True
+
+    def _release_bootstrap():
+        settings.delete_one({"_id": "bootstrap"})
+
+    bp = Blueprint("auth", __name__)
+    ALLOWED_ORIGINS = [os.getenv("FRONTEND_ORIGIN", "http://localhost:3000")]
+
+    def _cors_args():
+        return dict(
+            origins=ALLOWED_ORIGINS,
+            supports_credentials=False,
+            methods=["GET", "POST", "OPTIONS"],
+            allow_headers=["Content-Type", "Authorization"],
+            max_age=86400,
+        )
+
+    require_auth, require_role = make_guards(jwt_secret)
+
     @bp.route("/api/auth/register", methods=["POST", "OPTIONS"])
     @cross_origin(**_cors_args())
     def register():
@@ -104,7 +279,8 @@ def make_auth_blueprint(db, jwt_secret: str):
         if not email or not password:
             return jsonify({"error": "email and password required"}), 400
 
-        if users.count_documents({}) > 0:
+        claimed = not _bootstrap_closed() and _claim_bootstrap()
+        if not claimed:
             tok = _bearer()
             if not tok:
                 return jsonify({"error": "admin auth required"}), 401
@@ -118,14 +294,22 @@ def make_auth_blueprint(db, jwt_secret: str):
         doc = {
             "email": email,
             "name": name,
-            "password_hash": _hash_pw(password),
             "role": role if role in ("admin", "instructor", "student") else "instructor",
             "created_at": _now(),
         }
         try:
+            doc["password_hash"] = _hash_pw(password)
             ins = users.insert_one(doc)
-        except DuplicateKeyError:
-            return jsonify({"error": "email already exists"}), 409
+        except Exception as e:
+            if claimed:  # no user was created: leave registration open for the next attempt
+                _release_bootstrap()
+            if isinstance(e, HashPoolBusy):
+                return jsonify({"error": "server busy, retry shortly"}), 503
+            if isinstance(e, DuplicateKeyError):
+                return jsonify({"error": "email already exists"}), 409
+            raise
+        if claimed:
+            bootstrap["closed"] = True
 
         doc["_id"] = ins.inserted_id
         token = _issue_jwt(doc, jwt_secret, JWT_TTL_HRS)
@@ -147,8 +331,14 @@ def make_auth_blueprint(db, jwt_secret: str):
             return jsonify({"error": "email and password required"}), 400
 
         u = users.find_one({"email": email})
-        if not u or not _check_pw(password, u.get("password_hash", "")):
+        try:
+            ok = bool(u) and _check_pw(password, u.get("password_hash", ""))
+        except HashPoolBusy:
+            return jsonify({"error": "server busy, retry shortly"}), 503
+        if not ok:
             return jsonify({"error": "invalid credentials"}), 401
+        if _hash_cost(u.get("password_hash", "")) != BCRYPT_ROUNDS:
+            _rehash_in_background(users, u["_id"], password, u["password_hash"])
 
         token = _issue_jwt(u, jwt_secret, JWT_TTL_HRS)
         return jsonify({
@@ -169,4 +359,62 @@ def make_auth_blueprint(db, jwt_secret: str):
             return ("", 204)
         return jsonify({"user": g.user}), 200
 
+    @bp.route("/api/admin/users/import", methods=["POST", "OPTIONS"])
+    @cross_origin(**_cors_args())
+    @require_role("admin")
+    def bulk_import_users():
+        if request.method == "OPTIONS":
+            return ("", 204)
+
+        j = request.get_json(silent=True) or {}
+        rows = j.get("users")
+        if not isinstance(rows, list) or not rows:
+            return jsonify({"error": "users must be a non-empty list"}), 400
+        if len(rows) > BULK_IMPORT_MAX:
+            return jsonify({"error": f"at most {BULK_IMPORT_MAX} users per import"}), 400
+
+        accepted, rejected, seen = [], [], set()
+        for i, r in enumerate(rows):
+            r = r if isinstance(r, dict) else {}
+            email = (r.get("email") or "").strip().lower()
+            password = r.get("password") or ""
+            if not email or not password:
+                rejected.append({"index": i, "email": email, "error": "email and password required"})
+                continue
+            if email in seen:
+                rejected.append({"index": i, "email": email, "error": "duplicate in request"})
+                continue
+            seen.add(email)
+            role = (r.get("role") or "instructor").strip()
+            accepted.append({
+                "email": email,
+                "name": (r.get("name") or "").strip() or email.split("@")[0],
+                "role": role if role in ("admin", "instructor", "student") else "instructor",
+                "_pw": password,
+                "_index": i,
+            })
+
+        # Hash on the bcrypt pool through the same queue slots as logins, a window at a time
+        try:
+            hashes = _hash_many([d.pop("_pw") for d in accepted])
+        except HashPoolBusy:
+            return jsonify({"error": "server busy, retry shortly"}), 503
+        now = _now()
+        row_index = [d.pop("_index") for d in accepted]
+        docs = [{**d, "password_hash": h, "created_at": now} for d, h in zip(accepted, hashes)]
+
+        inserted = len(docs)
+        if docs:
+            try:
+                users.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                for err in e.details.get("writeErrors", []):
+                    d = docs[err["index"]]
+                    rejected.append({"index": row_index[err["index"]], "email": d["email"], "error": "email already exists" if err.get("code") == 11000 else err.get("errmsg")})
+                inserted = e.details.get("nInserted", 0)
+        if inserted:
+            bootstrap["closed"] = True
+
+        return jsonify({"inserted": inserted, "rejected": rejected}), 201 if inserted else 400
+
     return bp, require_auth, require_role
\ No newline at end of file
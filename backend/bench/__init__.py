@@ -0,0 +1,22 @@
+# bench — load and micro benchmarks for the CorrectMeAI backend
+#
+# Scripts are run as modules from backend/, e.g. `python -m bench.login_load --help`.
+
+from percentiles import nearest_rank
+
+def percentile(sorted_vals, p):
+    return nearest_rank(sorted_vals, p, default=0.0)
+
+def summarize(latencies_s, wall_s, errors=0):
+    """p50/p95/p99 in ms plus throughput for a list of per-request latencies in seconds."""
+    lat = sorted(x * 1000 for x in latencies_s)
+    return {
+        "requests": len(lat) + errors,
+        "errors": errors,
+        "wall_s": round(wall_s, 3),
+        "throughput_rps": round(len(lat) / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": round(percentile(lat, 50), 1),
+        "p95_ms": round(percentile(lat, 95), 1),
+        "p99_ms": round(percentile(lat, 99), 1),
+        "max_ms": round(lat[-1], 1) if lat else 0.0,
+    }
@@ -0,0 +1,94 @@
+# bench/cache_bus.py — invalidation latency and correctness of the cache bus against a live mongod
+#
+#   python -m bench.cache_bus --uri "mongodb://localhost:27017/?replicaSet=rs0"   # change stream
+#   python -m bench.cache_bus --uri mongodb://localhost:27017 --mode poll
+#   python -m bench.cache_bus --rounds 50 --json
+#
+# Writes into a scratch database (--db, default exam_system_cachebus, dropped at the
+# end), so it is safe to point at a development server. Each round caches a value for
+# a throwaway owner, updates one of that owner's exams (or courses) from a second
+# client, as another service would, and measures how long until the cached entry is
+# gone. A round fails when the entry is still cached after --timeout seconds, or when
+# an entry for an untouched owner was dropped (the bus invalidating too widely).
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime
+
+def run(uri, db_name, mode, rounds, timeout):
+    os.environ["MONGO_URI"] = uri
+    os.environ["CACHE_BUS"] = mode
+    from bson import ObjectId
+    from pymongo import MongoClient
+    import mongo
+    mongo.db = mongo.client[db_name]
+    import cache_bus
+
+    bus = cache_bus.CacheBus(mongo.db)
+    cache = cache_bus.InvalidatingCache(bus, ("exams", "courses"), by="owner", maxsize=64)
+    bus.start()
+    t0 = time.monotonic()
+    while not bus.live:
+        if time.monotonic() - t0 > timeout:
+            return {"error": f"bus not live after {timeout}s (mode={mode})"}
+        time.sleep(0.05)
+
+    writer = MongoClient(uri)[db_name]
+    rows = []
+    try:
+        for i in range(rounds):
+            owner, bystander = ObjectId(), ObjectId()
+            coll = "exams" if i % 2 == 0 else "courses"
+            owner_field, ts = cache_bus.WATCHED[coll], cache_bus.POLL_TS[coll]
+            doc_id = writer[coll].insert_one({owner_field: owner, ts: datetime.utcnow()}).inserted_id
+            # let the insert's event pass (polling re-reads CACHE_POLL_SKEW_S back, so wait that out too)
+            time.sleep(cache_bus.CACHE_POLL_S + cache_bus.CACHE_POLL_SKEW_S + 0.2 if bus.mode == "poll" else 0.2)
+            cache.get_or_load(owner, "v", lambda: "cached")
+            cache.get_or_load(bystander, "v", lambda: "cached")
+
+            started = time.monotonic()
+            writer[coll].update_one({"_id": doc_id}, {"$set": {ts: datetime.utcnow(), "n": i}})
+            gone = None
+            while time.monotonic() - started < timeout:
+                if (str(owner), "v") not in cache._data:
+                    gone = time.monotonic() - started
+                    break
+                time.sleep(0.005)
+            rows.append({"round": i, "collection": coll, "latency_ms": round(gone * 1000, 1) if gone is not None else None,
+                         "bystander_kept": (str(bystander), "v") in cache._data})
+    finally:
+        writer.client.drop_database(db_name)
+
+    lat = [r["latency_ms"] for r in rows if r["latency_ms"] is not None]
+    return {
+        "mode": bus.mode,
+        "rounds": len(rows),
+        "missed": sum(1 for r in rows if r["latency_ms"] is None),
+        "over_invalidated": sum(1 for r in rows if not r["bystander_kept"]),
+        "p50_ms": round(statistics.median(lat), 1) if lat else None,
+        "max_ms": max(lat) if lat else None,
+        "rows": rows,
+    }
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Cache bus invalidation latency against a live MongoDB")
+    ap.add_argument("--uri", default=os.getenv("MONGO_URI", "mongodb://localhost:27017"))
+    ap.add_argument("--db", default="exam_system_cachebus")
+    ap.add_argument("--mode", default="auto", choices=["auto", "stream", "poll"])
+    ap.add_argument("--rounds", type=int, default=20)
+    ap.add_argument("--timeout", type=float, default=10.0)
+    ap.add_argument("--json", action="store_true")
+    a = ap.parse_args()
+    report = run(a.uri, a.db, a.mode, a.rounds, a.timeout)
+    if a.json:
+        print(json.dumps(report, indent=2))
+    else:
+        if "error" in report:
+            print(report["error"])
+            sys.exit(1)
+        print(f"mode={report['mode']} rounds={report['rounds']} missed={report['missed']} "
+              f"over_invalidated={report['over_invalidated']} p50={report['p50_ms']}ms max={report['max_ms']}ms")
+    sys.exit(1 if report.get("error") or report.get("missed") or report.get("over_invalidated") else 0)
@@ -0,0 +1,103 @@
+# bench/grade_batch.py — LLM tokens and wall time per graded submission, single vs. batched
+#
+#   python -m bench.grade_batch                              # in-process mock LLM
+#   python -m bench.grade_batch --sizes 1,4,8,16 --students 48 --drop-rate 0.1
+#   OPENROUTER_API_KEY=... python -m bench.grade_batch --endpoint https://openrouter.ai/api/v1/chat/completions \
+#       --model qwen/qwen2-72b-instruct --students 16
+#
+# Uses the same prompts and parsers as student.py (llm_grading.py). Size 1 is the
+# one-call-per-submission path; larger sizes pack that many submissions behind the
+# shared answer-key prefix, regrading ids the reply drops one by one. The "hybrid"
+# row pools the free-text leaves left after rule grading.
+import argparse
+import json
+import os
+import time
+import requests
+
+from grading import free_text_leaves
+from llm_grading import single_prompt, parse_single, batch_prompt, split_batch, free_text_prompt, parse_free_text
+from bench.synth import make_answer_key, make_cohort
+
+def _chat(ctx, prompt):
+    headers = {"Content-Type": "application/json"}
+    if ctx["api_key"]:
+        headers["Authorization"] = f"Bearer {ctx['api_key']}"
+    r = requests.post(ctx["endpoint"], headers=headers, timeout=120, json={
+        "model": ctx["model"], "messages": [{"role": "user", "content": prompt}], "temperature": 0.2,
+    })
+    r.raise_for_status()
+    body = r.json()
+    usage = body.get("usage") or {}
+    ctx["prompt_tokens"] += int(usage.get("prompt_tokens") or 0)
+    ctx["completion_tokens"] += int(usage.get("completion_tokens") or 0)
+    ctx["calls"] += 1
+    return body["choices"][0]["message"]["content"]
+
+def _row(ctx, n, wall, **extra):
+    return {
+        "calls": ctx["calls"],
+        "prompt_tokens_per_sub": round(ctx["prompt_tokens"] / n, 1),
+        "completion_tokens_per_sub": round(ctx["completion_tokens"] / n, 1),
+        "wall_s_per_sub": round(wall / n, 4),
+        **extra,
+    }
+
+def run_size(ctx, key, cohort, size):
+    ctx.update(prompt_tokens=0, completion_tokens=0, calls=0)
+    answers = {f"sub-{i:04d}": s["answers_structured"] for i, s in enumerate(cohort)}
+    ids = list(answers)
+    graded, fallbacks = 0, 0
+    t0 = time.perf_counter()
+    for i in range(0, len(ids), size):
+        chunk = ids[i:i + size]
+        if size == 1:
+            missing = chunk
+        else:
+            results, missing = split_batch(_chat(ctx, batch_prompt(key, {sid: answers[sid] for sid in chunk})), chunk)
+            graded += len(results)
+            fallbacks += len(missing)
+        for sid in missing:
+            parse_single(_chat(ctx, single_prompt(key, answers[sid])))
+            graded += 1
+    return _row(ctx, len(ids), time.perf_counter() - t0, graded=graded, fallbacks=fallbacks)
+
+def run_hybrid(ctx, key, cohort, max_leaves):
+    ctx.update(prompt_tokens=0, completion_tokens=0, calls=0)
+    t0 = time.perf_counter()
+    pending, total = {}, 0
+    for s in cohort:
+        p = free_text_leaves(key, s["answers_structured"])
+        total += len(p)
+        pending.update(p)
+    items = list(pending.items())
+    for i in range(0, len(items), max_leaves):
+        prompt, short_ids = free_text_prompt(dict(items[i:i + max_leaves]))
+        parse_free_text(_chat(ctx, prompt), short_ids)
+    return _row(ctx, len(cohort), time.perf_counter() - t0, leaves=total, unique_leaves=len(pending))
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Single vs. batched LLM grading cost")
+    ap.add_argument("--sizes", default="1,4,8,16", help="submissions per call")
+    ap.add_argument("--students", type=int, default=32)
+    ap.add_argument("--questions", type=int, default=20)
+    ap.add_argument("--leaves", type=int, default=80, help="free-text leaves per call for the hybrid row")
+    ap.add_argument("--endpoint", help="OpenAI-compatible chat completions URL (default: in-process mock)")
+    ap.add_argument("--model", default=os.getenv("OPENROUTER_MODEL", "qwen/qwen2-72b-instruct"))
+    ap.add_argument("--latency-ms", type=float, default=300.0, help="mock latency")
+    ap.add_argument("--drop-rate", type=float, default=0.0, help="mock: share of ids missing from batch replies")
+    ap.add_argument("--port", type=int, default=8098)
+    a = ap.parse_args()
+
+    endpoint = a.endpoint
+    if not endpoint:
+        from bench.mock_llm import serve
+        serve(a.port, a.latency_ms, sigma=0.2, seed=1, background=True, batch_drop_rate=a.drop_rate)
+        endpoint = f"http://127.0.0.1:{a.port}/v1/chat/completions"
+    ctx = {"endpoint": endpoint, "model": a.model, "api_key": os.getenv("OPENROUTER_API_KEY") if a.endpoint else None}
+
+    key = make_answer_key(a.questions, seed=11)
+    cohort = make_cohort(key, a.students, seed=5)
+    out = {f"batch={n}": run_size(ctx, key, cohort, n) for n in (int(x) for x in a.sizes.split(","))}
+    out["hybrid"] = run_hybrid(ctx, key, cohort, a.leaves)
+    print(json.dumps(out, indent=2))
@@ -0,0 +1,141 @@
+# bench/grading_micro.py — micro-benchmarks for the deterministic grading engine
+#
+#   python -m bench.grading_micro                       # print results
+#   python -m bench.grading_micro --save base.json      # keep a baseline
+#   python -m bench.grading_micro --compare base.json   # show ratios vs. the baseline
+#
+# Times the hot helpers in grading.py per call and grades whole synthetic submissions
+# (every qtype x subpart layout x student answer shape). A tracemalloc pass
+# reports peak traced memory and retained blocks for grading one cohort. The
+# "class" section checks grade_class against the per-submission loop and times both.
+import argparse
+import json
+import random
+import time
+import tracemalloc
+
+from grading import (
+    _norm, _similar, _num, _as_list, _grade_leaf, _expand_to_subparts, _pick_student_for_sub,
+    _grade_against_key, grade_class,
+)
+from bench.synth import QTYPES, LAYOUTS, make_answer_key, make_cohort, make_item
+
+def _per_call_us(fn, min_time=0.2):
+    """Mean microseconds per call, auto-scaling the loop count to run at least min_time."""
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time:
+            return round(dt / n * 1e6, 3)
+        n *= 2 if dt > min_time / 10 else 10
+
+def bench_helpers():
+    out = {
+        "_norm": _per_call_us(lambda: _norm("  The Industrial   Revolution ")),
+        "_similar": _per_call_us(lambda: _similar("the industrial revolution", "the industrial revolutions")),
+        "_num": _per_call_us(lambda: _num("approx -12.5e1 units")),
+        "_as_list[str]": _per_call_us(lambda: _as_list("a, b; c | d")),
+        "_as_list[dict]": _per_call_us(lambda: _as_list({"b": 2, "a": 1, "3": 3, "10": 4})),
+        "_pick_student_for_sub[str]": _per_call_us(lambda: _pick_student_for_sub("a, b, c", 2, "c")),
+        "_pick_student_for_sub[dict]": _per_call_us(lambda: _pick_student_for_sub({"a": "x", "b": "y"}, 1, "b")),
+        "_pick_student_for_sub[list]": _per_call_us(lambda: _pick_student_for_sub(["x", "y", "z"], 2, "c")),
+    }
+    leaves = {
+        "text": ("photosynthesis", "photosynthesiss"),
+        "short_text": (["paris", "Paris, France"], "paris"),
+        "mcq_single": ("b", "B"),
+        "true_false": ("true", "True"),
+        "numeric": ({"value": 3.14, "tolerance": 0.01}, "3.141"),
+        "regex": (r"[a-z]+\d{2}", "abc12"),
+    }
+    for qtype in QTYPES:
+        exp, stud = leaves[qtype]
+        out[f"_grade_leaf[{qtype}]"] = _per_call_us(lambda: _grade_leaf(qtype, exp, stud, 1.0, allow_near=True))
+    rng = random.Random(0)
+    for layout in LAYOUTS:
+        item = make_item("Q1", "mcq_single", layout, rng)
+        out[f"_expand_to_subparts[{layout}]"] = _per_call_us(lambda: _expand_to_subparts(item))
+    return out
+
+def bench_submissions(sizes=(10, 40, 100), shapes=("string", "list", "dict"), students=20):
+    out = {}
+    for n in sizes:
+        key = make_answer_key(n, seed=n)
+        for shape in shapes:
+            cohort = [s["answers_structured"] for s in make_cohort(key, students, seed=n, shapes=(shape,))]
+            t0 = time.perf_counter()
+            rounds = 0
+            while time.perf_counter() - t0 < 0.5:
+                for stud in cohort:
+                    _grade_against_key(key, stud)
+                rounds += 1
+            per_sub_us = (time.perf_counter() - t0) / (rounds * len(cohort)) * 1e6
+
+            tracemalloc.start()
+            snap0 = tracemalloc.take_snapshot()
+            for stud in cohort:
+                _grade_against_key(key, stud)
+            snap1 = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            stats = snap1.compare_to(snap0, "filename")
+            out[f"grade_submission[q={n},shape={shape}]"] = {
+                "us_per_submission": round(per_sub_us, 1),
+                "peak_kib": round(peak / 1024, 1),
+                "retained_blocks": sum(max(0, s.count_diff) for s in stats),
+            }
+    return out
+
+def bench_class(cohorts=(30, 300, 3000), n_questions=40):
+    """Per-submission loop vs. grade_class on the same cohort (outputs must be identical)."""
+    out = {}
+    for label, qtypes in (("objective", ("mcq_single", "true_false", "numeric")), ("mixed", QTYPES)):
+        key = make_answer_key(n_questions, seed=7, qtypes=qtypes)
+        for n in cohorts:
+            cohort = [s["answers_structured"] for s in make_cohort(key, n, seed=n)]
+            t0 = time.perf_counter()
+            loop = [_grade_against_key(key, stud) for stud in cohort]
+            t_loop = time.perf_counter() - t0
+            t0 = time.perf_counter()
+            cols = grade_class(key, cohort)
+            t_class = time.perf_counter() - t0
+            if loop != cols:
+                raise AssertionError(f"grade_class diverges from _grade_against_key ({label}, n={n})")
+            out[f"grade_class[{label},n={n}]"] = {
+                "us_per_submission": round(t_class / n * 1e6, 1),
+                "loop_us_per_submission": round(t_loop / n * 1e6, 1),
+                "speedup": round(t_loop / t_class, 2) if t_class else None,
+            }
+    return out
+
+def _compare(current, baseline):
+    rows = []
+    for section in ("helpers", "submissions", "class"):
+        for name, cur in current[section].items():
+            base = baseline.get(section, {}).get(name)
+            if base is None:
+                continue
+            c = cur["us_per_submission"] if isinstance(cur, dict) else cur
+            b = base["us_per_submission"] if isinstance(base, dict) else base
+            rows.append(f"{name:55s} {b:>10.2f} -> {c:>10.2f} us  x{c / b if b else float('nan'):.2f}")
+    return "\n".join(rows)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Micro-benchmarks for grading.py")
+    ap.add_argument("--save", help="write results to this JSON file")
+    ap.add_argument("--compare", help="baseline JSON produced by --save")
+    ap.add_argument("--students", type=int, default=20)
+    a = ap.parse_args()
+    results = {"helpers": bench_helpers(), "submissions": bench_submissions(students=a.students),
+               "class": bench_class()}
+    if a.save:
+        with open(a.save, "w") as f:
+            json.dump(results, f, indent=2)
+    if a.compare:
+        with open(a.compare) as f:
+            print(_compare(results, json.load(f)))
+    else:
+        print(json.dumps(results, indent=2))
@@ -0,0 +1,118 @@
+# bench/load.py — drive the HTTP pipeline at fixed concurrency and report latency percentiles
+#
+#   python -m bench.mock_llm --latency-ms 800 &           # fake Together/OpenRouter/Groq
+#   python -m bench.seed --graded                          # writes bench_seed.json
+#   python -m bench.load --scenarios extract,submit,regrade,dashboard,agent \
+#       --concurrency 20 --requests 200
+#
+# Service URLs default to the ports each app listens on (student 5001, corrector 5005,
+# app 5006); override with --student-url / --corrector-url / --app-url.
+import argparse
+import json
+import os
+import random
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from bench import summarize
+from bench.synth import make_answer_key, make_student_answers
+
+DEFAULT_IMAGE = os.path.join(os.path.dirname(__file__), "..", "..", "correctmeai", "images", "st1.jpg")
+AGENT_MESSAGES = (
+    "list my exams",
+    "show the latest submissions",
+    "which students missed question 3?",
+    "what is the median score on my latest exam?",
+    "compare average scores across my last three exams",
+)
+
+def _scenario(name, ctx):
+    """Returns fire(session, rng) issuing one request for the scenario."""
+    auth = {"Authorization": f"Bearer {ctx['seed']['token']}"}
+    exam_ids, sub_ids = ctx["seed"]["exam_ids"], ctx["seed"]["submission_ids"]
+    questions = ctx["seed"].get("questions", 40)
+    # seed files written before exam_key_seeds existed were all seeded with --seed 0
+    keys = {exam_id: make_answer_key(questions, seed=key_seed) for exam_id, key_seed
+            in zip(exam_ids, ctx["seed"].get("exam_key_seeds") or range(len(exam_ids)))}
+
+    if name == "extract":
+        with open(ctx["image"], "rb") as f:
+            image = f.read()
+        return lambda s, rng: s.post(f"{ctx['student_url']}/extract-answers",
+                                files={"files": ("page.jpg", image, "image/jpeg")}, timeout=120)
+    if name == "submit":
+        # names stay unique across runs (submission identity); the answers and exam are seeded,
+        # and the answers are drawn from the chosen exam's own key
+        def submit(s, rng):
+            exam_id = rng.choice(exam_ids)
+            return s.post(f"{ctx['student_url']}/api/submit-student", headers=auth, timeout=60, json={
+                "student_name": f"Load {uuid.uuid4().hex[:8]}",
+                "exam_id": exam_id,
+                "answers_structured": make_student_answers(keys[exam_id], seed=rng.randrange(1 << 30)),
+            })
+        return submit
+    if name == "regrade":
+        return lambda s, rng: s.post(f"{ctx['corrector_url']}/api/submissions/{rng.choice(sub_ids)}/regrade",
+                                headers=auth, timeout=60)
+    if name == "score_llm":
+        return lambda s, rng: s.post(f"{ctx['student_url']}/api/score-submission/{rng.choice(sub_ids)}",
+                                headers=auth, timeout=120)
+    if name == "dashboard":
+        return lambda s, rng: s.get(f"{ctx['app_url']}/api/dashboard/summary", headers=auth, timeout=60)
+    if name == "exams":
+        return lambda s, rng: s.get(f"{ctx['app_url']}/api/exams", headers=auth, timeout=60)
+    if name == "agent":
+        return lambda s, rng: s.post(f"{ctx['app_url']}/ai/agent", headers=auth, timeout=120, json={
+            "message": rng.choice(AGENT_MESSAGES), "session_id": f"bench-{uuid.uuid4().hex[:6]}",
+        })
+    raise ValueError(f"unknown scenario {name}")
+
+def run_scenario(name, ctx, concurrency, total, seed=0):
+    fire = _scenario(name, ctx)
+    local = threading.local()  # requests.Session isn't thread-safe: one per worker thread
+    # request i draws from its own generator, so a run replays the same requests whatever the thread interleaving
+    base = (zlib.crc32(name.encode("utf-8")) << 32) ^ seed
+    statuses, latencies = {}, []
+
+    def one(i):
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        rng = random.Random(base * 1_000_003 + i)
+        t0 = time.perf_counter()
+        try:
+            code = fire(local.session, rng).status_code
+        except requests.RequestException:
+            code = "conn_error"
+        return code, time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for code, dt in pool.map(one, range(total)):
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+            if isinstance(code, int) and code < 400:
+                latencies.append(dt)
+    out = summarize(latencies, time.perf_counter() - t0, errors=total - len(latencies))
+    out.update({"scenario": name, "concurrency": concurrency, "seed": seed, "statuses": statuses})
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Load-test the grading pipeline")
+    ap.add_argument("--scenarios", default="extract,submit,regrade,dashboard,agent")
+    ap.add_argument("--concurrency", type=int, default=10)
+    ap.add_argument("--requests", type=int, default=100)
+    ap.add_argument("--seed", type=int, default=0, help="same seed, same requests (exams, submissions, answers)")
+    ap.add_argument("--seed-file", default="bench_seed.json")
+    ap.add_argument("--image", default=DEFAULT_IMAGE)
+    ap.add_argument("--student-url", default="http://localhost:5001")
+    ap.add_argument("--corrector-url", default="http://localhost:5005")
+    ap.add_argument("--app-url", default="http://localhost:5006")
+    a = ap.parse_args()
+    with open(a.seed_file) as f:
+        ctx = {"seed": json.load(f), "image": a.image, "student_url": a.student_url.rstrip("/"),
+               "corrector_url": a.corrector_url.rstrip("/"), "app_url": a.app_url.rstrip("/")}
+    results = [run_scenario(s.strip(), ctx, a.concurrency, a.requests, a.seed) for s in a.scenarios.split(",") if s.strip()]
+    print(json.dumps(results, indent=2))
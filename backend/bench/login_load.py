@@ -0,0 +1,56 @@
+# bench/login_load.py — concurrent load against /api/auth/login
+#
+#   python -m bench.login_load --url http://localhost:5006 --email a@b.c --password secret \
+#       --concurrency 30 --requests 300
+#
+# Simulates the start-of-class burst: N clients logging in at once. Compare runs
+# with different BCRYPT_ROUNDS / BCRYPT_WORKERS on the server.
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import requests
+
+from bench import summarize
+
+_LOCAL = threading.local()
+
+def _session():
+    # requests.Session isn't thread-safe: one per worker thread, reused across its requests
+    if not hasattr(_LOCAL, "session"):
+        _LOCAL.session = requests.Session()
+    return _LOCAL.session
+
+def _one(url, email, password):
+    t0 = time.perf_counter()
+    r = _session().post(f"{url}/api/auth/login", json={"email": email, "password": password}, timeout=60)
+    return r.status_code, time.perf_counter() - t0
+
+def run(url, email, password, concurrency, total):
+    latencies, statuses = [], {}
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futs = [pool.submit(_one, url, email, password) for i in range(total)]
+        for f in futs:
+            try:
+                code, dt = f.result()
+            except requests.RequestException:
+                code, dt = "conn_error", None
+            statuses[str(code)] = statuses.get(str(code), 0) + 1
+            if code == 200:
+                latencies.append(dt)
+    wall = time.perf_counter() - t0
+    out = summarize(latencies, wall, errors=total - len(latencies))
+    out.update({"concurrency": concurrency, "statuses": statuses})
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Load-test /api/auth/login")
+    ap.add_argument("--url", default="http://localhost:5006")
+    ap.add_argument("--email", required=True)
+    ap.add_argument("--password", required=True)
+    ap.add_argument("--concurrency", type=int, default=30)
+    ap.add_argument("--requests", type=int, default=300)
+    args = ap.parse_args()
+    print(json.dumps(run(args.url, args.email, args.password, args.concurrency, args.requests), indent=2))
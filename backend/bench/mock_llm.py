@@ -0,0 +1,153 @@
+# bench/mock_llm.py — local OpenAI-compatible chat-completions server for load tests
+#
+#   python -m bench.mock_llm --port 8099 --latency-ms 800 --sigma 0.4 --error-rate 0.01
+#
+# Point the services at it:
+#   TOGETHER_ENDPOINT=http://localhost:8099/v1/chat/completions
+#   OPENROUTER_ENDPOINT=http://localhost:8099/v1/chat/completions
+#   GROQ_BASE_URL=http://localhost:8099          (Groq SDK calls /openai/v1/chat/completions)
+#
+# Latency is lognormal around --latency-ms (sigma 0 = fixed). Replies are canned
+# JSON picked from the prompt, so every pipeline stage parses them like real output.
+import argparse
+import json
+import math
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_grading import BATCH_MARKER
+
+CONFIG = {"latency_ms": 800.0, "sigma": 0.4, "error_rate": 0.0, "seed": 0, "batch_drop_rate": 0.0}
+_RNG = random.Random(0)
+_RNG_LOCK = threading.Lock()
+STATS = {"requests": 0, "errors": 0}
+
+def _text_of(messages):
+    parts = []
+    for m in messages or []:
+        c = m.get("content")
+        if isinstance(c, list):
+            parts += [p.get("text", "") for p in c if isinstance(p, dict)]
+        else:
+            parts.append(str(c or ""))
+    return "\n".join(parts)
+
+def _json_after(text, marker):
+    try:
+        return json.JSONDecoder().raw_decode(text, text.index(marker) + len(marker))[0]
+    except ValueError:
+        return None
+
+def canned_reply(messages) -> str:
+    text = _text_of(messages)
+    last = str((messages or [{}])[-1].get("content") or "")
+    if BATCH_MARKER in text:
+        results = {}
+        with _RNG_LOCK:
+            for sid in _json_after(text, BATCH_MARKER) or {}:
+                if _RNG.random() >= CONFIG["batch_drop_rate"]:  # simulate ids the model leaves out
+                    results[sid] = {"score": round(_RNG.uniform(6, 19) * 4) / 4, "feedback": "Mock feedback."}
+        return json.dumps({"results": results})
+    if "Grade each student answer against its expected answer" in text:
+        with _RNG_LOCK:
+            grades = [{"id": it["id"], "awarded": _RNG.choice((0, 0.25, 0.5, 1)) * float(it.get("max_points") or 1)}
+                      for it in _json_after(text, "Answers:\n") or []]
+        return json.dumps({"grades": grades, "feedback": "Mock free-text feedback."})
+    if "extracts the full text from scanned exam sheets" in text:
+        return ("I. LANGUAGE\n\n1. Choose the correct answer:\n   a) went\n   b) go\n   c) gone\n   d) going\n\n"
+                "2. Fill in the blank: The sun ______ in the east.\n\n3. True or false: Water boils at 90°C.\n")
+    if "extract the student's NAME" in text or ("answers_structured" in text and "image" in text):
+        with _RNG_LOCK:
+            answers = {f"Q{i}": _RNG.choice("abcd") for i in range(1, 21)}
+        return json.dumps({"student_name": "Bench Student", "student_number": "20250001", "answers_structured": answers})
+    if "Grade out of 20" in text or ('"score"' in text and "feedback" in text):
+        with _RNG_LOCK:
+            score = round(_RNG.uniform(6, 19) * 4) / 4
+        return json.dumps({"score": score, "feedback": "Mock feedback: review questions 3 and 7."})
+    if "TOOL SPECS" in text:
+        if last.startswith("Observation") or "final answer" in last:
+            return "Here is a summary of the requested data from your exams."
+        return json.dumps({"tools": [{"tool": "list_exams", "args": {}}]})
+    return "OK"
+
+def _sleep_latency():
+    base = CONFIG["latency_ms"] / 1000.0
+    if CONFIG["sigma"] > 0:
+        with _RNG_LOCK:
+            base *= math.exp(_RNG.gauss(0, CONFIG["sigma"]))
+    time.sleep(max(0.0, base))
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def _send(self, code, obj):
+        body = json.dumps(obj).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == "/stats":
+            return self._send(200, {**STATS, **CONFIG})
+        self._send(404, {"error": "not found"})
+
+    def do_POST(self):
+        if not self.path.endswith("/chat/completions"):
+            return self._send(404, {"error": "not found"})
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            req = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "bad json"})
+
+        with _RNG_LOCK:
+            STATS["requests"] += 1
+            n = STATS["requests"]
+        _sleep_latency()
+        with _RNG_LOCK:
+            fail = _RNG.random() < CONFIG["error_rate"]
+            STATS["errors"] += int(fail)
+        if fail:
+            return self._send(429, {"error": {"message": "mock rate limit", "type": "rate_limit"}})
+
+        content = canned_reply(req.get("messages"))
+        prompt_tokens = max(1, len(_text_of(req.get("messages"))) // 4)
+        completion_tokens = max(1, len(content) // 4)
+        self._send(200, {
+            "id": f"mock-{n}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": req.get("model", "mock"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+def serve(port=8099, latency_ms=800.0, sigma=0.4, error_rate=0.0, seed=0, background=False, batch_drop_rate=0.0):
+    CONFIG.update(latency_ms=latency_ms, sigma=sigma, error_rate=error_rate, seed=seed, batch_drop_rate=batch_drop_rate)
+    _RNG.seed(seed)
+    server = ThreadingHTTPServer(("127.0.0.1", port), _Handler)
+    server.daemon_threads = True
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+    print(f"mock LLM on http://127.0.0.1:{port} (latency {latency_ms}ms, sigma {sigma}, errors {error_rate})")
+    server.serve_forever()
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Mock OpenAI-compatible LLM server")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency-ms", type=float, default=800.0)
+    ap.add_argument("--sigma", type=float, default=0.4, help="lognormal spread; 0 = fixed latency")
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--batch-drop-rate", type=float, default=0.0, help="share of ids omitted from batch replies")
+    a = ap.parse_args()
+    serve(a.port, a.latency_ms, a.sigma, a.error_rate, a.seed, batch_drop_rate=a.batch_drop_rate)
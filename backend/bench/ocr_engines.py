@@ -0,0 +1,122 @@
+# bench/ocr_engines.py — local Tesseract vs. the remote vision model on the sample pages
+#
+#   python -m bench.ocr_engines                                    # ../correctmeai/images, both engines
+#   python -m bench.ocr_engines --engines local --truth path/to/txt
+#   python -m bench.ocr_engines --json
+#
+# Every image is read by each engine with the /extract prompt (llama.py). Rows give
+# seconds per page and the word error rate against a reference: <image stem>.txt in
+# --truth when present, otherwise the remote engine's text (so the local WER is
+# "how far from what the model would have produced"). Text is compared as lower-case
+# word sequences with markdown and punctuation stripped. The remote engine needs
+# TOGETHER_API_KEY; the local one needs pytesseract and the tesseract binary.
+import argparse
+import json
+import os
+import re
+import time
+
+from ocr_engines import RemoteVisionEngine, TesseractEngine
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "correctmeai", "images")
+SYSTEM = (
+    "You are a helpful assistant that extracts the full text from scanned exam sheets. "
+    "Reconstruct the layout of the exam as clearly and structurally as possible. "
+    "Preserve blanks (______). For multiple choice questions (MCQs), show the options in list format."
+)
+INSTRUCTION = "Please extract the full text from this exam paper image."
+
+def words(text):
+    return re.findall(r"[^\W_]+(?:'[^\W_]+)?", (text or "").lower())
+
+def wer(ref, hyp):
+    """Word error rate: word-level edit distance over the reference length."""
+    r, h = words(ref), words(hyp)
+    if not r:
+        return 0.0 if not h else 1.0
+    prev = list(range(len(h) + 1))
+    for i, rw in enumerate(r, 1):
+        cur = [i] + [0] * len(h)
+        for j, hw in enumerate(h, 1):
+            cur[j] = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (rw != hw))
+        prev = cur
+    return prev[-1] / len(r)
+
+def make_engines(names):
+    out = {}
+    if "remote" in names:
+        out["remote"] = RemoteVisionEngine(
+            os.getenv("TOGETHER_ENDPOINT", "https://api.together.xyz/v1/chat/completions"),
+            os.getenv("TOGETHER_API_KEY"),
+            os.getenv("MODEL_NAME", "meta-llama/Llama-4-Scout-17B-16E-Instruct"),
+        )
+    if "local" in names:
+        out["local"] = TesseractEngine()
+    return out
+
+def run(image_dir, engine_names, truth_dir=None):
+    engines = make_engines(engine_names)
+    rows, texts = [], {}
+    images = sorted(f for f in os.listdir(image_dir) if f.lower().endswith((".jpg", ".jpeg", ".png")))
+    for fn in images:
+        with open(os.path.join(image_dir, fn), "rb") as f:
+            data = f.read()
+        for name, eng in engines.items():
+            if not eng.available():
+                continue
+            t0 = time.perf_counter()
+            try:
+                text, _ = eng.read(data, SYSTEM, INSTRUCTION, 2000)
+                err = None
+            except Exception as e:  # a failed page is a row, not the end of the run
+                text, err = "", str(e)
+            texts[(fn, name)] = text
+            rows.append({"image": fn, "engine": name, "seconds": round(time.perf_counter() - t0, 3),
+                         "words": len(words(text)), "error": err})
+    for r in rows:
+        ref, source = None, None
+        stem = os.path.splitext(r["image"])[0]
+        if truth_dir and os.path.exists(os.path.join(truth_dir, stem + ".txt")):
+            with open(os.path.join(truth_dir, stem + ".txt"), encoding="utf-8") as f:
+                ref, source = f.read(), "truth"
+        elif r["engine"] != "remote" and texts.get((r["image"], "remote")):
+            ref, source = texts[(r["image"], "remote")], "remote"
+        r["wer"] = round(wer(ref, texts[(r["image"], r["engine"])]), 3) if ref is not None else None
+        r["reference"] = source
+    return rows, {name: eng.available() for name, eng in engines.items()}
+
+def summarize(rows):
+    out = {}
+    for name in sorted({r["engine"] for r in rows}):
+        ok = [r for r in rows if r["engine"] == name and not r["error"]]
+        secs = sum(r["seconds"] for r in ok)
+        scored = [r["wer"] for r in ok if r["wer"] is not None]
+        out[name] = {
+            "pages": len(ok),
+            "failed": sum(1 for r in rows if r["engine"] == name and r["error"]),
+            "s_per_page": round(secs / len(ok), 3) if ok else None,
+            "pages_per_min": round(60 * len(ok) / secs, 1) if secs else None,
+            "mean_wer": round(sum(scored) / len(scored), 3) if scored else None,
+        }
+    return out
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Local vs. remote OCR throughput and accuracy")
+    ap.add_argument("--images", default=DEFAULT_DIR)
+    ap.add_argument("--engines", default="remote,local")
+    ap.add_argument("--truth", default=None, help="directory of <image stem>.txt reference transcripts")
+    ap.add_argument("--json", action="store_true")
+    a = ap.parse_args()
+    rows, available = run(a.images, a.engines.split(","), a.truth)
+    summary = summarize(rows)
+    if a.json:
+        print(json.dumps({"available": available, "rows": rows, "summary": summary}, indent=2))
+    else:
+        print("engines available: " + ", ".join(f"{k}={v}" for k, v in available.items()))
+        print(f"{'image':14s} {'engine':7s} {'seconds':>8s} {'words':>6s} {'wer':>6s} {'ref':>6s}")
+        for r in rows:
+            wer_s = f"{r['wer']:.3f}" if r["wer"] is not None else "-"
+            print(f"{r['image']:14s} {r['engine']:7s} {r['seconds']:>8.2f} {r['words']:>6d} {wer_s:>6s} "
+                  f"{r['reference'] or '-':>6s}" + (f"  error: {r['error']}" if r["error"] else ""))
+        for name, s in summary.items():
+            print(f"{name}: {s}")
@@ -0,0 +1,76 @@
+# bench/page_tiles.py — template registration and tile sizes for page_layout.py (no network)
+#
+#   python -m bench.page_tiles                               # ../correctmeai/images
+#   python -m bench.page_tiles --images path/to/scans --json
+#
+# Each image is used as its own key page: a template is built from it, then the
+# image is re-"scanned" (rotated, scaled, shifted onto a white sheet, re-encoded)
+# and cropped against the template. Rows report the registration correlation,
+# whether tiling was accepted (corr >= LAYOUT_REGISTER_MIN_CORR), tile count and
+# bytes sent versus the full page, and CPU time for template build and crop.
+import argparse
+import io
+import json
+import os
+import time
+
+from PIL import Image
+
+from page_layout import build_template, crop_regions, REGISTER_MIN_CORR
+
+DEFAULT_DIR = os.path.join(os.path.dirname(__file__), "..", "..", "correctmeai", "images")
+PERTURBATIONS = [  # (name, degrees, scale, dx, dy) — dx/dy as fractions of the page
+    ("identity", 0.0, 1.0, 0.0, 0.0),
+    ("shift", 0.0, 1.0, 0.02, 0.04),
+    ("scale_shift", 0.0, 0.95, 0.02, 0.03),
+    ("rotate_1deg", 1.0, 0.95, 0.02, 0.03),
+]
+
+def rescan(data: bytes, deg, scale, dx, dy) -> bytes:
+    img = Image.open(io.BytesIO(data)).convert("L")
+    w, h = img.size
+    moved = img.rotate(deg, fillcolor=255).resize((int(w * scale), int(h * scale)))
+    sheet = Image.new("L", (w, h), 255)
+    sheet.paste(moved, (int(w * dx), int(h * dy)))
+    buf = io.BytesIO()
+    sheet.save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+def run(image_dir):
+    rows = []
+    for fn in sorted(os.listdir(image_dir)):
+        if not fn.lower().endswith((".jpg", ".jpeg", ".png")):
+            continue
+        with open(os.path.join(image_dir, fn), "rb") as f:
+            key = f.read()
+        t0 = time.perf_counter()
+        layout = build_template(key)
+        build_ms = (time.perf_counter() - t0) * 1e3
+        for name, *p in PERTURBATIONS:
+            scan = rescan(key, *p)
+            t0 = time.perf_counter()
+            tiles, corr = crop_regions(scan, layout)
+            rows.append({
+                "image": fn, "case": name, "regions": len(layout["regions"]), "corr": round(corr, 3),
+                "tiled": bool(tiles), "tiles": len(tiles or []),
+                "page_kb": round(len(scan) / 1024, 1),
+                "tile_kb": round(sum(len(t["jpeg"]) for t in tiles or []) / 1024, 1),
+                "build_ms": round(build_ms, 1), "crop_ms": round((time.perf_counter() - t0) * 1e3, 1),
+            })
+    return rows
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Registration and tiling for page_layout.py")
+    ap.add_argument("--images", default=DEFAULT_DIR)
+    ap.add_argument("--json", action="store_true")
+    a = ap.parse_args()
+    rows = run(a.images)
+    if a.json:
+        print(json.dumps(rows, indent=2))
+    else:
+        print(f"min corr for tiling: {REGISTER_MIN_CORR}")
+        print(f"{'image':14s} {'case':12s} {'reg':>4s} {'corr':>6s} {'tiled':>6s} {'tiles':>6s} "
+              f"{'page_kb':>8s} {'tile_kb':>8s} {'build_ms':>9s} {'crop_ms':>8s}")
+        for r in rows:
+            print(f"{r['image']:14s} {r['case']:12s} {r['regions']:>4d} {r['corr']:>6.3f} {str(r['tiled']):>6s} "
+                  f"{r['tiles']:>6d} {r['page_kb']:>8.1f} {r['tile_kb']:>8.1f} {r['build_ms']:>9.1f} {r['crop_ms']:>8.1f}")
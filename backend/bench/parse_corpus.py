@@ -0,0 +1,127 @@
+# bench/parse_corpus.py — malformed model-reply corpus for structured_output.py
+#
+#   python -m bench.parse_corpus            # table + exit status 1 on any regression
+#   python -m bench.parse_corpus --json
+#
+# Each case is a reply shape seen from the grading / OCR / agent prompts. The
+# legacy column is the regex extraction the services used before
+# (`\{.*\}` greedy match + json.loads); the new column is structured_output.extract.
+# Every case is also fed to extract_stream in random chunk sizes and must give
+# the same value as the one-shot parse.
+import argparse
+import json
+import random
+import re
+import sys
+import time
+
+from structured_output import extract, extract_stream, values, StructuredOutputError
+from llm_grading import GRADE, BATCH_GRADE, FREE_TEXT
+
+_G = {"score": 14.5, "feedback": "Good work on Q1-Q3."}
+_LONG_FEEDBACK = "Review " + ", ".join(f"Q{i} {{part {i}}}" for i in range(1, 200))
+
+# (name, reply, schema, expected value or None when the reply is unrecoverable)
+CORPUS = [
+    ("clean", json.dumps(_G), GRADE, _G),
+    ("code_fence", f"```json\n{json.dumps(_G)}\n```", GRADE, _G),
+    ("prose_around", f"Here is the grade:\n{json.dumps(_G)}\nLet me know if you need more.", GRADE, _G),
+    ("trailing_brace_in_prose", f"{json.dumps(_G)}\nNote: use {{}} for empty answers.", GRADE, _G),
+    ("leading_braces_in_prose", "Answers in {curly} braces were ignored. " + json.dumps(_G), GRADE, _G),
+    ("two_objects", json.dumps(_G) + "\n" + json.dumps({"score": 3, "feedback": "x"}), GRADE, _G),
+    ("braces_in_string", '{"score": 12, "feedback": "Write sets as {1, 2} and } alone"}', GRADE,
+     {"score": 12, "feedback": "Write sets as {1, 2} and } alone"}),
+    ("escaped_quotes", r'{"score": 9, "feedback": "He said \"{no}\" twice"}', GRADE,
+     {"score": 9, "feedback": 'He said "{no}" twice'}),
+    ("trailing_comma", '{"score": 11, "feedback": "ok",}', GRADE, {"score": 11, "feedback": "ok"}),
+    ("single_quotes", "{'score': 11, 'feedback': 'ok'}", GRADE, {"score": 11, "feedback": "ok"}),
+    ("smart_quotes", "{“score”: 11, “feedback”: “ok”}", GRADE, {"score": 11, "feedback": "ok"}),
+    ("python_literals", '{"score": 7, "feedback": "partial", "late": False, "extra": None}', GRADE,
+     {"score": 7, "feedback": "partial", "late": False, "extra": None}),
+    ("truncated", '{"score": 16, "feedback": "Strong answers overall, but Q4', GRADE,
+     {"score": 16, "feedback": "Strong answers overall, but Q4"}),
+    ("schema_second_value", '{"note": "draft"}\n' + json.dumps(_G), GRADE, _G),
+    ("long_feedback", json.dumps({"score": 10, "feedback": _LONG_FEEDBACK}) + " }", GRADE,
+     {"score": 10, "feedback": _LONG_FEEDBACK}),
+    ("batch_nested", 'Results:\n{"results": {"s1": {"score": 12, "feedback": "a"}, "s2": {"score": 8, "feedback": "b {c}"}}}',
+     BATCH_GRADE, {"results": {"s1": {"score": 12, "feedback": "a"}, "s2": {"score": 8, "feedback": "b {c}"}}}),
+    ("free_text_list", '```\n{"grades": [{"id": "L1", "awarded": 0.5}, {"id": "L2", "awarded": 1}], "feedback": "ok"}\n```',
+     FREE_TEXT, {"grades": [{"id": "L1", "awarded": 0.5}, {"id": "L2", "awarded": 1}], "feedback": "ok"}),
+    ("tool_call_lines", '{"tool": "list_exams", "args": {}}\n{"tool": "get_exam", "args": {"exam_id": "x"}}', None,
+     {"tool": "list_exams", "args": {}}),
+    ("tool_list", 'Calling tools: [{"tool": "a", "args": {}}, {"tool": "b", "args": {"q": "]"}}]', None,
+     [{"tool": "a", "args": {}}, {"tool": "b", "args": {"q": "]"}}]),
+    ("score_out_of_range", '{"score": 45, "feedback": "?"}', GRADE, None),
+    ("no_json", "I cannot grade this submission.", GRADE, None),
+]
+
+def legacy_extract(text):
+    """The pre-structured_output extraction: fenced block, else greedy first-{ to last-}."""
+    m = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL | re.IGNORECASE)
+    if m:
+        return json.loads(m.group(1))
+    m = re.search(r"\{.*\}", text, re.DOTALL)
+    if not m:
+        raise ValueError("no JSON object found")
+    return json.loads(m.group(0))
+
+def _try(fn, *args):
+    try:
+        return fn(*args)
+    except (ValueError, StructuredOutputError):
+        return None
+
+def _per_call_us(fn, min_time=0.05):
+    n, t0 = 0, time.perf_counter()
+    while time.perf_counter() - t0 < min_time:
+        fn()
+        n += 1
+    return (time.perf_counter() - t0) / n * 1e6
+
+def _chunks(text, rng):
+    i = 0
+    while i < len(text):
+        n = rng.randint(1, 12)
+        yield text[i:i + n]
+        i += n
+
+def run(seed=0):
+    rng = random.Random(seed)
+    rows, failures = [], []
+    for name, reply, schema, expected in CORPUS:
+        new = _try(extract, reply, schema)
+        old = _try(legacy_extract, reply)
+        streamed = [_try(extract_stream, _chunks(reply, rng), schema) for _ in range(5)]
+        ok = new == expected
+        if not ok or any(v != new for v in streamed):
+            failures.append(name)
+        rows.append({
+            "case": name,
+            "legacy_ok": old == expected,
+            "new_ok": ok,
+            "stream_ok": all(v == new for v in streamed),
+            "legacy_us": round(_per_call_us(lambda: _try(legacy_extract, reply)), 1),
+            "new_us": round(_per_call_us(lambda: _try(extract, reply, schema)), 1),
+        })
+    big = "x" * 50_000 + "{" + json.dumps(_G)  # stray brace before a long prose block
+    rows.append({"case": "scan_50k_prose", "legacy_ok": None, "new_ok": values(big) == [_G], "stream_ok": None,
+                 "legacy_us": round(_per_call_us(lambda: _try(legacy_extract, big)), 1),
+                 "new_us": round(_per_call_us(lambda: values(big)), 1)})
+    return rows, failures
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Malformed-reply corpus for structured_output.py")
+    ap.add_argument("--json", action="store_true")
+    ap.add_argument("--seed", type=int, default=0)
+    a = ap.parse_args()
+    rows, failures = run(a.seed)
+    if a.json:
+        print(json.dumps({"rows": rows, "failures": failures}, indent=2))
+    else:
+        print(f"{'case':28s} {'legacy':>7s} {'new':>5s} {'stream':>7s} {'legacy_us':>10s} {'new_us':>8s}")
+        for r in rows:
+            print(f"{r['case']:28s} {str(r['legacy_ok']):>7s} {str(r['new_ok']):>5s} {str(r['stream_ok']):>7s} "
+                  f"{r['legacy_us']:>10.1f} {r['new_us']:>8.1f}")
+        print(f"legacy {sum(bool(r['legacy_ok']) for r in rows)}/{len(CORPUS)}, "
+              f"new {sum(bool(r['new_ok']) for r in rows[:len(CORPUS)])}/{len(CORPUS)}")
+    sys.exit(1 if failures else 0)
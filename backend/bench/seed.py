@@ -0,0 +1,114 @@
+# bench/seed.py — seed MongoDB with a bench instructor, exams and submissions
+#
+#   MONGO_URI=mongodb://localhost:27017 JWT_SECRET=... \
+#       python -m bench.seed --exams 10 --students 120 --questions 40 --graded --out bench_seed.json
+#   python -m bench.seed --purge
+#
+# Uses the same `exam_system` database as the services, so point MONGO_URI at a
+# throwaway mongod. Every document carries `bench: true` for --purge.
+import argparse
+import json
+import os
+import random
+import time
+from datetime import datetime, timedelta
+import bcrypt
+import jwt
+from bson import ObjectId
+from dotenv import load_dotenv
+from pymongo import MongoClient
+
+from bench.synth import make_answer_key, make_cohort
+
+BENCH_EMAIL = "bench-instructor@example.com"
+
+def _db():
+    load_dotenv()
+    return MongoClient(os.getenv("MONGO_URI", "mongodb://localhost:27017"))["exam_system"]
+
+def purge(db):
+    return {name: db[name].delete_many({"bench": True}).deleted_count for name in ("users", "exams", "submissions")}
+
+def seed(db, n_exams, n_students, n_questions, graded, seed_value=0):
+    rng = random.Random(seed_value)
+    purge(db)
+    user = {
+        "_id": ObjectId(),
+        "email": BENCH_EMAIL,
+        "name": "Bench Instructor",
+        "role": "instructor",
+        "password_hash": bcrypt.hashpw(b"bench-password", bcrypt.gensalt(rounds=10)).decode("utf-8"),
+        "created_at": datetime.utcnow(),
+        "bench": True,
+    }
+    db["users"].insert_one(user)
+
+    grade = None
+    if graded:
+        from grading import _grade_against_key
+        grade = _grade_against_key
+
+    now = datetime.utcnow()
+    exam_ids, key_seeds, submission_ids = [], [], []
+    for e in range(n_exams):
+        key_seeds.append(seed_value + e)
+        key = make_answer_key(n_questions, seed=key_seeds[-1])
+        created = now - timedelta(days=(n_exams - e) * 3)
+        exam = {
+            "title": f"Bench exam {e + 1}",
+            "answer_key": key,
+            "pages": [f"page-{p}" for p in range(3)],
+            "created_by": user["_id"],
+            "created_at": created,
+            "updated_at": created,
+            "stats": {"submissions": n_students},
+            "bench": True,
+        }
+        exam_id = db["exams"].insert_one(exam).inserted_id
+        exam_ids.append(str(exam_id))
+
+        docs = []
+        for i, s in enumerate(make_cohort(key, n_students, seed=rng.randrange(1 << 30))):
+            doc = {
+                **s,
+                "student_id": s["student_name"],
+                "exam_id": exam_id,
+                "created_by": user["_id"],
+                "score": None,
+                "feedback": None,
+                "created_at": created + timedelta(minutes=i),
+                "bench": True,
+            }
+            if grade:
+                score, feedback, details, raw, max_points = grade(key, s["answers_structured"])
+                doc.update(score=score, feedback=feedback, grading_details=details,
+                           score_raw=round(raw, 3), max_points=round(max_points, 3))
+            docs.append(doc)
+        submission_ids += [str(x) for x in db["submissions"].insert_many(docs).inserted_ids]
+
+    token = jwt.encode({
+        "sub": str(user["_id"]), "email": BENCH_EMAIL, "name": user["name"], "role": "instructor",
+        "iat": int(time.time()), "exp": int(time.time()) + 24 * 3600,
+    }, os.environ["JWT_SECRET"], algorithm="HS256")
+    # exam_key_seeds[i] regenerates exam_ids[i]'s answer key (bench.synth.make_answer_key)
+    return {"token": token, "user_id": str(user["_id"]), "exam_ids": exam_ids, "exam_key_seeds": key_seeds,
+            "submission_ids": submission_ids, "questions": n_questions}
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Seed synthetic exams/submissions for load tests")
+    ap.add_argument("--exams", type=int, default=10)
+    ap.add_argument("--students", type=int, default=120)
+    ap.add_argument("--questions", type=int, default=40)
+    ap.add_argument("--graded", action="store_true", help="pre-grade with the deterministic grader")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--out", default="bench_seed.json")
+    ap.add_argument("--purge", action="store_true", help="only delete previously seeded documents")
+    a = ap.parse_args()
+    db = _db()
+    if a.purge:
+        print(json.dumps(purge(db)))
+    else:
+        info = seed(db, a.exams, a.students, a.questions, a.graded, a.seed)
+        with open(a.out, "w") as f:
+            json.dump(info, f)
+        print(f"seeded {len(info['exam_ids'])} exams / {len(info['submission_ids'])} submissions -> {a.out}")
@@ -0,0 +1,104 @@
+# bench/synth.py — deterministic synthetic answer keys and student answers
+#
+# Covers every qtype the grader knows (text, short_text, mcq_single, true_false,
+# numeric, regex) and every subpart layout _expand_to_subparts accepts.
+import random
+
+QTYPES = ("text", "short_text", "mcq_single", "true_false", "numeric", "regex")
+LAYOUTS = ("single", "list", "list_of_dicts", "subparts")
+
+_WORDS = ("photosynthesis", "mitochondria", "equation", "present perfect", "carbon dioxide",
+          "the industrial revolution", "osmosis", "paris", "velocity", "a noun phrase")
+
+def _expected_for(qtype, rng, bare=False):
+    if qtype in ("text", "short_text"):
+        return rng.choice(_WORDS)
+    if qtype == "mcq_single":
+        return rng.choice("abcd")
+    if qtype == "true_false":
+        return rng.choice(("true", "false"))
+    if qtype == "numeric":
+        v = round(rng.uniform(-100, 100), 2)
+        if bare:  # inside a plain expected_answer list a dict would be read as a subpart spec
+            return v
+        if rng.random() < 0.3:
+            return {"values": [v, round(v * 2, 2)], "tolerance": 0.05}
+        return {"value": v, "tolerance": 0.01}
+    return r"[a-z]+\d{2}"  # regex
+
+def _answer_for(qtype, expected, correct, rng):
+    if qtype == "numeric":
+        if not isinstance(expected, dict):
+            expected = {"value": expected}
+        v = expected.get("value", (expected.get("values") or [0])[0])
+        return str(v if correct else round(v + 7.5, 2))
+    if qtype == "regex":
+        return "abc12" if correct else "12abc"
+    if qtype == "mcq_single":
+        return expected if correct else rng.choice([c for c in "abcd" if c != expected])
+    if qtype == "true_false":
+        return expected if correct else ("false" if expected == "true" else "true")
+    if not correct:
+        return rng.choice(_WORDS[::-1])
+    # near-misses exercise the SequenceMatcher path
+    return expected if rng.random() < 0.8 else expected + "s"
+
+def make_item(qid, qtype, layout, rng):
+    if layout == "single":
+        return {"question_id": qid, "type": qtype, "expected_answer": _expected_for(qtype, rng)}
+    n = rng.choice((2, 3, 4))
+    if layout == "list":
+        return {"question_id": qid, "type": qtype, "expected_answer": [_expected_for(qtype, rng, bare=True) for _ in range(n)]}
+    if layout == "list_of_dicts":
+        return {"question_id": qid, "type": qtype, "expected_answer": [
+            {"type": t, "expected": _expected_for(t, rng), "points": rng.choice((0.25, 0.5, 1.0))}
+            for t in (rng.choice(QTYPES) for _ in range(n))
+        ]}
+    return {"question_id": qid, "type": qtype, "subparts": [
+        {"id": chr(ord("a") + i), "type": t, "expected": _expected_for(t, rng), "points": rng.choice((0.25, 0.5, 1.0))}
+        for i, t in enumerate(rng.choice(QTYPES) for _ in range(n))
+    ]}
+
+def make_answer_key(n_questions=40, seed=0, qtypes=QTYPES, layouts=LAYOUTS):
+    rng = random.Random(seed)
+    return [
+        make_item(f"Q{i + 1}", qtypes[i % len(qtypes)], layouts[(i // len(qtypes)) % len(layouts)], rng)
+        for i in range(n_questions)
+    ]
+
+def _leaves(item):
+    if item.get("subparts"):
+        return [(sp["type"], sp["expected"]) for sp in item["subparts"]]
+    exp = item.get("expected_answer")
+    if isinstance(exp, list):
+        return [(e.get("type", item["type"]), e.get("expected")) if isinstance(e, dict) else (item["type"], e) for e in exp]
+    return [(item["type"], exp)]
+
+def make_student_answers(key, seed=0, accuracy=0.7, shape="string"):
+    """answers_structured for one student; shape is "string" (as stored after OCR), "list" or "dict"."""
+    rng = random.Random(seed)
+    out = {}
+    for item in key:
+        parts = [_answer_for(t, e, rng.random() < accuracy, rng) for t, e in _leaves(item)]
+        if len(parts) == 1:
+            out[item["question_id"]] = parts[0]
+        elif shape == "list":
+            out[item["question_id"]] = parts
+        elif shape == "dict":
+            out[item["question_id"]] = {chr(ord("a") + i): p for i, p in enumerate(parts)}
+        else:
+            out[item["question_id"]] = ", ".join(parts)
+    return out
+
+def make_cohort(key, n_students=30, seed=0, shapes=("string",)):
+    rng = random.Random(seed)
+    return [
+        {
+            "student_name": f"Student {i + 1:03d}",
+            "student_number": f"{20250000 + i}",
+            "answers_structured": make_student_answers(key, seed=rng.randrange(1 << 30),
+                                                       accuracy=rng.uniform(0.3, 0.95),
+                                                       shape=shapes[i % len(shapes)]),
+        }
+        for i in range(n_students)
+    ]
@@ -0,0 +1,204 @@
+# cache_bus.py — cross-process cache invalidation from MongoDB change streams
+#
+#   from cache_bus import BUS, InvalidatingCache
+#   BUS.start()                                              # once per service; idempotent
+#   layouts = InvalidatingCache(BUS, ("exams",), by="id")   # or by="owner"
+#   doc = layouts.get_or_load(exam_oid, page, lambda: exams_collection.find_one(...))
+#   BUS.version(owner_oid)                                   # None while the bus isn't live
+#
+# Writes to exams / submissions / courses happen in four processes, so no process can
+# invalidate its own caches from its own writes. One thread per process watches the
+# database instead: a change stream on a replica set (fullDocument looked up only for
+# the owner field), or, on a standalone mongod, a poll of exams.updated_at and
+# courses.uploaded_at every CACHE_POLL_S. Polling sees submission writes through
+# their exam, whose updated_at every submit/grade path bumps; it doesn't see deletes.
+#
+# Caches only serve while the bus is live. A lost stream (error, resume token
+# expired) drops everything before the bus reports live again, so a cache is
+# never fresher on paper than the events it has seen.
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from pymongo.errors import OperationFailure, PyMongoError
+
+from mongo import db
+from metrics import CACHE_EVENTS
+
+CACHE_BUS = os.getenv("CACHE_BUS", "auto").lower()       # auto | stream | poll | off
+CACHE_POLL_S = float(os.getenv("CACHE_POLL_S", "2"))
+CACHE_POLL_SKEW_S = 2.0   # re-read this far back: a write stamped before the last poll may commit after it
+
+WATCHED = {"exams": "created_by", "submissions": "created_by", "courses": "user_id"}
+POLL_TS = {"exams": "updated_at", "courses": "uploaded_at"}
+_NO_CHANGE_STREAMS = (40573, 20)   # not a replica set / transactions-style "not supported"
+_HISTORY_LOST = 286
+
+log = logging.getLogger("cache_bus")
+
+def _event(change) -> dict:
+    coll = change["ns"]["coll"]
+    full = change.get("fullDocument") or {}
+    return {"collection": coll, "op": change["operationType"],
+            "id": (change.get("documentKey") or {}).get("_id"), "owner": full.get(WATCHED[coll])}
+
+class CacheBus:
+    def __init__(self, database):
+        self.db = database
+        self.mode = None          # "stream" | "poll" while live
+        self._subs = []           # (collections, callback)
+        self._versions = {}       # owner id (str) -> events seen
+        self._epoch = 0           # bumped by invalidate_all(): every version changes
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def live(self) -> bool:
+        return self.mode is not None and self._thread is not None and self._thread.is_alive()
+
+    def subscribe(self, collections, callback):
+        """callback(event) for events on collections; event["collection"] is None for "drop everything"."""
+        with self._lock:
+            self._subs.append((frozenset(collections), callback))
+
+    def version(self, owner):
+        if not self.live:
+            return None
+        with self._lock:
+            return (self._epoch, self._versions.get(str(owner), 0))
+
+    def publish(self, ev: dict):
+        with self._lock:
+            if ev.get("owner") is not None:
+                key = str(ev["owner"])
+                self._versions[key] = self._versions.get(key, 0) + 1
+            else:
+                self._epoch += 1  # e.g. a delete: the owner is unknown
+            subs = [cb for colls, cb in self._subs if ev["collection"] is None or ev["collection"] in colls]
+        CACHE_EVENTS.inc(collection=ev["collection"] or "*", source=self.mode or "resync")
+        for cb in subs:
+            try:
+                cb(ev)
+            except Exception:
+                log.exception("cache bus subscriber failed")
+
+    def invalidate_all(self):
+        self.publish({"collection": None, "op": "resync", "id": None, "owner": None})
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None or CACHE_BUS == "off":
+                return
+            self._thread = threading.Thread(target=self._run, name="cache-bus", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        if CACHE_BUS in ("auto", "stream"):
+            try:
+                self._stream()
+            except OperationFailure as e:
+                if e.code not in _NO_CHANGE_STREAMS or CACHE_BUS == "stream":
+                    log.error("change stream unavailable, cache bus off: %s", e)
+                    self.mode = None
+                    return
+                log.info("no change streams on this server (%s); polling every %ss", e.code, CACHE_POLL_S)
+        self._poll()
+
+    def _stream(self):
+        pipeline = [
+            {"$match": {"ns.coll": {"$in": list(WATCHED)},
+                        "operationType": {"$in": ["insert", "update", "replace", "delete"]}}},
+            {"$project": {"ns": 1, "operationType": 1, "documentKey": 1,
+                          **{f"fullDocument.{f}": 1 for f in set(WATCHED.values())}}},
+        ]
+        token = None
+        while True:
+            try:
+                with self.db.watch(pipeline, full_document="updateLookup", resume_after=token) as stream:
+                    if self.mode is None:
+                        self.invalidate_all()  # whatever happened while we weren't watching
+                    self.mode = "stream"
+                    for change in stream:
+                        token = stream.resume_token
+                        self.publish(_event(change))
+            except OperationFailure as e:
+                if self.mode is None and e.code in _NO_CHANGE_STREAMS:
+                    raise
+                self.mode = None
+                if e.code == _HISTORY_LOST:
+                    token = None
+                log.warning("change stream lost (%s); reconnecting", e)
+                time.sleep(1)
+            except PyMongoError as e:
+                self.mode = None
+                log.warning("change stream lost (%s); reconnecting", e)
+                time.sleep(1)
+
+    def _poll(self):
+        since = datetime.utcnow() - timedelta(seconds=CACHE_POLL_SKEW_S)
+        while True:
+            started = datetime.utcnow()
+            try:
+                seen = set()
+                for coll, ts in POLL_TS.items():
+                    owner_field = WATCHED[coll]
+                    for d in self.db[coll].find({ts: {"$gt": since}}, {owner_field: 1}):
+                        if (coll, d["_id"]) not in seen:
+                            seen.add((coll, d["_id"]))
+                            self.publish({"collection": coll, "op": "update", "id": d["_id"],
+                                          "owner": d.get(owner_field)})
+                if self.mode is None:
+                    self.invalidate_all()
+                self.mode = "poll"
+                since = started - timedelta(seconds=CACHE_POLL_SKEW_S)
+            except PyMongoError as e:
+                self.mode = None
+                log.warning("cache bus poll failed: %s", e)
+            time.sleep(CACHE_POLL_S)
+
+BUS = CacheBus(db)
+
+class InvalidatingCache:
+    """Small LRU whose entries are tagged by owner or document id and dropped by bus events."""
+
+    def __init__(self, bus, collections, by="owner", maxsize=256):
+        self.bus, self.by, self.maxsize = bus, by, maxsize
+        self._data = OrderedDict()   # (tag, key) -> value
+        self._gen = {}               # tag -> invalidations seen, so a load racing an event isn't stored
+        self._epoch = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = 0
+        bus.subscribe(collections, self._on_event)
+
+    def _on_event(self, ev):
+        tag = ev.get(self.by)
+        with self._lock:
+            if ev["collection"] is None or tag is None:
+                self._data.clear()
+                self._epoch += 1
+                return
+            tag = str(tag)
+            self._gen[tag] = self._gen.get(tag, 0) + 1
+            for k in [k for k in self._data if k[0] == tag]:
+                del self._data[k]
+
+    def get_or_load(self, tag, key, load):
+        if not self.bus.live:
+            return load()
+        k = (str(tag), key)
+        with self._lock:
+            if k in self._data:
+                self._data.move_to_end(k)
+                self.hits += 1
+                return self._data[k]
+            self.misses += 1
+            gen, epoch = self._gen.get(k[0], 0), self._epoch
+        value = load()
+        with self._lock:
+            if self._gen.get(k[0], 0) == gen and self._epoch == epoch:
+                self._data[k] = value
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
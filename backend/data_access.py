@@ -0,0 +1,162 @@
+# data_access.py — tenant-scoped queries for exams and submissions
+#
+# Every read goes through a scope filter on `created_by` (an ObjectId after
+# migrate_created_by.py), so hot queries are single-range scans on the
+# (created_by, created_at, _id) compound indexes declared in mongo.py.
+# Admins get an empty scope.
+#
+# Writes that touch both collections live here too: exams are created in one shape
+# by every service, and a submission insert and its exam's stats.submissions bump
+# commit together (see insert_submission / reconcile_submission_counts).
+from datetime import datetime
+from bson import ObjectId
+from pymongo import UpdateOne
+from mongo import client, exams_collection, submissions_collection
+
+NEWEST_FIRST = [("created_at", -1), ("_id", -1)]
+
+def as_oid(v):
+    if isinstance(v, ObjectId):
+        return v
+    try:
+        return ObjectId(v)
+    except Exception:
+        return None
+
+def owner_oid(user: dict):
+    return as_oid((user or {}).get("sub"))
+
+def scope(user: dict) -> dict:
+    """Owner filter for exams/submissions; raises PermissionError for an unusable identity."""
+    if (user or {}).get("role") == "admin":
+        return {}
+    oid = owner_oid(user)
+    if not oid:
+        raise PermissionError("invalid user id")
+    return {"created_by": oid}
+
+# ---------- Exams ----------
+def find_exams(user: dict, projection=None, extra=None):
+    return exams_collection.find({**scope(user), **(extra or {})}, projection).sort(NEWEST_FIRST)
+
+def find_exam(user: dict, exam_id, projection=None):
+    oid = as_oid(exam_id)
+    if not oid:
+        return None
+    return exams_collection.find_one({**scope(user), "_id": oid}, projection)
+
+def latest_exam(user: dict, projection=None):
+    return exams_collection.find_one(scope(user), projection, sort=NEWEST_FIRST)
+
+def count_exams(user: dict) -> int:
+    return exams_collection.count_documents(scope(user))
+
+def exams_version(user: dict):
+    """(count, latest updated_at) over the user's exams: changes whenever their listing does.
+
+    Every write that shows in a listing (create, submission count, grading) bumps
+    updated_at; the count catches a delete. Two index-only lookups on
+    (created_by, updated_at).
+    """
+    q = scope(user)
+    latest = exams_collection.find_one(q, {"_id": 0, "updated_at": 1}, sort=[("updated_at", -1)])
+    return exams_collection.count_documents(q), (latest or {}).get("updated_at")
+
+# ---------- Submissions ----------
+def find_submissions(user: dict, extra=None, projection=None):
+    return submissions_collection.find({**scope(user), **(extra or {})}, projection).sort(NEWEST_FIRST)
+
+def find_submission(user: dict, submission_id, projection=None):
+    oid = as_oid(submission_id)
+    if not oid:
+        return None
+    return submissions_collection.find_one({**scope(user), "_id": oid}, projection)
+
+def latest_submission(user: dict, extra=None, projection=None):
+    return submissions_collection.find_one({**scope(user), **(extra or {})}, projection, sort=NEWEST_FIRST)
+
+# ---------- Writes ----------
+def summary_fields(answer_key, pages) -> dict:
+    """Listing fields kept next to answer_key/pages so listings never project the arrays.
+
+    Set them in the same write as answer_key or pages (see migrate_exam_summary.py for
+    exams saved before they existed).
+    """
+    return {"has_key": bool(answer_key), "pages_count": len(pages or [])}
+
+def new_exam_doc(title, answer_key, pages, owner) -> dict:
+    """The exam shape every service writes (app.py /api/exams, llama.py /api/submit-answer-key)."""
+    now = datetime.utcnow()
+    return {
+        "title": title,
+        "answer_key": answer_key or [],
+        "pages": pages or [],
+        **summary_fields(answer_key, pages),
+        "stats": {"submissions": 0},
+        "created_by": owner,
+        "created_at": now,
+        "updated_at": now,
+    }
+
+def insert_exam(title, answer_key, pages, owner) -> dict:
+    doc = new_exam_doc(title, answer_key, pages, owner)
+    doc["_id"] = exams_collection.insert_one(doc).inserted_id
+    return doc
+
+_TXN = {"supported": None}
+
+def _transactions_supported() -> bool:
+    # replica set members and mongos run transactions; a standalone mongod doesn't
+    if _TXN["supported"] is None:
+        hello = client.admin.command("hello")
+        _TXN["supported"] = bool(hello.get("setName")) or hello.get("msg") == "isdbgrid"
+    return _TXN["supported"]
+
+def insert_submission(doc: dict) -> ObjectId:
+    """Inserts a submission and bumps its exam's stats.submissions as one unit.
+
+    On a replica set both writes commit in one transaction, so the counter never
+    drifts; on a standalone mongod they run back to back and
+    reconcile_submission_counts() repairs a counter left behind by a crash in
+    between. A DuplicateKeyError (submission_dedup identity) leaves nothing written.
+    """
+    bump = {"$inc": {"stats.submissions": 1}, "$set": {"updated_at": datetime.utcnow()}}
+    if _transactions_supported():
+        def _both(session):
+            ins = submissions_collection.insert_one(doc, session=session)
+            exams_collection.update_one({"_id": doc["exam_id"]}, bump, session=session)
+            return ins.inserted_id
+        with client.start_session() as session:
+            return session.with_transaction(_both)
+    inserted_id = submissions_collection.insert_one(doc).inserted_id
+    exams_collection.update_one({"_id": doc["exam_id"]}, bump)
+    return inserted_id
+
+def submission_count_drift() -> list:
+    """[{_id, stored, actual}] for every exam whose stats.submissions is off, in one aggregation.
+
+    The per-exam count is an index-only $lookup on submissions (exam_id, ...);
+    localField + pipeline needs MongoDB 5.0+.
+    """
+    return list(exams_collection.aggregate([
+        {"$lookup": {"from": "submissions", "localField": "_id", "foreignField": "exam_id",
+                     "pipeline": [{"$count": "n"}], "as": "counted"}},
+        {"$project": {"stored": {"$ifNull": ["$stats.submissions", None]},
+                      "actual": {"$ifNull": [{"$first": "$counted.n"}, 0]}}},
+        {"$match": {"$expr": {"$ne": ["$stored", "$actual"]}}},
+    ]))
+
+def reconcile_submission_counts(dry_run=False) -> dict:
+    drift = submission_count_drift()
+    fixed = 0
+    if drift and not dry_run:
+        # conditional on the value we read: an exam that got a submission meanwhile is left for the next run
+        res = exams_collection.bulk_write([
+            UpdateOne({"_id": d["_id"], "stats.submissions": d["stored"]},
+                      {"$set": {"stats.submissions": d["actual"], "updated_at": datetime.utcnow()}})
+            for d in drift
+        ], ordered=False)
+        fixed = res.modified_count
+    return {"drifted": len(drift), "fixed": fixed,
+            "net_difference": sum(d["actual"] - (d["stored"] or 0) for d in drift)}
+
@@ -0,0 +1,385 @@
+# grading.py — deterministic grading engine (pure functions, no I/O)
+#
+# Shared by corrector.py (regrades) and the benchmarks; importable without a database.
+import re
+import json
+from difflib import SequenceMatcher
+import numpy as np
+
+# ---------- Grading Configuration ----------
+ALLOWED_STEPS = (1.0, 0.5, 0.25)
+
+def _nearest_allowed(x: float) -> float:
+    try:
+        x = float(x)
+    except (TypeError, ValueError):
+        return 0.0
+    if x <= 0:
+        return 0.0
+    return max(ALLOWED_STEPS, key=lambda s: (-(abs(s - x)), s))
+
+def _ensure_allowed_points(v) -> float:
+    try:
+        return _nearest_allowed(float(v))
+    except (TypeError, ValueError):
+        return 0.0
+
+# ---------- Text & Answer Helpers ----------
+def _norm(s):
+    if s is None:
+        return ""
+    return re.sub(r"\s+", " ", str(s).strip().lower())
+
+def _similar(a, b):
+    return SequenceMatcher(None, _norm(a), _norm(b)).ratio()
+
+def _num(x):
+    if isinstance(x, (int, float)):
+        return float(x)
+    match = re.search(r"[-+]?\d*\.?\d+(?:[eE][-+]?\d+)?", str(x or ""))
+    return float(match.group()) if match else None
+
+def _as_list(v):
+    if v is None:
+        return []
+    if isinstance(v, list):
+        return v
+    if isinstance(v, dict):
+        def _key_sort(k):
+            m = re.match(r"([a-zA-Z]+)|(\d+)", str(k))
+            if not m:
+                return (2, str(k))
+            return (0, m.group(1)) if m.group(1) else (1, int(m.group(2)))
+        return [v[k] for k in sorted(v.keys(), key=_key_sort)]
+    parts = re.split(r"[,\;\|\n/]+", str(v))
+    return [p.strip() for p in parts if p.strip()]
+
+# ---------- Grading Logic ----------
+def _grade_leaf(qtype, expected, student, pts, allow_near=False):
+    awarded = 0.0
+    student_norm = _norm(student)
+
+    if qtype in ("text", "short_text"):
+        if isinstance(expected, list):
+            exact = any(_norm(x) == student_norm for x in expected)
+            near = any(_similar(student, x) >= 0.92 for x in expected)
+        else:
+            exact = _norm(expected) == student_norm
+            near = _similar(student, expected) >= 0.92
+        awarded = pts if exact else (pts * 0.5 if allow_near and near else 0.0)
+
+    elif qtype == "mcq_single":
+        awarded = pts if _norm(expected) == student_norm else 0.0
+
+    elif qtype == "true_false":
+        awarded = pts if student_norm in {"true", "false"} and student_norm == _norm(expected) else 0.0
+
+    elif qtype == "numeric":
+        if not isinstance(expected, dict):
+            expected = {"value": expected}
+        tolerance = float(expected.get("tolerance", 0))
+        sval = _num(student)
+        if "value" in expected:
+            ok = sval is not None and abs(sval - float(expected["value"])) <= tolerance
+        else:
+            ok = any(
+                sval is not None and abs(sval - float(v)) <= tolerance
+                for v in expected.get("values", [])
+            )
+        awarded = pts if ok else 0.0
+
+    elif qtype == "regex":
+        pattern = str(expected)
+        ok = re.fullmatch(pattern, str(student or ""), re.IGNORECASE) is not None
+        awarded = pts if ok else 0.0
+
+    else:
+        awarded = pts if _norm(expected) == student_norm else 0.0
+
+    return max(0.0, min(float(pts), awarded))
+
+def _expand_to_subparts(item):
+    qtype = item.get("type", "text")
+    subparts = item.get("subparts")
+
+    if subparts and isinstance(subparts, list):
+        out = []
+        for i, sp in enumerate(subparts):
+            stype = sp.get("type", qtype)
+            exp = sp.get("expected", sp.get("answer"))
+            pts = _ensure_allowed_points(sp.get("points", 0))
+            sid = sp.get("id", chr(ord('a') + i))
+            out.append({"id": sid, "type": stype, "expected": exp, "points": pts})
+        total = sum(float(x["points"]) for x in out)
+        return out, total
+
+    expected = item.get("expected_answer")
+    if isinstance(expected, list) and expected:
+        n = len(expected)
+        default_per = 1.0 if n == 1 else (0.5 if n in (2, 3) else 0.25)
+        out = []
+        for i, exp in enumerate(expected):
+            sid = chr(ord('a') + i)
+            if isinstance(exp, dict):
+                stype = exp.get("type", qtype)
+                e = exp.get("expected", exp.get("answer"))
+                p = _ensure_allowed_points(exp.get("points", default_per))
+            else:
+                stype, e, p = qtype, exp, default_per
+            out.append({"id": sid, "type": stype, "expected": e, "points": p})
+        total = sum(float(x["points"]) for x in out)
+        return out, total
+
+    return [{"id": "a", "type": qtype, "expected": expected, "points": 1.0}], 1.0
+
+def _pick_student_for_sub(student_answer, sub_index, sub_id):
+    if isinstance(student_answer, dict):
+        if sub_id in student_answer:
+            return student_answer[sub_id]
+        if str(sub_index + 1) in student_answer:
+            return student_answer[str(sub_index + 1)]
+        as_list = _as_list(student_answer)
+        return as_list[sub_index] if sub_index < len(as_list) else None
+
+    if isinstance(student_answer, list):
+        return student_answer[sub_index] if sub_index < len(student_answer) else None
+
+    parts = _as_list(student_answer)
+    return parts[sub_index] if sub_index < len(parts) else None
+
+def _grade_item(item, student_answer, allow_near=False, leaf_grader=_grade_leaf):
+    subparts, pts_total = _expand_to_subparts(item)
+    awarded_total = 0.0
+    details = []
+
+    for i, sp in enumerate(subparts):
+        s_ans = _pick_student_for_sub(student_answer, i, sp["id"])
+        awarded = leaf_grader(sp["type"], sp["expected"], s_ans, float(sp["points"]), allow_near)
+        awarded_total += awarded
+        details.append({
+            "sub_id": sp["id"],
+            "type": sp["type"],
+            "points": round(float(sp["points"]), 3),
+            "awarded": round(awarded, 3),
+            "expected": sp["expected"],
+            "student": s_ans,
+        })
+    return awarded_total, pts_total, details
+
+def _grade_against_key(key, stud, allow_near=False, leaf_grader=_grade_leaf):
+    """Pure grading of one submission's answers against an answer key.
+
+    leaf_grader has _grade_leaf's signature; hybrid grading swaps it to route
+    free-text leaves elsewhere while keeping the grading_details format.
+    """
+    expanded_key = []
+    max_points = 0.0
+    for item in key:
+        subs, pts = _expand_to_subparts(item)
+        expanded_key.append({**item, "_expanded_subparts": subs, "_expanded_points_total": pts})
+        max_points += pts
+
+    details = []
+    student_raw_total = 0.0
+
+    for idx, item in enumerate(expanded_key):
+        qid = str(item.get("question_id") or "").strip()
+        stud_key = qid if qid in stud else f"Q{idx + 1}"
+        student_answer = stud.get(stud_key)
+
+        awarded, _, sub_details = _grade_item(item, student_answer, allow_near, leaf_grader)
+        item_points = float(item["_expanded_points_total"])
+        item_awarded = awarded
+
+        student_raw_total += item_awarded
+        details.append({
+            "index": idx + 1,
+            "question_id": qid or f"Q{idx + 1}",
+            "matched_student_key": stud_key if stud_key in stud else None,
+            "type": item.get("type", "text"),
+            "points": round(item_points, 3),
+            "awarded": round(item_awarded, 3),
+            "expected": item.get("expected_answer"),
+            "student": student_answer,
+            "subparts": sub_details,
+        })
+
+    score, feedback = _score_and_feedback(details, student_raw_total, max_points)
+    return score, feedback, details, student_raw_total, max_points
+
+def _score_and_feedback(details, student_raw_total, max_points):
+    score = 0.0
+    if max_points > 0:
+        normalized = (student_raw_total * 20.0) / max_points
+        score = round(normalized * 4) / 4.0
+        score = max(0.0, min(20.0, round(score, 2)))
+
+    wrong = [d for d in details if d["awarded"] < d["points"] - 1e-5]
+    if score == 20.0:
+        feedback = "Excellent — all answers correct."
+    elif score == 0.0:
+        feedback = "Most answers are incorrect or missing. Please review and try again."
+    else:
+        missed = ", ".join((d["question_id"] or f'#{d["index"]}') for d in wrong[:5])
+        feedback = f"Several incorrect/missing answers (e.g., {missed}). Revise those topics."
+
+    return score, feedback
+
+# ---------- Whole-class (columnar) grading ----------
+VECTOR_QTYPES = ("mcq_single", "true_false", "numeric")
+
+def _memo_key(a):
+    # (type, value) so True / 1 / 1.0 don't collide; None when the answer isn't hashable
+    return (type(a), a) if isinstance(a, (str, int, float, bool, type(None))) else None
+
+def _map_unique(fn, column):
+    """fn over a column, evaluated once per distinct (hashable) answer."""
+    memo, out = {}, []
+    for a in column:
+        k = _memo_key(a)
+        if k is None:
+            out.append(fn(a))
+        elif k in memo:
+            out.append(memo[k])
+        else:
+            out.append(memo.setdefault(k, fn(a)))
+    return out
+
+def _pick_columns(answers, subs):
+    """[_pick_student_for_sub(a, i, sp["id"]) for a in answers] for every subpart, splitting each answer once."""
+    columns = [[None] * len(answers) for _ in subs]
+    split = _map_unique(lambda a: a if isinstance(a, (dict, list)) else _as_list(a), answers)
+    for s_idx, (a, parts) in enumerate(zip(answers, split)):
+        if isinstance(a, dict):
+            for i, sp in enumerate(subs):
+                columns[i][s_idx] = _pick_student_for_sub(a, i, sp["id"])
+            continue
+        for i in range(min(len(subs), len(parts))):
+            columns[i][s_idx] = parts[i]
+    return columns
+
+def _leaf_column(qtype, expected, column, pts):
+    """Awards for one leaf across the class; objective types are compared as arrays."""
+    if qtype in ("mcq_single", "true_false"):
+        # Map normalized answers to integer codes once, then compare codes
+        uniq, codes = np.unique(np.array(_map_unique(_norm, column), dtype=object), return_inverse=True)
+        exp = _norm(expected)
+        if qtype == "true_false" and exp not in ("true", "false"):
+            return np.zeros(len(column))
+        hit = np.flatnonzero(uniq == exp)
+        ok = codes == hit[0] if hit.size else np.zeros(len(column), dtype=bool)
+        return np.where(ok, float(pts), 0.0)
+
+    # numeric
+    if not isinstance(expected, dict):
+        expected = {"value": expected}
+    tolerance = float(expected.get("tolerance", 0))
+    parsed = _map_unique(_num, column)
+    svals = np.array([np.nan if v is None else v for v in parsed], dtype=float)
+    targets = np.array([float(expected["value"])] if "value" in expected
+                       else [float(v) for v in expected.get("values", [])], dtype=float)
+    if targets.size == 0:
+        return np.zeros(len(column))
+    with np.errstate(invalid="ignore"):
+        ok = (np.abs(svals[:, None] - targets[None, :]) <= tolerance).any(axis=1)
+    return np.where(ok, float(pts), 0.0)
+
+def grade_class(key, answers_list, allow_near=False):
+    """Grades a whole cohort against one key.
+
+    Returns one (score, feedback, details, raw_total, max_points) tuple per
+    entry of answers_list, identical to calling _grade_against_key on each.
+    MCQ, true/false and numeric leaves are scored column-wise with NumPy;
+    other leaf types fall back to _grade_leaf.
+    """
+    n = len(answers_list)
+    expanded, max_points = [], 0.0
+    for item in key:
+        subs, pts = _expand_to_subparts(item)
+        expanded.append((item, subs, pts))
+        max_points += pts
+
+    # Resolve each student's answer for every (question, subpart) once
+    per_item = []
+    for idx, (item, subs, _) in enumerate(expanded):
+        qid = str(item.get("question_id") or "").strip()
+        stud_keys = [qid if qid in stud else f"Q{idx + 1}" for stud in answers_list]
+        answers = [stud.get(k) for stud, k in zip(answers_list, stud_keys)]
+        columns = _pick_columns(answers, subs)
+        awards = []
+        for sp, col in zip(subs, columns):
+            pts = float(sp["points"])
+            if sp["type"] in VECTOR_QTYPES and n:
+                try:
+                    awards.append(np.minimum(_leaf_column(sp["type"], sp["expected"], col, pts), max(0.0, pts)).tolist())
+                    continue
+                except (TypeError, ValueError, KeyError):
+                    pass  # let the scalar path raise/handle exactly as before
+            awards.append(_map_unique(lambda a: _grade_leaf(sp["type"], sp["expected"], a, pts, allow_near), col))
+        per_item.append((qid, stud_keys, answers, columns, awards))
+
+    results = []
+    for s_idx, stud in enumerate(answers_list):
+        details, student_raw_total = [], 0.0
+        for idx, ((item, subs, pts_total), (qid, stud_keys, answers, columns, awards)) in enumerate(zip(expanded, per_item)):
+            item_awarded = 0.0
+            sub_details = []
+            for sp, col, aw in zip(subs, columns, awards):
+                awarded = float(aw[s_idx])
+                item_awarded += awarded
+                sub_details.append({
+                    "sub_id": sp["id"],
+                    "type": sp["type"],
+                    "points": round(float(sp["points"]), 3),
+                    "awarded": round(awarded, 3),
+                    "expected": sp["expected"],
+                    "student": col[s_idx],
+                })
+            student_raw_total += item_awarded
+            stud_key = stud_keys[s_idx]
+            details.append({
+                "index": idx + 1,
+                "question_id": qid or f"Q{idx + 1}",
+                "matched_student_key": stud_key if stud_key in stud else None,
+                "type": item.get("type", "text"),
+                "points": round(float(pts_total), 3),
+                "awarded": round(item_awarded, 3),
+                "expected": item.get("expected_answer"),
+                "student": answers[s_idx],
+                "subparts": sub_details,
+            })
+        score, feedback = _score_and_feedback(details, student_raw_total, max_points)
+        results.append((score, feedback, details, student_raw_total, max_points))
+    return results
+
+# ---------- Hybrid (rules first, LLM for free text) ----------
+DETERMINISTIC_QTYPES = ("mcq_single", "true_false", "numeric", "regex")
+
+def _leaf_id(qtype, expected, student, pts):
+    # content-addressed, so identical leaves share one LLM judgement
+    return json.dumps([qtype, expected, student, pts], sort_keys=True, default=str)
+
+def _hybrid_leaf(pending, awards):
+    def grade(qtype, expected, student, pts, allow_near=False):
+        if qtype in DETERMINISTIC_QTYPES:
+            return _grade_leaf(qtype, expected, student, pts, allow_near)
+        if _grade_leaf("text", expected, student, pts) >= pts:
+            return pts  # exact match needs no judgement
+        if not _norm(student):
+            return 0.0
+        lid = _leaf_id(qtype, expected, student, pts)
+        if awards is not None:
+            return max(0.0, min(float(pts), float(awards.get(lid, 0.0))))
+        pending.setdefault(lid, {"type": qtype, "expected": expected, "student": student, "points": pts})
+        return 0.0
+    return grade
+
+def free_text_leaves(key, stud):
+    """Leaves that still need a judgement after rule grading, keyed by leaf id."""
+    pending = {}
+    _grade_against_key(key, stud, leaf_grader=_hybrid_leaf(pending, None))
+    return pending
+
+def grade_hybrid(key, stud, awards):
+    """_grade_against_key with free-text leaves scored from awards (leaf id -> points)."""
+    return _grade_against_key(key, stud, leaf_grader=_hybrid_leaf(None, awards))
@@ -0,0 +1,152 @@
+# intent_router.py — local intent classifier in front of the ReAct agent
+#
+# High-confidence, parameter-free requests ("list my exams") are dispatched
+# straight to a tool; anything else returns None and goes to the LLM.
+# Run `python intent_router.py` to measure accuracy/latency on LABELED_UTTERANCES.
+import os
+import re
+import time
+import threading
+import numpy as np
+
+from percentiles import nearest_rank
+
+ROUTER_MIN_SIM = float(os.getenv("INTENT_ROUTER_MIN_SIM", "0.78"))
+ROUTER_MIN_MARGIN = float(os.getenv("INTENT_ROUTER_MIN_MARGIN", "0.08"))
+
+# Anchored patterns over the normalized query (lowercase, punctuation stripped)
+INTENT_RULES = {
+    "list_exams": [
+        r"(please )?(list|show|display|get|give)( me)? (all )?(of )?my exams?( please)?",
+        r"(what|which) exams? do i have",
+        r"my exams",
+        r"exams? list",
+    ],
+    "list_submissions": [
+        r"(please )?(list|show|display|get|give)( me)? (all )?(the )?(latest|last|recent|newest) (student )?submissions?( please)?",
+        r"(please )?(list|show|display|get|give)( me)? (all )?(the )?(student )?submissions?( please)?",
+        r"(latest|last|recent) submissions?",
+    ],
+}
+
+INTENT_EXAMPLES = {
+    "list_exams": [
+        "list my exams",
+        "show me my exams",
+        "what exams have i created",
+        "which tests do i have",
+        "display all my exams",
+        "give me the list of my exams",
+        "what exams do i own",
+        "show my tests",
+    ],
+    "list_submissions": [
+        "show the latest submissions",
+        "list the student submissions",
+        "who submitted recently",
+        "show me the recent student papers",
+        "what are the newest submissions",
+        "list submissions for my latest exam",
+        "show student results for the last exam",
+        "display the latest student copies",
+    ],
+}
+
+# Words that signal parameters or analysis the direct tools cannot satisfy
+_DEFER_RE = re.compile(
+    r"\b(compare|average|avg|mean|median|percentile|missed|miss|question|q\d+|best|worst|top|"
+    r"why|how many|explain|course|material|feedback|for exam|called|named|[0-9a-f]{24})\b"
+)
+
+LABELED_UTTERANCES = [
+    ("list my exams", "list_exams"),
+    ("show my exams please", "list_exams"),
+    ("what exams do i have", "list_exams"),
+    ("can you show all the exams i made", "list_exams"),
+    ("which exams did i create", "list_exams"),
+    ("my exams", "list_exams"),
+    ("display my tests", "list_exams"),
+    ("show the latest submissions", "list_submissions"),
+    ("list submissions", "list_submissions"),
+    ("recent submissions", "list_submissions"),
+    ("who handed in their exam recently", "list_submissions"),
+    ("show me the newest student papers", "list_submissions"),
+    ("give me the last submissions", "list_submissions"),
+    ("compare average scores across my last three exams", None),
+    ("which students missed question 3", None),
+    ("show me feedback for ahmed s exam", None),
+    ("what s in my course material about calculus", None),
+    ("get details for exam 64f1c2a9b1e4d3c2a1b0f9e8", None),
+    ("what is the median score on the grammar test", None),
+    ("hello", None),
+    ("how do i upload a pdf", None),
+    ("list submissions for exam called midterm", None),
+]
+
+_CENTROIDS = None
+_CENTROID_LOCK = threading.Lock()
+
+def _unit(v):
+    v = np.asarray(v, dtype=np.float32)
+    n = float(np.linalg.norm(v))
+    return v / n if n > 0 else v
+
+def _centroids(encode):
+    global _CENTROIDS
+    if _CENTROIDS is None:
+        with _CENTROID_LOCK:
+            if _CENTROIDS is None:
+                _CENTROIDS = {
+                    intent: _unit(np.mean([_unit(v) for v in encode(examples)], axis=0))
+                    for intent, examples in INTENT_EXAMPLES.items()
+                }
+    return _CENTROIDS
+
+def classify(norm_query: str, query_vec, encode):
+    """Returns (intent, confidence, source); intent is None when the LLM should decide."""
+    if not norm_query or _DEFER_RE.search(norm_query):
+        return None, 0.0, "defer"
+
+    for intent, patterns in INTENT_RULES.items():
+        if any(re.fullmatch(p, norm_query) for p in patterns):
+            return intent, 1.0, "rule"
+
+    if query_vec is None:
+        return None, 0.0, "none"
+    q = _unit(query_vec)
+    scored = sorted(((float(np.dot(q, c)), intent) for intent, c in _centroids(encode).items()), reverse=True)
+    best_sim, best = scored[0]
+    margin = best_sim - (scored[1][0] if len(scored) > 1 else 0.0)
+    if best_sim >= ROUTER_MIN_SIM and margin >= ROUTER_MIN_MARGIN:
+        return best, best_sim, "embedding"
+    return None, best_sim, "embedding"
+
+def evaluate(encode, normalize=lambda s: s):
+    """Accuracy (None = "fallback to LLM" counts as a label) and per-query latency in ms."""
+    _centroids(encode)
+    correct, latencies, misses = 0, [], []
+    for text, expected in LABELED_UTTERANCES:
+        t0 = time.perf_counter()
+        norm = normalize(text)
+        intent, conf, source = classify(norm, encode(norm), encode)
+        latencies.append((time.perf_counter() - t0) * 1000)
+        if intent == expected:
+            correct += 1
+        else:
+            misses.append({"text": text, "expected": expected, "got": intent, "conf": round(conf, 3), "source": source})
+    latencies.sort()
+    return {
+        "n": len(LABELED_UTTERANCES),
+        "accuracy": round(correct / len(LABELED_UTTERANCES), 3),
+        "p50_ms": round(nearest_rank(latencies, 50), 2),
+        "p95_ms": round(nearest_rank(latencies, 95), 2),
+        "misses": misses,
+    }
+
+if __name__ == "__main__":
+    import json
+    from sentence_transformers import SentenceTransformer
+    from agent_cache import normalize_query
+
+    model = SentenceTransformer("all-MiniLM-L6-v2")
+    print(json.dumps(evaluate(model.encode, normalize_query), indent=2))
@@ -0,0 +1,259 @@
+# key_parser.py — turn OCR'd exam markdown into the answer_key list the grader expects (no I/O)
+#
+#   items, unparsed = parse_exam_text(full_text)
+#   sheet = parse_answer_sheet(student_page_text)     # local-OCR path of /extract-answers
+#   numbers_contiguous(key_page_text)                 # False: don't tile the page (student.py)
+#
+# Each item is {"question_id", "type", "expected_answer" | "subparts", "prompt",
+# "section", "options", "review"} — the grading fields are what grading.py reads,
+# the rest is for the key editor. Questions are numbered Q1, Q2, ... in reading
+# order, matching how student answers are keyed. Expected answers are filled in
+# when the sheet carries them (a ticked option, "Answer: ..." lines, [[filled]]
+# blanks); otherwise they are left empty and the item is flagged for review.
+import re
+
+_PAGE = re.compile(r"^\s*(?:🖼️|📄)?\s*(?:Page\s+(\d+)\b.*|From:.*)$", re.I)
+_HEADING = re.compile(r"^\s*#{1,6}\s+(.+?)\s*$")
+_ROMAN_SECTION = re.compile(r"^\s*(?:\*\*)?([IVX]{1,5})[\.\)]\s+(.+?)(?:\*\*)?\s*$")
+_QUESTION = re.compile(r"^\s*(?:\*\*)?(?:Q(?:uestion)?\s*)?(\d{1,3})\s*[\.\):]\s*(?:\*\*)?\s*(.*)$", re.I)
+_OPTION = re.compile(r"^\s*(?:[-*•]\s*)?(?P<mark>(?:\[[xX✓✔ ]?\]|[☐□☑☒■✓✔])\s*)?\(?(?P<letter>[a-hA-H])[\)\.]\s+(?P<text>.+?)\s*$")
+_BLANK = re.compile(r"_{3,}|\.{4,}|…{2,}|\[\[[^\]]*\]\]")
+_FILLED = re.compile(r"\[\[([^\]]*)\]\]")
+_ANSWER_LINE = re.compile(r"^\s*(?:\*\*)?(?:answer|ans|key)\s*[:\-]\s*(?:\*\*)?\s*(.+?)\s*$", re.I)
+_TICK = re.compile(r"\[[xX✓✔]\]|[☑☒■✓✔]|\(correct\)|\*\*$", re.I)
+_TRUE_FALSE = re.compile(r"\btrue\b.{0,15}\bfalse\b|\bT\s*/\s*F\b", re.I)
+_HEADER_FIELD = re.compile(r"^\s*(name|class|number|date|student|notes?)\b", re.I)
+_NAME_FIELD = re.compile(r"^\s*(?:student(?:'s)?\s+)?name\s*[:\-]\s*(.+?)\s*$", re.I)
+_NUMBER_FIELD = re.compile(r"^\s*(?:student\s+)?(?:number|no\.?|id|n°)\s*[:\-]\s*([\w\-/]+)", re.I)
+
+def _default_points(n: int) -> float:
+    # mirrors grading._expand_to_subparts for unpointed lists
+    return 1.0 if n == 1 else (0.5 if n in (2, 3) else 0.25)
+
+def _is_section(line: str):
+    m = _HEADING.match(line)
+    if m and not _QUESTION.match(m.group(1)):
+        return m.group(1).strip("* ")
+    m = _ROMAN_SECTION.match(line)
+    if m:
+        title = m.group(2)
+        letters = [c for c in title if c.isalpha()]
+        if letters and sum(c.isupper() for c in letters) / len(letters) > 0.6:
+            return f"{m.group(1)}. {title.strip('* ')}"
+    return None
+
+def _new_question(num, text, section, page):
+    return {"num": int(num), "lines": [text] if text else [], "options": [], "subs": [],
+            "answer": None, "section": section, "page": page}
+
+def _finish(q, seq):
+    prompt = " ".join(x.strip() for x in q["lines"] if x.strip())
+    blanks = _BLANK.findall(prompt)
+    filled = _FILLED.findall(prompt)
+    item = {"question_id": f"Q{seq}", "prompt": _FILLED.sub("______", prompt), "section": q["section"],
+            "page": q["page"]}
+    review = False
+
+    if q["subs"]:
+        pts = _default_points(len(q["subs"]))
+        subparts = []
+        for letter, text in q["subs"]:
+            fill = _FILLED.findall(text)
+            subparts.append({"id": letter, "type": "short_text", "expected": fill[0].strip() if fill else "",
+                             "points": pts, "prompt": _FILLED.sub("______", text)})
+        item.update(type="short_text", subparts=subparts)
+        review = any(not sp["expected"] for sp in subparts)
+    elif len(q["options"]) >= 2:
+        ticked = [letter for letter, _, mark in q["options"] if mark]
+        answer = (q["answer"] or "").strip().lower()
+        if not ticked and re.fullmatch(r"\(?[a-h]\)?", answer):
+            ticked = [answer.strip("()")]
+        item.update(type="mcq_single", expected_answer=ticked[0] if len(ticked) == 1 else "",
+                    options=[{"id": letter, "text": text} for letter, text, _ in q["options"]])
+        review = len(ticked) != 1
+    elif _TRUE_FALSE.search(prompt):
+        answer = (q["answer"] or "").strip().lower()
+        answer = {"t": "true", "f": "false"}.get(answer, answer)
+        item.update(type="true_false", expected_answer=answer if answer in ("true", "false") else "")
+        review = not item["expected_answer"]
+    elif len(blanks) > 1:
+        pts = _default_points(len(blanks))
+        fills = iter(filled)
+        item.update(type="short_text", subparts=[
+            {"id": chr(ord("a") + i), "type": "short_text",
+             "expected": (next(fills, "") if b.startswith("[[") else "").strip(), "points": pts}
+            for i, b in enumerate(blanks)
+        ])
+        review = any(not sp["expected"] for sp in item["subparts"])
+    elif blanks:
+        expected = filled[0].strip() if filled else (q["answer"] or "")
+        item.update(type="short_text", expected_answer=expected)
+        review = not expected
+    else:
+        # open question: nothing on the sheet tells us how to grade it
+        item.update(type="text", expected_answer=q["answer"] or "")
+        review = True
+    item["review"] = review
+    return item
+
+def parse_exam_text(text: str):
+    """Returns (items, unparsed_pages).
+
+    unparsed_pages lists page numbers (from the "Page N" headers /extract writes)
+    that had text but no recognisable question, so the caller can fall back to
+    the model for just those pages.
+    """
+    items, q, section = [], None, None
+    page, page_has_text, page_has_question, unparsed = 1, False, False, []
+
+    def close():
+        nonlocal q
+        if q is not None:
+            items.append(_finish(q, len(items) + 1))
+            q = None
+
+    def end_page():
+        if page_has_text and not page_has_question:
+            unparsed.append(page)
+
+    for raw in (text or "").splitlines():
+        line = raw.rstrip()
+        if not line.strip():
+            continue
+        m = _PAGE.match(line)
+        if m:
+            end_page()
+            page = int(m.group(1)) if m.group(1) else page + 1
+            page_has_text = page_has_question = False
+            if q is not None:
+                q["page_break"] = True  # options/answers may continue over the page, prose doesn't
+            continue
+        page_has_text = True
+
+        title = _is_section(line)
+        if title:
+            close()
+            section = title
+            continue
+        m = _QUESTION.match(line)
+        if m and not _OPTION.match(line):
+            close()
+            q = _new_question(m.group(1), m.group(2), section, page)
+            page_has_question = True
+            continue
+        if q is None:
+            continue  # preamble: school, name/class fields, instructions
+        m = _ANSWER_LINE.match(line)
+        if m:
+            q["answer"] = m.group(1)
+            continue
+        m = _OPTION.match(line)
+        if m:
+            body = m.group("text")
+            marked = bool(_TICK.search(m.group("mark") or "") or _TICK.search(body))
+            clean = _TICK.sub("", body).strip(" *")
+            if _BLANK.search(body):
+                q["subs"].append((m.group("letter").lower(), clean))
+            else:
+                q["options"].append((m.group("letter").lower(), clean, marked))
+            continue
+        if not q.get("page_break") and not _HEADER_FIELD.match(line):
+            q["lines"].append(line)
+    close()
+    end_page()
+    return items, unparsed
+
+def page_texts(text: str) -> dict:
+    """Splits /extract output on its "Page N" headers: {page number: text}."""
+    pages, page, buf = {}, 1, []
+    for line in (text or "").splitlines():
+        m = _PAGE.match(line)
+        if m:
+            if buf:
+                pages[page] = "\n".join(buf)
+            page, buf = (int(m.group(1)) if m.group(1) else page + 1), []
+        else:
+            buf.append(line)
+    if buf:
+        pages[page] = "\n".join(buf)
+    return pages
+
+def merge(items, extra):
+    """Adds items from another source (e.g. the model, for unparsed pages), keeps page order, renumbers Q1..Qn."""
+    merged = sorted(list(items) + list(extra), key=lambda it: it.get("page") or 0)
+    for i, it in enumerate(merged, 1):
+        it["question_id"] = f"Q{i}"
+    return merged
+
+def for_grading(items):
+    """Strips the editor-only fields, leaving question_id/type/expected_answer/subparts."""
+    out = []
+    for it in items:
+        g = {k: it[k] for k in ("question_id", "type", "expected_answer") if k in it}
+        if it.get("subparts"):
+            g["subparts"] = [{k: sp[k] for k in ("id", "type", "expected", "points")} for sp in it["subparts"]]
+        out.append(g)
+    return out
+
+def numbers_contiguous(text: str) -> bool:
+    """True when the page's printed question numbers run n, n+1, n+2, ... with no restart or gap.
+
+    A sectioned page that starts again at 1. can't have its tiles vouched for by
+    their printed numbers, so it is read as a whole page.
+    """
+    nums = []
+    for raw in (text or "").splitlines():
+        m = _QUESTION.match(raw)
+        if m and not _OPTION.match(raw):
+            nums.append(int(m.group(1)))
+    return all(b == a + 1 for a, b in zip(nums, nums[1:]))
+
+def parse_answer_sheet(text: str) -> dict:
+    """Student answers from plain page text (no model): the same shape /extract-answers returns.
+
+    Answers are keyed Q1, Q2, ... in reading order, like parse_exam_text numbers the
+    key (sectioned sheets restart the printed numbers); a ticked option gives its
+    letter, an "Answer:" line wins over the question line, and blanks drop out.
+    """
+    name, number, answers, cur = "", "", [], None
+    for raw in (text or "").splitlines():
+        line = raw.strip()
+        if not line or _PAGE.match(line):
+            continue
+        m = _NAME_FIELD.match(line)
+        if m and not name:
+            name = _BLANK.sub("", m.group(1)).strip(" :-")
+            continue
+        m = _NUMBER_FIELD.match(line)
+        if m and not number:
+            number = m.group(1)
+            continue
+        m = _QUESTION.match(line)
+        if m and not _OPTION.match(line):
+            cur = {"text": [], "ticked": None, "answer": None}
+            answers.append(cur)
+            line = m.group(2)  # the question line may itself carry the answer or first option
+            if not line:
+                continue
+        if cur is None:
+            continue
+        m = _ANSWER_LINE.match(line)
+        if m:
+            cur["answer"] = m.group(1)
+            continue
+        m = _OPTION.match(line)
+        if m:
+            if _TICK.search(m.group("mark") or "") or _TICK.search(m.group("text")):
+                cur["ticked"] = m.group("letter").lower()
+            continue
+        cur["text"].append(line)
+
+    def _value(a):
+        if a["answer"]:
+            return a["answer"].strip()
+        if a["ticked"]:
+            return a["ticked"]
+        return re.sub(r"\s+", " ", _BLANK.sub(" ", " ".join(a["text"]))).strip(" *")
+
+    return {"student_name": name, "student_number": number or None,
+            "answers_structured": {f"Q{i}": _value(a) for i, a in enumerate(answers, 1)}}
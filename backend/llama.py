@@ -1,11 +1,11 @@
 # llama.py — extraction + save answer key
 import os
-import base64
+import json
+import time
 import requests
 import jwt
-from datetime import datetime
-from bson import ObjectId
-from flask import Flask, request, jsonify
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS
 from dotenv import load_dotenv  # ← NEW
 
@@ -17,6 +17,7 @@ TOGETHER_API_KEY = os.getenv("TOGETHER_API_KEY")
 TOGETHER_ENDPOINT = os.getenv("TOGETHER_ENDPOINT", "https://api.together.xyz/v1/chat/completions")
 MODEL_NAME = os.getenv("MODEL_NAME", "meta-llama/Llama-4-Scout-17B-16E-Instruct")
 JWT_SECRET = os.getenv("JWT_SECRET")
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "3"))  # pages OCR'd concurrently per process
 
 # Validate required env vars
 if not TOGETHER_API_KEY:
@@ -26,111 +27,293 @@ if not JWT_SECRET:
 
 # === MongoDB Setup (assuming you have mongo.py that uses MONGO_URI) ===
 # If your `mongo.py` also needs MONGO_URI, ensure it uses `os.getenv("MONGO_URI")`
-from mongo import exams_collection
+import data_access as dal
+from auth import decode_token
+from metrics import init_metrics, observe_llm
+from key_parser import parse_exam_text, page_texts, merge, for_grading, numbers_contiguous
+from structured_output import Schema, StructuredOutputError, extract
+from page_layout import build_template
+from ocr_engines import OcrRouter, RemoteVisionEngine, TesseractEngine, OcrUnavailable
 
 # === Flask App Setup ===
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "llama")
+
+_EXTRACT_POOL = ThreadPoolExecutor(max_workers=EXTRACT_WORKERS, thread_name_prefix="extract")
+OCR = OcrRouter(RemoteVisionEngine(TOGETHER_ENDPOINT, TOGETHER_API_KEY, MODEL_NAME), TesseractEngine())
 
 def _bearer():
     h = request.headers.get("Authorization") or ""
     return h.split(" ", 1)[1].strip() if h.lower().startswith("bearer ") else None
 
 def _decode_jwt(token: str) -> dict:
-    return jwt.decode(token, JWT_SECRET, algorithms=["HS256"])  # ← Use env var
+    return decode_token(token, JWT_SECRET)
 
 def _exam_summary(d: dict):
-    has_key = bool(d.get("answer_key")) and len(d["answer_key"]) > 0
+    has_key = d["has_key"] if "has_key" in d else bool(d.get("answer_key"))
     return {
         "_id": str(d["_id"]),
         "title": d.get("title") or "Untitled exam",
         "hasKey": has_key,
         "status": "published" if has_key else "draft",
-        "pagesCount": len(d.get("pages") or []),
+        "pagesCount": d["pages_count"] if "pages_count" in d else len(d.get("pages") or []),
         "submissionsCount": (d.get("stats") or {}).get("submissions", 0),
         "createdBy": str(d.get("created_by")) if d.get("created_by") else None,
     }
 
-def extract_text_from_image(image_bytes):
-    if not TOGETHER_API_KEY:
-        raise RuntimeError("TOGETHER_API_KEY is not set.")
-
-    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    payload = {
-        "model": MODEL_NAME,
-        "messages": [
-            {
-                "role": "system",
-                "content": (
-                    "You are a helpful assistant that extracts the full text from scanned exam sheets. "
-                    "There are no student answers on the sheet — only questions, headers, and blanks. "
-                    "Your job is to reconstruct the layout of the exam as clearly and structurally as possible. "
-                    "Preserve blanks (______) for fill-in-the-blank questions. "
-                    "For multiple choice questions (MCQs), show the available options (a, b, c, d) in list format. "
-                    "Do NOT invent or mark any answer as selected. "
-                    "Use clear section headers like 'I. LISTENING', 'II. LANGUAGE', etc. "
-                    "Add line breaks between questions and indent answer options if needed. "
-                    "Keep the output clean and readable, like a markdown-formatted test document."
-                )
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": (
-                            "Please extract the full text from this exam paper image. "
-                            "Do not mark any answer as selected. Just extract the structure, "
-                            "keeping blanks (______), multiple choice options, and section headers."
-                        )
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {
-                            "url": f"data:image/jpeg;base64,{image_base64}"
-                        }
-                    }
-                ]
-            }
-        ],
-        "temperature": 0.2,
-        "max_tokens": 2000,
-        "top_p": 0.8
-    }
+# Answer-key mode: same layout, but anything the teacher marked on the sheet is kept
+# in a form key_parser.py reads back deterministically.
+KEY_MODE_INSTRUCTIONS = (
+    "This sheet may be the teacher's answer key. Keep every answer written or marked on it: "
+    "put [x] before a ticked or circled option, write a filled-in blank as [[answer]], "
+    "and put any other written answer on its own line under the question as 'Answer: ...'. "
+    "Number questions as 1., 2., 3. and sub-questions as a), b), c)."
+)
 
+def _together_chat(payload):
     headers = {
         "Authorization": f"Bearer {TOGETHER_API_KEY}",
         "Content-Type": "application/json"
     }
 
-    resp = requests.post(TOGETHER_ENDPOINT, headers=headers, json=payload, timeout=60)
-    resp.raise_for_status()
-    result = resp.json()
+    with observe_llm("together", MODEL_NAME) as call:
+        resp = requests.post(TOGETHER_ENDPOINT, headers=headers, json=payload, timeout=60)
+        resp.raise_for_status()
+        result = resp.json()
+        call.usage(result.get("usage"))
     return result["choices"][0]["message"]["content"]
 
+def extract_text_from_image(image_bytes, key_mode=False, engine=None):
+    """Returns (text, name of the engine that read it); engine is a ?ocr= value."""
+    if key_mode:
+        system = (
+            "You are a helpful assistant that extracts the full text from scanned exam sheets. "
+            "Reconstruct the layout of the exam as clearly and structurally as possible. "
+            "Preserve blanks (______) that are still empty. "
+            "For multiple choice questions (MCQs), show the available options (a, b, c, d) in list format. "
+            "Use clear section headers like 'I. LISTENING', 'II. LANGUAGE', etc. "
+            + KEY_MODE_INSTRUCTIONS
+        )
+        instruction = "Please extract the full text from this exam paper image, keeping any marked answers."
+    else:
+        system = (
+            "You are a helpful assistant that extracts the full text from scanned exam sheets. "
+            "There are no student answers on the sheet — only questions, headers, and blanks. "
+            "Your job is to reconstruct the layout of the exam as clearly and structurally as possible. "
+            "Preserve blanks (______) for fill-in-the-blank questions. "
+            "For multiple choice questions (MCQs), show the available options (a, b, c, d) in list format. "
+            "Do NOT invent or mark any answer as selected. "
+            "Use clear section headers like 'I. LISTENING', 'II. LANGUAGE', etc. "
+            "Add line breaks between questions and indent answer options if needed. "
+            "Keep the output clean and readable, like a markdown-formatted test document."
+        )
+        instruction = (
+            "Please extract the full text from this exam paper image. "
+            "Do not mark any answer as selected. Just extract the structure, "
+            "keeping blanks (______), multiple choice options, and section headers."
+        )
+
+    text, used, _ = OCR.read(image_bytes, system, instruction, max_tokens=2000, engine=engine)
+    return text, used
+
+# === Structured answer keys ===
+KEY_TYPES = ("mcq_single", "true_false", "short_text", "text", "numeric")
+
+def _key_items_check(v):
+    return [] if all(isinstance(it, dict) and it.get("type") in KEY_TYPES for it in v) else \
+        [f"every item needs a type in {', '.join(KEY_TYPES)}"]
+
+KEY_ITEMS = Schema(
+    "key_items",
+    '[{ "type": "mcq_single|true_false|short_text|text", "prompt": string, '
+    '"options": [{ "id": "a", "text": string }], "expected_answer": string }]',
+    root=list,
+    check=_key_items_check,
+)
+
+def _structure_page_with_llm(page, text):
+    """Model fallback for a page key_parser couldn't read; its items are always flagged for review."""
+    reply = _together_chat({
+        "model": MODEL_NAME,
+        "messages": [{"role": "user", "content": (
+            "Convert this exam page into a JSON array of questions, in order. Use an empty "
+            "expected_answer when the page doesn't show the answer.\n"
+            f"Return only JSON of this shape:\n{KEY_ITEMS.example}\n\nPage:\n{text}"
+        )}],
+        "temperature": 0.0,
+        "max_tokens": 2000,
+    })
+    items = []
+    for it in extract(reply, KEY_ITEMS):
+        item = {"question_id": "", "type": it["type"], "prompt": str(it.get("prompt") or ""),
+                "expected_answer": it.get("expected_answer") if it.get("expected_answer") is not None else "",
+                "section": None, "page": page, "review": True, "source": "model"}
+        if isinstance(it.get("options"), list):
+            item["options"] = [o for o in it["options"] if isinstance(o, dict)]
+        items.append(item)
+    return items
+
+def build_answer_key(full_text, llm_fallback=True):
+    items, unparsed = parse_exam_text(full_text)
+    extra, failed = [], []
+    if llm_fallback and unparsed:
+        texts = page_texts(full_text)
+        for page in unparsed:
+            try:
+                extra += _structure_page_with_llm(page, texts.get(page, ""))
+            except (StructuredOutputError, requests.exceptions.RequestException):
+                failed.append(page)
+    items = merge(items, extra)
+    return {
+        "answer_key": for_grading(items),
+        "items": items,
+        "needs_review": sum(1 for it in items if it.get("review")),
+        "unparsed_pages": failed if llm_fallback else unparsed,
+    }
+
+def _page_layout(image_bytes):
+    # a page that isn't a decodable image still gets its text; it just can't be tiled later
+    try:
+        return build_template(image_bytes)
+    except Exception:
+        return None
+
+def _extract_page(page, filename, image_bytes, key_mode=False, engine=None):
+    t0 = time.perf_counter()
+    text, used = extract_text_from_image(image_bytes, key_mode, engine)
+    layout = _page_layout(image_bytes)
+    if layout:
+        layout["numbers_contiguous"] = numbers_contiguous(text)
+    return {"page": page, "filename": filename, "text": text, "engine": used, "layout": layout,
+            "wall_s": round(time.perf_counter() - t0, 3)}
+
+def _page_meta(row):
+    """What /api/submit-answer-key stores per page (exam.pages[i])."""
+    return {"index": row["page"], "filename": row["filename"], "layout": row.get("layout")}
+
+def _ndjson(obj) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+def _stream_pages(pages):
+    """One NDJSON line per page as soon as its OCR finishes (not in page order), then a summary line.
+
+    Only the page in flight is held; nothing is accumulated across pages.
+    """
+    futures = {_EXTRACT_POOL.submit(_extract_page, *p): p[0] for p in pages}
+    pages.clear()
+    failed = 0
+    try:
+        yield _ndjson({"event": "start", "pages": len(futures)})
+        for fut in as_completed(futures):
+            try:
+                row = fut.result()
+            except Exception as e:
+                failed += 1
+                row = {"page": futures[fut], "error": str(e)}
+            yield _ndjson({"event": "page", **row})
+        yield _ndjson({"event": "done", "pages": len(futures), "failed": failed})
+    finally:
+        for fut in futures:  # client went away: don't OCR pages nobody will read
+            fut.cancel()
+
+def _ocr_choice():
+    """?ocr=remote|local|auto; None means the OCR_ENGINE default."""
+    v = (request.args.get("ocr") or "").lower() or None
+    if v not in (None, "auto", "remote", "local"):
+        raise ValueError("ocr must be one of auto, remote, local")
+    return v
+
+def _wants_stream() -> bool:
+    return (request.args.get("stream") or "").lower() in ("1", "true", "ndjson") \
+        or "application/x-ndjson" in (request.headers.get("Accept") or "")
+
 @app.route("/extract", methods=["POST"])
 def extract_text():
+    """OCR every uploaded page.
+
+    Default: one JSON body {"text": ..., "pages": [...]} once all pages are done.
+    ?stream=ndjson (or Accept: application/x-ndjson): a line per page as it finishes.
+    ?ocr=local reads pages with Tesseract; auto (default) falls back to it when the provider fails.
+    """
     if "files" not in request.files:
         return jsonify({"error": "No files part in the request"}), 400
 
     uploaded_files = request.files.getlist("files")
     if not uploaded_files or all(f.filename == "" for f in uploaded_files):
         return jsonify({"error": "No files selected"}), 400
+    try:
+        ocr = _ocr_choice()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    pages = [(idx + 1, f.filename, f.read(), False, ocr) for idx, f in enumerate(uploaded_files)]
+    if _wants_stream():
+        return Response(
+            stream_with_context(_stream_pages(pages)),
+            mimetype="application/x-ndjson",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    try:
+        futures = [_EXTRACT_POOL.submit(_extract_page, *p) for p in pages]
+        full_text, meta = "", []
+        for fut in futures:
+            row = fut.result()
+            full_text += f"🖼️ Page {row['page']} ({row['filename']})\n{row['text']}\n\n"
+            meta.append(_page_meta(row))
+
+        return jsonify({"text": full_text, "pages": meta})
+    except OcrUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except requests.exceptions.RequestException as e:
+        return jsonify({"error": str(e)}), 500
+    except Exception as e:
+        return jsonify({"error": f"Extraction failed: {str(e)}"}), 500
+
+@app.route("/extract-key", methods=["POST"])
+def extract_key():
+    """OCR the pages in answer-key mode and return the answer_key already structured.
+
+    ?llm_fallback=0 skips the model for pages the local parser can't read; ?ocr= as for /extract.
+    """
+    if "files" not in request.files:
+        return jsonify({"error": "No files part in the request"}), 400
 
-    full_text = ""
+    uploaded_files = request.files.getlist("files")
+    if not uploaded_files or all(f.filename == "" for f in uploaded_files):
+        return jsonify({"error": "No files selected"}), 400
     try:
-        for idx, file in enumerate(uploaded_files):
-            image_bytes = file.read()
-            extracted = extract_text_from_image(image_bytes)
-            full_text += f"🖼️ Page {idx + 1} ({file.filename})\n{extracted}\n\n"
+        ocr = _ocr_choice()
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
 
-        return jsonify({"text": full_text})
+    pages = [(idx + 1, f.filename, f.read(), True, ocr) for idx, f in enumerate(uploaded_files)]
+    try:
+        futures = [_EXTRACT_POOL.submit(_extract_page, *p) for p in pages]
+        full_text, meta = "", []
+        for fut in futures:
+            row = fut.result()
+            full_text += f"🖼️ Page {row['page']} ({row['filename']})\n{row['text']}\n\n"
+            meta.append(_page_meta(row))
+        result = build_answer_key(full_text, request.args.get("llm_fallback", "1") not in ("0", "false"))
+        return jsonify({**result, "text": full_text, "pages": meta})
+    except OcrUnavailable as e:
+        return jsonify({"error": str(e)}), 503
     except requests.exceptions.RequestException as e:
         return jsonify({"error": str(e)}), 500
     except Exception as e:
         return jsonify({"error": f"Extraction failed: {str(e)}"}), 500
 
+@app.route("/api/structure-key", methods=["POST"])
+def structure_key():
+    """Structures text already returned by /extract, without OCR'ing the pages again."""
+    data = request.get_json(silent=True) or {}
+    text = data.get("text") or ""
+    if not text.strip():
+        return jsonify({"error": "Missing text"}), 400
+    return jsonify(build_answer_key(text, bool(data.get("llm_fallback", True))))
+
 @app.route("/api/submit-answer-key", methods=["POST"])
 def submit_answer_key():
     tok = _bearer()
@@ -150,20 +333,11 @@ def submit_answer_key():
     if not title or not answer_key:
         return jsonify({"error": "Missing title or answer_key"}), 400
 
-    owner_oid = ObjectId(user["sub"])
-
-    doc = {
-        "title": title,
-        "answer_key": answer_key,
-        "pages": data.get("pages") or [],
-        "stats": {"submissions": 0},
-        "created_by": owner_oid,
-        "created_at": datetime.utcnow(),
-        "updated_at": datetime.utcnow(),
-    }
+    owner_oid = dal.as_oid(user.get("sub"))
+    if not owner_oid:
+        return jsonify({"error": "invalid user id"}), 400
 
-    ins = exams_collection.insert_one(doc)
-    doc["_id"] = ins.inserted_id
+    doc = dal.insert_exam(title, answer_key, data.get("pages"), owner_oid)
 
     return jsonify({
         "message": "✅ Correction key saved!",
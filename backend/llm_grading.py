@@ -0,0 +1,118 @@
+# llm_grading.py — prompts and response parsing for LLM grading (no I/O)
+#
+# student.py makes the OpenRouter calls; bench/grade_batch.py drives the same
+# prompts against the mock server. Each prompt is (answer key, instructions)
+# followed by the per-submission part, so everything up to the student's answers
+# is a byte-identical prefix for one exam and provider-side prompt caching applies.
+import json
+import math
+import hashlib
+
+from structured_output import Schema, NUMBER, StructuredOutputError, extract
+
+# Bump whenever a prompt or parser changes: it is part of every cache key.
+PROMPT_VERSION = "3"
+
+BATCH_MARKER = "Student Submissions (keyed by submission id):\n"
+
+def canonical(obj) -> str:
+    return json.dumps(obj, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+
+def cache_key(mode: str, model: str, temperature: float, *inputs) -> str:
+    """Hash of everything that determines a grading reply; equal hashes may reuse the stored reply."""
+    return hashlib.sha256(canonical([PROMPT_VERSION, mode, model, float(temperature), *inputs]).encode("utf-8")).hexdigest()
+
+def key_prefix(answer_key) -> str:
+    # sort_keys: the same key stored by different writers still renders identically
+    return f"Exam Answer Key:\n{json.dumps(answer_key, indent=2, sort_keys=True, ensure_ascii=False)}\n\n"
+
+# ---------- Whole-submission grading ----------
+def single_prompt(answer_key, answers: dict) -> str:
+    return (
+        key_prefix(answer_key)
+        + "Grade out of 20 and provide feedback for the student submission below.\n"
+        + 'Return only: { "score": number, "feedback": string }\n\n'
+        + f"Student Submission:\n{json.dumps(answers, indent=2)}"
+    )
+
+def batch_prompt(answer_key, batch: dict) -> str:
+    """batch maps submission id -> normalized answers."""
+    return (
+        key_prefix(answer_key)
+        + "Grade each student submission below independently out of 20 and provide feedback for each.\n"
+        + 'Return only: { "results": { "<submission id>": { "score": number, "feedback": string } } }\n\n'
+        + BATCH_MARKER
+        + json.dumps(batch, indent=2)
+    )
+
+def _score_in_range(v):
+    s = v.get("score")
+    return [] if math.isfinite(s) and 0.0 <= s <= 20.0 else ["'score' must be between 0 and 20"]
+
+GRADE = Schema("grade", '{ "score": number, "feedback": string }',
+               required={"score": NUMBER}, optional={"feedback": str}, check=_score_in_range)
+BATCH_GRADE = Schema("batch_grade", '{ "results": { "<submission id>": { "score": number, "feedback": string } } }',
+                     optional={"results": dict})
+FREE_TEXT = Schema("free_text", '{ "grades": [{ "id": string, "awarded": number }], "feedback": string }',
+                   required={"grades": list}, optional={"feedback": str})
+
+def _valid_result(r):
+    if not isinstance(r, dict):
+        return None
+    try:
+        score = float(r.get("score"))
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(score) or not 0.0 <= score <= 20.0:
+        return None
+    return {"score": score, "feedback": str(r.get("feedback") or "")}
+
+def parse_single(content: str) -> dict:
+    return _valid_result(extract(content, GRADE))
+
+def split_batch(content: str, ids):
+    """Returns ({submission id: result}, [ids that need single grading])."""
+    try:
+        data = extract(content, BATCH_GRADE)
+    except StructuredOutputError:
+        return {}, list(ids)
+    table = data.get("results", data)  # some models drop the wrapper
+    results, missing = {}, []
+    for sid in ids:
+        r = _valid_result(table.get(sid))
+        if r is None:
+            missing.append(sid)
+        else:
+            results[sid] = r
+    return results, missing
+
+# ---------- Free-text leaves (hybrid grading) ----------
+def free_text_prompt(pending: dict):
+    """pending maps leaf id -> leaf (grading.free_text_leaves). Returns (prompt, short ids)."""
+    ids, items = {}, []
+    for i, (lid, leaf) in enumerate(pending.items(), 1):
+        ids[f"L{i}"] = (lid, float(leaf["points"]))
+        items.append({"id": f"L{i}", "expected": leaf["expected"], "student": leaf["student"],
+                      "max_points": leaf["points"]})
+    prompt = (
+        "Grade each student answer against its expected answer. Accept answers with the same meaning; "
+        "award partial credit in steps of 0.25, never above max_points.\n"
+        'Return only: { "grades": [{ "id": string, "awarded": number }], "feedback": string }\n\n'
+        f"Answers:\n{json.dumps(items, ensure_ascii=False, default=str)}"
+    )
+    return prompt, ids
+
+def parse_free_text(content: str, ids: dict):
+    """Returns ({leaf id: awarded}, feedback); awards snap to 0.25 and clamp to the leaf's points."""
+    result = extract(content, FREE_TEXT)
+    awards = {}
+    for g in result.get("grades") or []:
+        if not isinstance(g, dict) or g.get("id") not in ids:
+            continue
+        lid, pts = ids[g["id"]]
+        try:
+            awarded = round(float(g.get("awarded") or 0) * 4) / 4.0
+        except (TypeError, ValueError):
+            continue
+        awards[lid] = max(0.0, min(pts, awarded))
+    return awards, str(result.get("feedback") or "").strip()
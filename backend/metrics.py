@@ -0,0 +1,210 @@
+# metrics.py — request / Mongo / LLM instrumentation exposed as Prometheus text on /metrics
+#
+#   from metrics import init_metrics, MONGO_LISTENER, observe_llm
+#   client = MongoClient(uri, event_listeners=[MONGO_LISTENER])
+#   init_metrics(app, "corrector")
+#   with observe_llm("openrouter", model) as call:
+#       resp = requests.post(...); call.usage(resp.json().get("usage"))
+import os
+import time
+import threading
+from contextlib import contextmanager
+from flask import Response, request, g
+from pymongo import monitoring
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+LLM_BUCKETS = (0.25, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+_LOCK = threading.Lock()
+_SERVICE = {"name": os.getenv("SERVICE_NAME", "backend")}
+
+def _labels(d: dict) -> str:
+    if not d:
+        return ""
+    inner = ",".join('{}="{}"'.format(k, str(v).replace("\\", "\\\\").replace('"', '\\"')) for k, v in sorted(d.items()))
+    return "{" + inner + "}"
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.buckets = name, help_text, buckets
+        self.series = {}  # label tuple -> [bucket counts..., sum, count]
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with _LOCK:
+            row = self.series.setdefault(key, [0] * len(self.buckets) + [0.0, 0])
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    row[i] += 1
+            row[-2] += value
+            row[-1] += 1
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with _LOCK:
+            items = [(dict(k), list(v)) for k, v in self.series.items()]
+        for labels, row in items:
+            for i, b in enumerate(self.buckets):
+                out.append(f"{self.name}_bucket{_labels({**labels, 'le': b})} {row[i]}")
+            out.append(f"{self.name}_bucket{_labels({**labels, 'le': '+Inf'})} {row[-1]}")
+            out.append(f"{self.name}_sum{_labels(labels)} {row[-2]:.6f}")
+            out.append(f"{self.name}_count{_labels(labels)} {row[-1]}")
+        return out
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help_text):
+        self.name, self.help = name, help_text
+        self.series = {}
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with _LOCK:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def render(self):
+        out = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with _LOCK:
+            items = list(self.series.items())
+        out += [f"{self.name}{_labels(dict(k))} {v}" for k, v in items]
+        return out
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+HTTP_LATENCY = Histogram("http_request_duration_seconds", "Flask request latency by route")
+HTTP_REQUESTS = Counter("http_requests_total", "Requests by route and status")
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "Requests currently being served")
+MONGO_LATENCY = Histogram("mongo_command_duration_seconds", "MongoDB command latency by collection/command")
+MONGO_FAILURES = Counter("mongo_command_failures_total", "Failed MongoDB commands")
+LLM_LATENCY = Histogram("llm_call_duration_seconds", "Outbound LLM call latency", LLM_BUCKETS)
+LLM_TOKENS = Counter("llm_tokens_total", "LLM tokens by provider/model/kind")
+LLM_ERRORS = Counter("llm_call_errors_total", "Failed outbound LLM calls")
+OCR_PAGES = Counter("ocr_pages_total", "Pages OCR'd by engine, and whether it was a fallback")
+CACHE_EVENTS = Counter("cache_bus_events_total", "Cache invalidation events by collection and source")
+
+_REGISTRY = [HTTP_LATENCY, HTTP_REQUESTS, HTTP_IN_FLIGHT, MONGO_LATENCY, MONGO_FAILURES,
+             LLM_LATENCY, LLM_TOKENS, LLM_ERRORS, OCR_PAGES, CACHE_EVENTS]
+
+# ---------- MongoDB ----------
+class _MongoCommandTimer(monitoring.CommandListener):
+    def __init__(self):
+        self._pending = {}
+
+    def started(self, event):
+        coll = event.command.get(event.command_name)
+        self._pending[(event.connection_id, event.request_id)] = coll if isinstance(coll, str) else ""
+
+    def _finish(self, event, failed):
+        coll = self._pending.pop((event.connection_id, event.request_id), "")
+        labels = {"command": event.command_name, "collection": coll, "service": _SERVICE["name"]}
+        MONGO_LATENCY.observe(event.duration_micros / 1e6, **labels)
+        if failed:
+            MONGO_FAILURES.inc(**labels)
+        if request_started():
+            g.mongo_seconds = getattr(g, "mongo_seconds", 0.0) + event.duration_micros / 1e6
+
+    def succeeded(self, event):
+        self._finish(event, False)
+
+    def failed(self, event):
+        self._finish(event, True)
+
+MONGO_LISTENER = _MongoCommandTimer()
+
+# ---------- LLM calls ----------
+class _LLMCall:
+    def __init__(self, provider, model):
+        self.labels = {"provider": provider, "model": model, "service": _SERVICE["name"]}
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cached_tokens = 0
+        self.seconds = 0.0
+
+    def usage(self, usage):
+        """Accepts an OpenAI-style usage dict or an SDK usage object."""
+        if not usage:
+            return
+        get = usage.get if isinstance(usage, dict) else (lambda k, d=None: getattr(usage, k, d))
+        self.prompt_tokens = int(get("prompt_tokens", 0) or 0)
+        self.completion_tokens = int(get("completion_tokens", 0) or 0)
+        # prompt tokens the provider served from its prefix cache, when reported
+        details = get("prompt_tokens_details") or {}
+        cached = details.get("cached_tokens") if isinstance(details, dict) else getattr(details, "cached_tokens", 0)
+        self.cached_tokens = int(cached or 0)
+        LLM_TOKENS.inc(self.prompt_tokens, kind="prompt", **self.labels)
+        LLM_TOKENS.inc(self.completion_tokens, kind="completion", **self.labels)
+        if self.cached_tokens:
+            LLM_TOKENS.inc(self.cached_tokens, kind="cached_prompt", **self.labels)
+
+@contextmanager
+def observe_llm(provider, model):
+    call = _LLMCall(provider, model)
+    t0 = time.perf_counter()
+    try:
+        yield call
+    except Exception:
+        LLM_ERRORS.inc(**call.labels)
+        raise
+    finally:
+        call.seconds = time.perf_counter() - t0
+        LLM_LATENCY.observe(call.seconds, **call.labels)
+
+# ---------- Flask ----------
+def request_started() -> bool:
+    try:
+        return "req_started" in g
+    except RuntimeError:  # outside an app/request context
+        return False
+
+def render_metrics() -> str:
+    lines = []
+    for m in _REGISTRY:
+        lines += m.render()
+    try:
+        from auth import auth_cache_stats
+        st = auth_cache_stats()
+        lines += [
+            "# TYPE jwt_cache_hits_total counter", f"jwt_cache_hits_total {st['hits']}",
+            "# TYPE jwt_cache_misses_total counter", f"jwt_cache_misses_total {st['misses']}",
+            "# TYPE jwt_verify_failures_total counter", f"jwt_verify_failures_total {st['failures']}",
+            "# TYPE jwt_verify_seconds_total counter", f"jwt_verify_seconds_total {st['verify_seconds']:.6f}",
+            "# TYPE jwt_cache_size gauge", f"jwt_cache_size {st['size']}",
+        ]
+    except ImportError:
+        pass
+    return "\n".join(lines) + "\n"
+
+def init_metrics(app, service_name: str):
+    _SERVICE["name"] = service_name
+
+    @app.before_request
+    def _metrics_start():
+        g.req_started = time.perf_counter()
+        g.mongo_seconds = 0.0
+        HTTP_IN_FLIGHT.inc(service=service_name)
+
+    @app.after_request
+    def _metrics_record(resp):
+        if "req_started" in g:
+            route = request.url_rule.rule if request.url_rule else "<unmatched>"
+            elapsed = time.perf_counter() - g.req_started
+            HTTP_LATENCY.observe(elapsed, route=route, method=request.method, service=service_name)
+            HTTP_REQUESTS.inc(route=route, method=request.method, status=resp.status_code, service=service_name)
+            resp.headers["Server-Timing"] = f"app;dur={elapsed * 1000:.1f}, db;dur={g.mongo_seconds * 1000:.1f}"
+        return resp
+
+    @app.teardown_request
+    def _metrics_done(_exc=None):
+        if "req_started" in g:
+            HTTP_IN_FLIGHT.dec(service=service_name)
+
+    @app.get("/metrics")
+    def metrics():
+        return Response(render_metrics(), mimetype="text/plain; version=0.0.4")
+
+    return app
@@ -0,0 +1,46 @@
+# migrate_created_by.py — one-time normalization of ownership fields
+#
+#   python migrate_created_by.py [--orphans-to <user_id>] [--dry-run]
+#
+# 1. exams.created_by stored as a hex string  -> ObjectId
+# 2. exams with no created_by                 -> --orphans-to owner (else reported and left admin-only)
+# 3. submissions.created_by                   <- owning exam's created_by
+import argparse
+from bson import ObjectId
+from mongo import exams_collection, submissions_collection
+
+HEX_OID = {"$type": "string", "$regex": r"^[0-9a-fA-F]{24}$"}
+
+def migrate(orphans_to=None, dry_run=False):
+    report = {}
+
+    q = {"created_by": HEX_OID}
+    report["exams_string_owner"] = exams_collection.count_documents(q)
+    if not dry_run and report["exams_string_owner"]:
+        exams_collection.update_many(q, [{"$set": {"created_by": {"$toObjectId": "$created_by"}}}])
+
+    q = {"$or": [{"created_by": {"$exists": False}}, {"created_by": None}]}
+    report["exams_orphaned"] = exams_collection.count_documents(q)
+    if orphans_to and not dry_run and report["exams_orphaned"]:
+        exams_collection.update_many(q, {"$set": {"created_by": ObjectId(orphans_to)}})
+
+    backfilled = 0
+    for exam in exams_collection.find({"created_by": {"$type": "objectId"}}, {"created_by": 1}):
+        q = {"exam_id": exam["_id"], "created_by": {"$ne": exam["created_by"]}}
+        if dry_run:
+            backfilled += submissions_collection.count_documents(q)
+        else:
+            backfilled += submissions_collection.update_many(q, {"$set": {"created_by": exam["created_by"]}}).modified_count
+    report["submissions_backfilled"] = backfilled
+    report["exams_invalid_owner"] = exams_collection.count_documents(
+        {"created_by": {"$exists": True, "$not": {"$type": "objectId"}}}
+    )
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Normalize created_by to ObjectId on exams and submissions")
+    ap.add_argument("--orphans-to", help="user id that should own exams without created_by")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    for k, v in migrate(args.orphans_to, args.dry_run).items():
+        print(f"{k}: {v}")
@@ -0,0 +1,32 @@
+# migrate_exam_summary.py — one-time backfill of the exam listing fields
+#
+#   python migrate_exam_summary.py [--dry-run]
+#
+# exams.has_key / exams.pages_count are written with answer_key / pages
+# (data_access.summary_fields) so GET /api/exams projects neither array. Exams saved
+# before then are backfilled server-side in one update; until this runs the listing
+# reads their arrays in a second, smaller query.
+import argparse
+from mongo import exams_collection
+
+MISSING = {"$or": [{"has_key": {"$exists": False}}, {"pages_count": {"$exists": False}}]}
+
+def _size(field):
+    return {"$cond": [{"$isArray": f"${field}"}, {"$size": f"${field}"}, 0]}
+
+def migrate(dry_run=False):
+    report = {"exams_missing_summary": exams_collection.count_documents(MISSING)}
+    if not dry_run and report["exams_missing_summary"]:
+        res = exams_collection.update_many(MISSING, [{"$set": {
+            "has_key": {"$gt": [_size("answer_key"), 0]},
+            "pages_count": _size("pages"),
+        }}])
+        report["exams_backfilled"] = res.modified_count
+    return report
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Backfill has_key / pages_count on exams")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+    for k, v in migrate(args.dry_run).items():
+        print(f"{k}: {v}")
@@ -1,13 +1,14 @@
-from pymongo import MongoClient, DESCENDING
+from pymongo import MongoClient, ASCENDING, DESCENDING
 from dotenv import load_dotenv
 import os
+from metrics import MONGO_LISTENER
 
 # Load environment variables (safe to call multiple times)
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 
-client = MongoClient(MONGO_URI)
+client = MongoClient(MONGO_URI, event_listeners=[MONGO_LISTENER])
 db = client["exam_system"]
 
 # Collections
@@ -21,5 +22,25 @@ courses_collection = db["courses"]
 users_collection.create_index("email", unique=True)
 submissions_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
 exams_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+# Tenant-scoped listings: single range on created_by, already in sort order
+exams_collection.create_index([("created_by", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+submissions_collection.create_index([("created_by", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+# Listing ETag (data_access.exams_version): latest updated_at per owner
+exams_collection.create_index([("created_by", ASCENDING), ("updated_at", DESCENDING)])
+submissions_collection.create_index([("exam_id", ASCENDING), ("created_at", DESCENDING), ("_id", DESCENDING)])
+# Ingestion dedup (submission_dedup.py): one submission per student per exam, and an
+# LSH lookup for similar answer sets. Partial, so submissions saved before these fields
+# existed are left out rather than colliding on a missing identity.
+submissions_collection.create_index(
+    [("exam_id", ASCENDING), ("identity", ASCENDING)], unique=True,
+    partialFilterExpression={"identity": {"$type": "string"}},
+)
+submissions_collection.create_index(
+    [("exam_id", ASCENDING), ("sim_bands", ASCENDING)],
+    partialFilterExpression={"minhash": {"$type": "array"}},
+)
 course_materials_collection.create_index([("created_at", DESCENDING), ("_id", DESCENDING)])
+# cache_bus.py polling fallback (standalone mongod): recent writes by timestamp
+exams_collection.create_index("updated_at")
+courses_collection.create_index("uploaded_at")
 courses_collection.create_index("user_id")
\ No newline at end of file
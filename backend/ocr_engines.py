@@ -0,0 +1,157 @@
+# ocr_engines.py — page OCR behind one interface: remote vision model or local Tesseract
+#
+#   OCR = OcrRouter(RemoteVisionEngine(endpoint, api_key, model), TesseractEngine())
+#   text, engine, call = OCR.read(image_bytes, system, instruction, engine=request.args.get("ocr"))
+#
+# engine is "remote", "local" or "auto" (OCR_ENGINE, default "auto"). In auto mode the
+# remote model is tried first; if it is unreachable, times out, or answers 429/5xx, the
+# page is read locally and the remote is skipped for a cooldown (Retry-After when the
+# provider sends one) so the rest of an upload doesn't wait on it. The local engine
+# returns plain text and ignores the prompts: callers parse it with key_parser.
+import io
+import os
+import base64
+import threading
+import time
+import requests
+from PIL import Image, ImageOps
+
+from metrics import observe_llm, OCR_PAGES
+
+try:
+    import pytesseract
+except ImportError:  # optional: without it only the remote engine is available
+    pytesseract = None
+
+OCR_ENGINE = os.getenv("OCR_ENGINE", "auto").lower()
+OCR_FALLBACK = os.getenv("OCR_FALLBACK", "1").lower() not in ("0", "false", "no")
+OCR_REMOTE_COOLDOWN_S = float(os.getenv("OCR_REMOTE_COOLDOWN_S", "30"))
+OCR_LOCAL_LANG = os.getenv("OCR_LOCAL_LANG", "eng")
+OCR_LOCAL_CONFIG = os.getenv("OCR_LOCAL_CONFIG", "--oem 1 --psm 4")  # LSTM, single column of variable-size text
+OCR_LOCAL_MIN_WIDTH = 1600  # Tesseract is tuned for ~300 dpi; phone photos of A4 are often smaller
+
+class OcrUnavailable(RuntimeError):
+    """The engine can't serve right now (not installed, provider down or rate limited)."""
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+class RemoteVisionEngine:
+    name = "remote"
+
+    def __init__(self, endpoint, api_key, model, temperature=0.2, top_p=0.8, timeout=60):
+        self.endpoint, self.api_key, self.model = endpoint, api_key, model
+        self.temperature, self.top_p, self.timeout = temperature, top_p, timeout
+
+    def available(self) -> bool:
+        return bool(self.api_key)
+
+    def read(self, image_bytes, system, instruction, max_tokens=2000):
+        """Returns (text, metrics call); OcrUnavailable for failures worth falling back on."""
+        payload = {
+            "model": self.model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": [
+                    {"type": "text", "text": instruction},
+                    {"type": "image_url", "image_url": {
+                        "url": f"data:image/jpeg;base64,{base64.b64encode(image_bytes).decode('utf-8')}"}},
+                ]},
+            ],
+            "temperature": self.temperature,
+            "max_tokens": max_tokens,
+            "top_p": self.top_p,
+        }
+        headers = {"Authorization": f"Bearer {self.api_key}", "Content-Type": "application/json"}
+        try:
+            with observe_llm("together", self.model) as call:
+                resp = requests.post(self.endpoint, headers=headers, json=payload, timeout=self.timeout)
+                resp.raise_for_status()
+                body = resp.json()
+                call.usage(body.get("usage"))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            raise OcrUnavailable(f"remote OCR unreachable: {e}") from e
+        except requests.exceptions.HTTPError as e:
+            status = e.response.status_code if e.response is not None else 0
+            if status == 429 or status >= 500:
+                raise OcrUnavailable(f"remote OCR returned {status}", _retry_after(e.response)) from e
+            raise
+        return body["choices"][0]["message"]["content"].strip(), call
+
+def _retry_after(resp):
+    try:
+        return min(float(resp.headers.get("Retry-After")), 600.0)
+    except (AttributeError, TypeError, ValueError):
+        return None
+
+class TesseractEngine:
+    name = "local"
+
+    def __init__(self, lang=OCR_LOCAL_LANG, config=OCR_LOCAL_CONFIG):
+        self.lang, self.config = lang, config
+        self._ok = None
+
+    def available(self) -> bool:
+        if self._ok is None:
+            try:
+                self._ok = pytesseract is not None and bool(pytesseract.get_tesseract_version())
+            except Exception:  # binary missing or not on PATH
+                self._ok = False
+        return self._ok
+
+    def read(self, image_bytes, system=None, instruction=None, max_tokens=None):
+        if not self.available():
+            raise OcrUnavailable("local OCR needs pytesseract and the tesseract binary")
+        text = pytesseract.image_to_string(prepare(image_bytes), lang=self.lang, config=self.config)
+        return text.strip(), None
+
+def prepare(image_bytes: bytes) -> Image.Image:
+    """Upright, grayscale, contrast-stretched and upscaled to a resolution Tesseract reads well."""
+    img = ImageOps.exif_transpose(Image.open(io.BytesIO(image_bytes))).convert("L")
+    if img.width < OCR_LOCAL_MIN_WIDTH:
+        f = OCR_LOCAL_MIN_WIDTH / img.width
+        img = img.resize((OCR_LOCAL_MIN_WIDTH, int(img.height * f)), Image.LANCZOS)
+    return ImageOps.autocontrast(img, cutoff=1)
+
+class OcrRouter:
+    def __init__(self, remote, local, default=OCR_ENGINE, fallback=OCR_FALLBACK):
+        self.remote, self.local = remote, local
+        self.default, self.fallback = default, fallback
+        self._remote_down_until = 0.0
+        self._lock = threading.Lock()
+
+    def _mode(self, requested):
+        return (requested or self.default or "auto").lower()
+
+    def engines(self, requested=None):
+        """Engines to try, in order, for a request's ?ocr= value."""
+        mode = self._mode(requested)
+        if mode == "local":
+            return [self.local]
+        if mode == "remote":
+            return [self.remote]
+        order = [self.remote]
+        if self.fallback and self.local.available():
+            with self._lock:
+                remote_down = time.monotonic() < self._remote_down_until
+            order = [self.local] if remote_down else [self.remote, self.local]
+        return order
+
+    def read(self, image_bytes, system, instruction, max_tokens=2000, engine=None):
+        """Returns (text, engine name, metrics call or None)."""
+        order = self.engines(engine)
+        for i, eng in enumerate(order):
+            try:
+                text, call = eng.read(image_bytes, system, instruction, max_tokens)
+            except OcrUnavailable as e:
+                if eng is self.remote:
+                    with self._lock:
+                        self._remote_down_until = time.monotonic() + (e.retry_after or OCR_REMOTE_COOLDOWN_S)
+                if i == len(order) - 1:
+                    raise
+                continue
+            # a local read in auto mode is a fallback, whether the remote just failed or is cooling down
+            OCR_PAGES.inc(engine=eng.name, fallback=str(eng is self.local and self._mode(engine) == "auto").lower())
+            return text, eng.name, call
+        raise OcrUnavailable("no OCR engine available")
@@ -0,0 +1,173 @@
+# page_layout.py — exam page templates and per-question crops before OCR (Pillow + NumPy, CPU only)
+#
+#   layout = build_template(key_page_bytes)     # at key time; stored on exam.pages[i].layout
+#   tiles = crop_regions(scan_bytes, layout)     # at submission time; None -> send the full page
+#
+# A template is the key page's question bands: runs of ink rows separated by
+# whitespace, grouped into regions at the larger gaps, plus a row-ink profile of
+# the page content. A student scan is deskewed, trimmed to its content box and
+# registered to the template by fitting v = a*u + b between the two profiles, so
+# scans that are shifted, scaled or slightly rotated still crop the right bands.
+import io
+import os
+import numpy as np
+from PIL import Image, ImageOps
+
+LAYOUT_VERSION = 1
+WORK_WIDTH = 800                  # analysis runs on a downscaled grayscale copy
+PROFILE_BINS = 256
+REGION_MIN_FRAC = float(os.getenv("LAYOUT_REGION_MIN_FRAC", "0.08"))   # of content height
+REGION_MAX_FRAC = float(os.getenv("LAYOUT_REGION_MAX_FRAC", "0.35"))
+REGISTER_MIN_CORR = float(os.getenv("LAYOUT_REGISTER_MIN_CORR", "0.55"))
+TILE_PAD_FRAC = 0.015
+TILE_JPEG_QUALITY = 80
+
+def _open(data: bytes) -> Image.Image:
+    img = Image.open(io.BytesIO(data))
+    return ImageOps.exif_transpose(img).convert("L")
+
+def _small(img: Image.Image):
+    scale = WORK_WIDTH / img.width if img.width > WORK_WIDTH else 1.0
+    small = img.resize((max(1, int(img.width * scale)), max(1, int(img.height * scale)))) if scale < 1 else img
+    return np.asarray(small, dtype=np.uint8), scale
+
+def _otsu(gray: np.ndarray) -> int:
+    hist = np.bincount(gray.ravel(), minlength=256).astype(np.float64)
+    total = hist.sum()
+    w0 = np.cumsum(hist)
+    m0 = np.cumsum(hist * np.arange(256))
+    w1 = total - w0
+    with np.errstate(divide="ignore", invalid="ignore"):
+        between = (m0[-1] * w0 / total - m0) ** 2 / (w0 * w1)
+    return int(np.nanargmax(between[:-1])) if total else 128
+
+def _ink(gray: np.ndarray) -> np.ndarray:
+    return gray < _otsu(gray)
+
+def _deskew_angle(gray: np.ndarray, max_deg=3.0, step=0.5) -> float:
+    """Angle whose rotation makes text rows sharpest (max variance of the row-ink profile)."""
+    img = Image.fromarray(gray)
+    best, best_score = 0.0, -1.0
+    for a in np.arange(-max_deg, max_deg + 1e-9, step):
+        rows = _ink(np.asarray(img.rotate(a, fillcolor=255))).sum(axis=1)
+        score = float(rows.var())
+        if score > best_score:
+            best, best_score = float(a), score
+    return best
+
+def _content_box(ink: np.ndarray):
+    """(x0, y0, x1, y1) of rows/columns carrying ink; trims margins and scanner background."""
+    h, w = ink.shape
+    rows = np.flatnonzero(ink.sum(axis=1) > max(1, w * 0.004))
+    cols = np.flatnonzero(ink.sum(axis=0) > max(1, h * 0.004))
+    if rows.size == 0 or cols.size == 0:
+        return 0, 0, w, h
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+def _profile(ink: np.ndarray, box) -> np.ndarray:
+    x0, y0, x1, y1 = box
+    rows = ink[y0:y1, x0:x1].sum(axis=1).astype(np.float64)
+    p = np.interp(np.linspace(0, len(rows) - 1, PROFILE_BINS), np.arange(len(rows)), rows) if len(rows) > 1 \
+        else np.zeros(PROFILE_BINS)
+    sd = p.std()
+    return (p - p.mean()) / sd if sd > 0 else p * 0
+
+def _bands(ink_rows: np.ndarray, thresh: float):
+    """Runs of rows with ink, as (start, end) row indices."""
+    on = ink_rows > thresh
+    edges = np.flatnonzero(np.diff(np.concatenate(([0], on.astype(np.int8), [0]))))
+    return list(zip(edges[::2], edges[1::2]))
+
+def _regions(bands, height):
+    """Groups text bands into question regions, splitting at gaps wider than the typical line gap."""
+    if not bands:
+        return [(0.0, 1.0)]
+    gaps = [b[0] - a[1] for a, b in zip(bands, bands[1:])]
+    split_gap = float(np.median(gaps)) * 1.5 if gaps else 0.0
+    min_h, max_h = REGION_MIN_FRAC * height, REGION_MAX_FRAC * height
+    out, start, end = [], bands[0][0], bands[0][1]
+    for gap, (b0, b1) in zip(gaps, bands[1:]):
+        cur = end - start
+        if (cur >= min_h and gap >= split_gap) or (b1 - start) > max_h:
+            out.append((start, end))
+            start = b0
+        end = b1
+    out.append((start, end))
+    return [(round(a / height, 4), round(b / height, 4)) for a, b in out]
+
+def build_template(data: bytes) -> dict:
+    img = _open(data)
+    gray, _ = _small(img)
+    angle = _deskew_angle(gray)
+    gray = np.asarray(Image.fromarray(gray).rotate(angle, fillcolor=255))
+    ink = _ink(gray)
+    box = _content_box(ink)
+    x0, y0, x1, y1 = box
+    rows = ink[y0:y1, x0:x1].sum(axis=1)
+    bands = _bands(rows, max(1, (x1 - x0) * 0.004))
+    h, w = gray.shape
+    return {
+        "v": LAYOUT_VERSION,
+        "size": [img.width, img.height],
+        "angle": angle,
+        "box": [round(x0 / w, 4), round(y0 / h, 4), round(x1 / w, 4), round(y1 / h, 4)],
+        "regions": _regions(bands, max(1, y1 - y0)),
+        "profile": [round(float(v), 3) for v in _profile(ink, box)],
+    }
+
+def register(template_profile, scan_profile):
+    """Best (a, b, corr) with scan(v) ~ template(u), v = a*u + b, over small scale/offset changes."""
+    t = np.asarray(template_profile, dtype=np.float64)
+    s = np.asarray(scan_profile, dtype=np.float64)
+    u = np.linspace(0, 1, len(t))
+    grid = np.linspace(0, 1, len(s))
+    best = (1.0, 0.0, -1.0)
+    for a in np.linspace(0.9, 1.1, 21):
+        for b in np.linspace(-0.1, 0.1, 41):
+            v = a * u + b
+            inside = (v >= 0) & (v <= 1)
+            if inside.sum() < len(u) * 0.8:
+                continue
+            tv, sv = t[inside], np.interp(v[inside], grid, s)
+            if tv.std() == 0 or sv.std() == 0:
+                continue
+            corr = float(np.corrcoef(tv, sv)[0, 1])
+            if corr > best[2]:
+                best = (float(a), float(b), corr)
+    return best
+
+def crop_regions(data: bytes, layout: dict):
+    """Registers a scan to layout and returns (tiles, corr); tiles is None if it doesn't match.
+
+    Each tile is {"index", "box": [x0, y0, x1, y1] in scan pixels, "jpeg": bytes},
+    one per layout region. A region that maps to a sliver (under 8 px) means the
+    registration is off, so the whole tiling is refused rather than losing that band.
+    """
+    if not layout or layout.get("v") != LAYOUT_VERSION or not layout.get("regions"):
+        return None, 0.0
+    img = _open(data)
+    gray, scale = _small(img)
+    angle = _deskew_angle(gray)
+    gray = np.asarray(Image.fromarray(gray).rotate(angle, fillcolor=255))
+    ink = _ink(gray)
+    box = _content_box(ink)
+    a, b, corr = register(layout["profile"], _profile(ink, box))
+    if corr < REGISTER_MIN_CORR:
+        return None, corr
+
+    full = img.rotate(angle, fillcolor=255) if angle else img
+    x0, y0, x1, y1 = (int(round(c / scale)) for c in box)
+    ch = y1 - y0
+    pad_y = int(TILE_PAD_FRAC * ch)
+    pad_x = int(TILE_PAD_FRAC * (x1 - x0))
+    tiles = []
+    for i, (r0, r1) in enumerate(layout["regions"]):
+        top = max(0, int(y0 + (a * r0 + b) * ch) - pad_y)
+        bottom = min(full.height, int(y0 + (a * r1 + b) * ch) + pad_y)
+        if bottom - top < 8:
+            return None, corr
+        box_px = [max(0, x0 - pad_x), top, min(full.width, x1 + pad_x), bottom]
+        buf = io.BytesIO()
+        full.crop(box_px).save(buf, format="JPEG", quality=TILE_JPEG_QUALITY)
+        tiles.append({"index": i, "box": box_px, "jpeg": buf.getvalue()})
+    return tiles, corr
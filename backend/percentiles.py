@@ -0,0 +1,9 @@
+# percentiles.py — nearest-rank percentile shared by the agent's score tools and bench (no I/O)
+import math
+
+def nearest_rank(sorted_vals, p, default=None):
+    """The smallest value with at least p% of the list at or below it (p in 0..100)."""
+    if not sorted_vals:
+        return default
+    k = max(0, min(len(sorted_vals) - 1, math.ceil(p / 100.0 * len(sorted_vals)) - 1))
+    return sorted_vals[k]
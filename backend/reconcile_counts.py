@@ -0,0 +1,24 @@
+# reconcile_counts.py — recompute exams.stats.submissions from the submissions collection
+#
+#   python reconcile_counts.py [--dry-run] [--every SECONDS]
+#
+# One aggregation finds every exam whose counter disagrees with its submissions
+# (data_access.submission_count_drift); only those exams are updated. With a
+# replica set the counter is kept exact by insert_submission's transaction and
+# this reports nothing; on a standalone mongod, or after manual deletes, run it
+# from cron or as a sidecar with --every.
+import argparse
+import time
+from data_access import reconcile_submission_counts
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Recompute exams.stats.submissions")
+    ap.add_argument("--dry-run", action="store_true")
+    ap.add_argument("--every", type=float, default=0, help="repeat every SECONDS (0: run once)")
+    args = ap.parse_args()
+    while True:
+        report = reconcile_submission_counts(args.dry_run)
+        print(" ".join(f"{k}={v}" for k, v in report.items()), flush=True)
+        if args.every <= 0:
+            break
+        time.sleep(args.every)
@@ -0,0 +1,218 @@
+# structured_output.py — JSON extraction, repair and schema checks for model replies (no I/O)
+#
+#   obj = extract(reply, GRADE)                   # first JSON value in the reply that fits GRADE
+#   scanner = JsonScanner()
+#   for chunk in stream:
+#       for span in scanner.feed(chunk): ...      # complete top-level {...} / [...] spans
+#
+# The scanner tracks bracket depth and string/escape state in one pass over the
+# text, so nested braces, braces inside strings, prose around the JSON and code
+# fences don't matter, and chunk boundaries can fall anywhere. Values that fail
+# json.loads get a cheap local repair (smart quotes, trailing commas, Python
+# literals, truncated tails) before a caller falls back to repair_prompt().
+import json
+import re
+
+_TOKENS = re.compile(r'[{}\[\]"\\]')
+_CLOSER = {"{": "}", "[": "]"}
+
+class StructuredOutputError(ValueError):
+    def __init__(self, message, errors=(), text=""):
+        super().__init__(message)
+        self.errors = list(errors)
+        self.text = text
+
+class JsonScanner:
+    """Incremental balanced-bracket scanner over a stream of text chunks."""
+
+    def __init__(self):
+        self._parts = []    # pieces of the candidate still open at the end of the last chunk
+        self._stack = []
+        self._in_str = False
+        self._escaped_at = -1
+        self._pos = 0       # absolute offset of the current chunk
+
+    def feed(self, chunk: str) -> list:
+        """Returns the top-level spans completed by this chunk, in order."""
+        out = []
+        seg = 0
+        for m in _TOKENS.finditer(chunk):
+            i, ch = m.start(), m.group()
+            if not self._stack:
+                if ch in _CLOSER:
+                    self._stack.append(ch)
+                    self._parts, seg = [], i
+                continue
+            if self._in_str:
+                if self._pos + i == self._escaped_at:
+                    continue
+                if ch == "\\":
+                    self._escaped_at = self._pos + i + 1
+                elif ch == '"':
+                    self._in_str = False
+                continue
+            if ch == '"':
+                self._in_str = True
+            elif ch in _CLOSER:
+                self._stack.append(ch)
+            elif ch == _CLOSER[self._stack[-1]]:
+                self._stack.pop()
+                if not self._stack:
+                    out.append("".join(self._parts) + chunk[seg:i + 1])
+                    self._parts = []
+            elif ch != "\\":
+                # mismatched closer: this wasn't JSON, drop the candidate
+                self._stack, self._parts = [], []
+        if self._stack:
+            self._parts.append(chunk[seg:])
+        self._pos += len(chunk)
+        return out
+
+    def pending(self) -> str:
+        """The unfinished candidate, e.g. the tail of a reply cut off by max_tokens."""
+        return "".join(self._parts) if self._stack else ""
+
+# ---------- Repair ----------
+_SMART = str.maketrans({"“": '"', "”": '"', "‘": "'", "’": "'"})
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_PY_LITERALS = re.compile(r"(?<![\w\"])(True|False|None)(?![\w\"])")
+
+def _close_truncated(s: str) -> str:
+    stack, in_str, esc = [], False, False
+    for ch in s:
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in _CLOSER:
+            stack.append(ch)
+        elif ch in "}]" and stack:
+            stack.pop()
+    if in_str:
+        s += '"'
+    s = re.sub(r"[,:\s]+$", "", s)
+    return s + "".join(_CLOSER[c] for c in reversed(stack))
+
+def repair(s: str) -> str:
+    s = s.translate(_SMART)
+    if '"' not in s:
+        s = s.replace("'", '"')
+    s = _PY_LITERALS.sub(lambda m: {"True": "true", "False": "false", "None": "null"}[m.group(1)], s)
+    s = _close_truncated(s)
+    return _TRAILING_COMMA.sub(r"\1", s)
+
+def loads_lenient(s: str):
+    """json.loads, then one repaired attempt. Returns (value, repaired)."""
+    try:
+        return json.loads(s), False
+    except ValueError:
+        return json.loads(repair(s)), True
+
+def values(text: str, max_restarts: int = 8) -> list:
+    """Every JSON value found in text, in order; a truncated tail is repaired and included.
+
+    If nothing parses, scanning restarts after each of the first max_restarts
+    opening brackets, which recovers JSON preceded by a stray "{" in prose.
+    """
+    text = text or ""
+    stripped = text.strip()
+    if stripped[:1] in ("{", "["):  # fast path: the whole reply is one clean value
+        try:
+            return [json.loads(stripped)]
+        except ValueError:
+            pass
+    for _ in range(max_restarts + 1):
+        sc = JsonScanner()
+        spans = sc.feed(text)
+        tail = sc.pending()
+        out = []
+        for span in spans + ([tail] if tail else []):
+            try:
+                out.append(loads_lenient(span)[0])
+            except ValueError:
+                pass
+        if out:
+            return out
+        m = re.search(r"[{\[]", text)
+        if not m:
+            break
+        text = text[m.start() + 1:]
+    return []
+
+# ---------- Schemas ----------
+class Schema:
+    """Declarative shape of one reply type: root type, required/optional field types, extra check."""
+
+    def __init__(self, name, example, required=None, optional=None, root=dict, check=None):
+        self.name, self.example = name, example
+        self.required, self.optional = required or {}, optional or {}
+        self.root, self.check = root, check
+
+    @staticmethod
+    def _is(v, types):
+        types = types if isinstance(types, tuple) else (types,)
+        if isinstance(v, bool) and bool not in types:
+            return False
+        return isinstance(v, types)
+
+    def errors(self, value) -> list:
+        if not isinstance(value, self.root):
+            return [f"expected a JSON {'object' if self.root is dict else 'array'}"]
+        errs = []
+        if self.root is dict:
+            for k, t in self.required.items():
+                if k not in value:
+                    errs.append(f"missing '{k}'")
+                elif not self._is(value[k], t):
+                    errs.append(f"'{k}' has the wrong type")
+            for k, t in self.optional.items():
+                if value.get(k) is not None and not self._is(value[k], t):
+                    errs.append(f"'{k}' has the wrong type")
+        if not errs and self.check:
+            errs += self.check(value)
+        return errs
+
+NUMBER = (int, float)
+
+def extract(text: str, schema: Schema = None):
+    """First value in text that satisfies schema (any value when schema is None)."""
+    found = values(text)
+    if not found:
+        raise StructuredOutputError("no JSON value found", ["no JSON value found"], text)
+    if schema is None:
+        return found[0]
+    first_errors = None
+    for v in found:
+        errs = schema.errors(v)
+        if not errs:
+            return v
+        first_errors = first_errors or errs
+    raise StructuredOutputError(f"reply does not match {schema.name}: {'; '.join(first_errors)}", first_errors, text)
+
+def extract_stream(chunks, schema: Schema = None):
+    """Like extract() over an iterable of chunks, returning as soon as a fitting value completes."""
+    sc = JsonScanner()
+    seen = []
+    for chunk in chunks:
+        seen.append(chunk)
+        for span in sc.feed(chunk):
+            try:
+                v = loads_lenient(span)[0]
+            except ValueError:
+                continue
+            if schema is None or not schema.errors(v):
+                return v
+    return extract("".join(seen), schema)
+
+def repair_prompt(schema: Schema, errors, bad_reply: str, limit: int = 4000) -> str:
+    """A short follow-up asking only for corrected JSON; the original prompt isn't resent."""
+    return (
+        f"Your previous reply could not be used ({'; '.join(errors) or 'invalid JSON'}).\n"
+        f"Return only valid JSON of this shape, with no prose or code fences:\n{schema.example}\n\n"
+        f"Previous reply:\n{(bad_reply or '')[:limit]}"
+    )
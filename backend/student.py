@@ -1,24 +1,47 @@
 import os
-import base64
-import json
+import hashlib
 import re
+import threading
+import time
 import requests
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from bson import ObjectId
 from bson.errors import InvalidId
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from dotenv import load_dotenv
-import jwt
 
 # Load environment variables
 load_dotenv()
 
 # DB collections
 from mongo import exams_collection, submissions_collection
+from auth import decode_token
+from metrics import init_metrics, observe_llm
+from submission_stages import (
+    timed_stage, make_stage, record_stage, sanitize_client_stage, public_stage, manual_time_hours,
+)
+from grading import free_text_leaves, grade_hybrid
+from llm_grading import (
+    GRADE, FREE_TEXT, cache_key, single_prompt, parse_single, batch_prompt, split_batch, free_text_prompt,
+    parse_free_text,
+)
+from structured_output import Schema, StructuredOutputError, extract, repair_prompt
+from page_layout import crop_regions
+from ocr_engines import OcrRouter, RemoteVisionEngine, TesseractEngine, OcrUnavailable
+from key_parser import parse_answer_sheet
+from submission_dedup import fingerprint, similar, identity_kind, separate_identity
+from cache_bus import BUS, InvalidatingCache
+import data_access as dal
 
 app = Flask(__name__)
 CORS(app)
+init_metrics(app, "student")
+BUS.start()
 
 # ================================
 # Configuration
@@ -31,6 +54,23 @@ OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")
 OPENROUTER_ENDPOINT = os.getenv("OPENROUTER_ENDPOINT", "https://openrouter.ai/api/v1/chat/completions")
 OPENROUTER_MODEL = os.getenv("OPENROUTER_MODEL", "qwen/qwen2-72b-instruct")
 
+# "llm" (default, the original behaviour): the whole key and submission go to the LLM.
+# "hybrid": rules grade objective leaves, the LLM only sees unmatched free text; scores
+# can differ from "llm" mode, so it is opt-in. Overridable per request with ?mode=.
+GRADING_MODE = os.getenv("GRADING_MODE", "llm").lower()
+GRADING_TEMPERATURE = float(os.getenv("GRADING_TEMPERATURE", "0.2"))
+STRUCTURED_RETRIES = int(os.getenv("STRUCTURED_RETRIES", "1"))   # repair round-trips for unusable replies
+GRADE_BATCH_SIZE = int(os.getenv("GRADE_BATCH_SIZE", "8"))        # submissions per call in "llm" mode
+GRADE_BATCH_LEAVES = int(os.getenv("GRADE_BATCH_LEAVES", "80"))   # free-text leaves per call in "hybrid" mode
+GRADE_BATCH_MAX = int(os.getenv("GRADE_BATCH_MAX", "200"))        # submissions per /score-batch request
+SIMILAR_CANDIDATES_MAX = int(os.getenv("SIMILAR_CANDIDATES_MAX", "50"))  # LSH hits compared per insert
+
+# Scans of an exam whose key pages carry a layout are cropped per question and
+# the tiles OCR'd in parallel; anything that doesn't register goes as one page.
+EXTRACT_TILES = os.getenv("EXTRACT_TILES", "1").lower() not in ("0", "false", "no")
+TILE_WORKERS = int(os.getenv("TILE_WORKERS", "4"))
+TILE_CACHE_SIZE = int(os.getenv("TILE_CACHE_SIZE", "512"))
+
 JWT_SECRET = os.getenv("JWT_SECRET")
 
 if not TOGETHER_API_KEY:
@@ -48,7 +88,7 @@ def _bearer():
     return h.split(" ", 1)[1].strip() if h.lower().startswith("bearer ") else None
 
 def _decode_jwt(tok):
-    return jwt.decode(tok, JWT_SECRET, algorithms=["HS256"])
+    return decode_token(tok, JWT_SECRET)
 
 def _user_or_none():
     tok = _bearer()
@@ -87,16 +127,434 @@ def _normalize_answers_structured(ans):
         tmp[idx] = _flatten_value(v)
     return {f"Q{i}": tmp[i] for i in sorted(tmp)}
 
-def _extract_first_json(text: str) -> str:
-    if not text:
-        raise json.JSONDecodeError("empty response", "", 0)
-    m = re.search(r"```json\s*(\{.*?\})\s*```", text, re.DOTALL | re.IGNORECASE)
-    if m:
-        return m.group(1)
-    m2 = re.search(r"\{.*\}", text, re.DOTALL)
-    if not m2:
-        raise json.JSONDecodeError("no JSON object found", text, 0)
-    return m2.group(0)
+def _has_answers(v):
+    return [] if "answers_structured" in v or "answers" in v else ["missing 'answers_structured'"]
+
+OCR_REPLY = Schema(
+    "ocr_reply",
+    '{ "student_name": string, "student_number": string|null, "answers_structured": { "Q1": string, ... } }',
+    optional={"answers_structured": (dict, list, str), "answers": (dict, list, str)},
+    check=_has_answers,
+)
+
+# ================================
+# OCR Helpers
+# ================================
+OCR_SYSTEM = (
+    "You extract the student's NAME and answers from an exam photo.\n"
+    "Return STRICT JSON ONLY (no prose, no code fences).\n"
+    "Schema:\n"
+    "{\n"
+    '  "student_name": string,\n'
+    '  "student_number": string|null,\n'
+    '  "answers_structured": { "Q1": string, "Q2": string, ... }\n'
+    "}\n"
+    "Rules:\n"
+    "- Combine multi-part answers into one string.\n"
+    "- For MCQ, return only the option letter (a/b/c/d, lowercase).\n"
+    "- Number questions sequentially Q1, Q2, ...\n"
+    "- Use empty string for blank/unclear answers.\n"
+    "- 'student_name' must be the person's name, not a seat number.\n"
+)
+
+# Bump with any change to TILE_SYSTEM or TILE_REPLY: it is part of the tile cache key.
+TILE_PROMPT_VERSION = "2"
+TILE_SYSTEM = (
+    "You read ONE cropped region of a student's answered exam page.\n"
+    "Return STRICT JSON ONLY (no prose, no code fences).\n"
+    "Schema:\n"
+    "{\n"
+    '  "student_name": string|null,\n'
+    '  "student_number": string|null,\n'
+    '  "answers": [ { "number": string|null, "answer": string } ]\n'
+    "}\n"
+    "Rules:\n"
+    "- One entry per answered question in this region, in reading order (top to bottom).\n"
+    "- number is the question number as printed, or null for an answer whose question starts above this region.\n"
+    "- Combine multi-part answers into one string.\n"
+    "- For MCQ, return only the option letter (a/b/c/d, lowercase).\n"
+    "- Use empty string for blank/unclear answers.\n"
+    "- student_name/student_number are null unless written in this region.\n"
+)
+
+TILE_REPLY = Schema(
+    "tile_reply",
+    '{ "student_name": string|null, "student_number": string|null, "answers": [ { "number": string|null, "answer": string } ] }',
+    optional={"answers": list, "student_name": str, "student_number": str},
+)
+
+OCR = OcrRouter(RemoteVisionEngine(TOGETHER_ENDPOINT, TOGETHER_API_KEY, TOGETHER_MODEL, temperature=0.1),
+                TesseractEngine())
+_TILE_POOL = ThreadPoolExecutor(max_workers=TILE_WORKERS, thread_name_prefix="tile")
+_EXAM_PAGES = InvalidatingCache(BUS, ("exams",), by="id", maxsize=128)
+_TILE_CACHE = OrderedDict()   # sha256(prompt version, model, tile jpeg) -> parsed tile reply
+_TILE_LOCK = threading.Lock()
+
+def _ocr_tile(jpeg: bytes):
+    """Returns (reply, call); call is None when the tile was already read, reply None when it didn't parse."""
+    key = hashlib.sha256(f"{TILE_PROMPT_VERSION}:{TOGETHER_MODEL}:".encode("utf-8") + jpeg).hexdigest()
+    with _TILE_LOCK:
+        hit = _TILE_CACHE.get(key)
+        if hit is not None:
+            _TILE_CACHE.move_to_end(key)
+            return hit, None
+    # through the router so a failing provider starts its cooldown for the full-page fallback too
+    content, _, call = OCR.read(jpeg, TILE_SYSTEM, "Extract the answers in this region.", 400, engine="remote")
+    try:
+        reply = extract(content, TILE_REPLY)
+    except StructuredOutputError as e:
+        app.logger.info("unusable tile reply: %s", e)
+        return None, call
+    with _TILE_LOCK:
+        _TILE_CACHE[key] = reply
+        while len(_TILE_CACHE) > TILE_CACHE_SIZE:
+            _TILE_CACHE.popitem(last=False)
+    return reply, call
+
+def _exam_layout(exam_id, page: int):
+    oid = dal.as_oid(exam_id)
+    if oid is None:
+        return None
+    # every page of a class upload reads the same exam: keep its pages until the exam changes
+    pages = _EXAM_PAGES.get_or_load(oid, "pages", lambda: [
+        p for p in (exams_collection.find_one({"_id": oid}, {"pages": 1}) or {}).get("pages") or []
+        if isinstance(p, dict)
+    ])
+    for p in pages:
+        if p.get("index") == page:
+            return p.get("layout")
+    return None
+
+def _tileable(layout) -> bool:
+    """Worth cropping: at least two regions, and a key page whose printed numbers don't restart."""
+    return len(layout.get("regions") or []) >= 2 and layout.get("numbers_contiguous") is not False
+
+def _merge_tiles(replies):
+    """Tile replies in region order -> one full-page reply, or None when they can't be keyed safely.
+
+    Answers are numbered Q1, Q2, ... by region order, then reading order within a
+    region, as the full-page prompt numbers them. Printed numbers only vouch for the
+    split: they must run n, n+1, n+2, ... across the tiles, so a repeat (a question
+    cut across two regions, a section restarting at 1.), a gap (a question no tile
+    read), an answer without one (a continuation) or an unreadable tile sends the
+    page to full-page OCR.
+    """
+    answers, last, name, number = [], None, "", ""
+    for r in replies:
+        if r is None:
+            return None
+        name = name or (r.get("student_name") or "").strip()
+        number = number or (r.get("student_number") or "").strip()
+        for a in r.get("answers") or []:
+            if not isinstance(a, dict):
+                return None
+            m = re.fullmatch(r"\s*q?\s*(\d{1,3})\s*[\.\):]?\s*", str(a.get("number") or ""), re.I)
+            if not m or (last is not None and int(m.group(1)) != last + 1):
+                return None
+            last = int(m.group(1))
+            answers.append(str(a.get("answer") or ""))
+    return {"student_name": name, "student_number": number or None,
+            "answers_structured": {f"Q{i}": v for i, v in enumerate(answers, 1)}}
+
+def _ocr_tiled(image_bytes: bytes, layout: dict):
+    """Returns (reply, calls, info); reply is None when the page needs full-page OCR.
+
+    calls holds every tile call made, also when the tiles are then thrown away,
+    so their tokens still land on the OCR stage.
+    """
+    tiles, corr = crop_regions(image_bytes, layout)
+    if not tiles:
+        return None, [], None
+    futures = [_TILE_POOL.submit(_ocr_tile, t["jpeg"]) for t in tiles]
+    replies, calls, failed = [], [], None
+    for f in futures:
+        try:
+            reply, call = f.result()
+        except Exception as e:
+            failed = failed or e
+            continue
+        replies.append(reply)
+        if call is not None:
+            calls.append(call)
+    info = {"tiles": len(tiles), "cached": len(tiles) - len(calls), "corr": round(corr, 3)}
+    if failed is not None:
+        app.logger.warning("tiled OCR failed, using the full page: %s", failed)
+        return None, calls, info
+    merged = _merge_tiles(replies)
+    if merged is None:
+        app.logger.info("tile answers aren't numbered in sequence, using the full page")
+    return merged, calls, info
+
+# ================================
+# Grading Helpers
+# ================================
+class LlmReplyError(RuntimeError):
+    """The completion response has no choices[0].message.content."""
+
+def _openrouter_chat(prompt: str, temperature: float = GRADING_TEMPERATURE):
+    """One OpenRouter completion; returns (content, metrics call)."""
+    headers = {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json",
+    }
+    with observe_llm("openrouter", OPENROUTER_MODEL) as call:
+        response = requests.post(
+            OPENROUTER_ENDPOINT,
+            headers=headers,
+            json={"model": OPENROUTER_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": temperature},
+            timeout=60,
+        )
+        response.raise_for_status()
+        body = response.json()
+        call.usage(body.get("usage"))
+    try:
+        return body["choices"][0]["message"]["content"], call
+    except (KeyError, IndexError, TypeError) as e:
+        raise LlmReplyError(f"malformed completion response: {e!r}") from e
+
+def _chat_parsed(prompt: str, schema: Schema, parse, *args):
+    """Calls the model and parses its reply with parse(content, *args).
+
+    A reply that doesn't fit schema gets up to STRUCTURED_RETRIES repair
+    round-trips that resend only the bad reply, not the prompt. Returns
+    (parsed, [metrics calls]).
+    """
+    content, call = _openrouter_chat(prompt)
+    calls = [call]
+    for attempt in range(STRUCTURED_RETRIES + 1):
+        try:
+            return parse(content, *args), calls
+        except StructuredOutputError as e:
+            if attempt == STRUCTURED_RETRIES:
+                raise
+            content, call = _openrouter_chat(repair_prompt(schema, e.errors, content), temperature=0.0)
+            calls.append(call)
+
+def _llm_answers(submission) -> dict:
+    answers = _normalize_answers_structured(submission["answers_structured"])
+    return {k: normalize_answer_keep_articles(v) for k, v in answers.items()}
+
+def _rule_answers(submission) -> dict:
+    raw = submission["answers_structured"]
+    return raw if isinstance(raw, dict) else _normalize_answers_structured(raw)
+
+# A call that fails or whose reply stays unusable after repairs: fails its batch chunk, not the request
+_CALL_ERRORS = (requests.RequestException, StructuredOutputError, LlmReplyError)
+
+def _shared_stage(wall_s, calls, n, cache="batch"):
+    """Splits the cost of batched calls evenly over the n submissions they graded."""
+    return make_stage(
+        wall_s / n, OPENROUTER_MODEL,
+        prompt_tokens=sum(c.prompt_tokens for c in calls) // n,
+        completion_tokens=sum(c.completion_tokens for c in calls) // n,
+        cache=cache,
+    )
+
+def _grade_free_text(pending: dict):
+    """One LLM call for the free-text leaves left after rule grading.
+
+    Only each leaf's expected answer, student answer and points are sent. Leaves
+    the reply leaves out are sent again on their own, up to STRUCTURED_RETRIES
+    times; any still missing come back as unresolved instead of scoring 0.
+    Returns ({leaf id: awarded}, feedback, [metrics calls], [unresolved leaf ids]).
+    """
+    awards, feedback, calls, todo = {}, "", [], dict(pending)
+    for _ in range(STRUCTURED_RETRIES + 1):
+        prompt, ids = free_text_prompt(todo)
+        (got, fb), more = _chat_parsed(prompt, FREE_TEXT, parse_free_text, ids)
+        awards.update(got)
+        calls += more
+        feedback = feedback or fb
+        todo = {lid: leaf for lid, leaf in todo.items() if lid not in got}
+        if not todo:
+            break
+    return awards, feedback, calls, sorted(todo)
+
+# ---------- Grading cache ----------
+# The validated LLM output is stored on the submission as
+#   llm_cache: {"hash", "mode", "output", "at"}
+# keyed by llm_grading.cache_key over everything the prompt depends on, so
+# regrading unchanged input returns the stored output without an LLM call.
+def _llm_hash(answer_key, submission) -> str:
+    return cache_key("llm", OPENROUTER_MODEL, GRADING_TEMPERATURE, answer_key, _llm_answers(submission))
+
+def _hybrid_hash(pending: dict) -> str:
+    # only the free-text leaves reach the LLM; rule-graded parts of the key don't invalidate
+    return cache_key("hybrid", OPENROUTER_MODEL, GRADING_TEMPERATURE, sorted(pending))
+
+def _cached_output(submission, h):
+    c = submission.get("llm_cache") or {}
+    return c.get("output") if c.get("hash") == h else None
+
+def _cache_doc(h, mode, output) -> dict:
+    return {"hash": h, "mode": mode, "output": output, "at": datetime.utcnow()}
+
+def _hit_stage():
+    return make_stage(0.0, OPENROUTER_MODEL, cache="hit")
+
+def _save_hybrid(submission, answer_key, awards, llm_feedback, rules_stage, llm_stage=None, cache=None, unresolved=()):
+    score, feedback, details, student_raw_total, max_points = grade_hybrid(answer_key, _rule_answers(submission), awards)
+    if llm_feedback:
+        feedback = f"{feedback} {llm_feedback}"
+
+    fields = {
+        "score": score,
+        "score_raw": round(student_raw_total, 3),
+        "max_points": round(max_points, 3),
+        "feedback": feedback,
+        "grading_details": details,
+        "grading_mode": "hybrid",
+    }
+    update = {"$set": fields, "$unset": {"needs_review": ""}}
+    if unresolved:
+        # free-text leaves the LLM never graded: no score that silently counts them as 0, and
+        # score None keeps the submission in the next ungraded /score-batch pick
+        score = None
+        fields.update(score=None, score_raw=None, needs_review=list(unresolved))
+        del update["$unset"]
+    elif cache:
+        fields["llm_cache"] = cache
+    submissions_collection.update_one({"_id": submission["_id"]}, update)
+    record_stage(submissions_collection, submission["_id"], "grading_rules", rules_stage)
+    if llm_stage:
+        record_stage(submissions_collection, submission["_id"], "grading_llm", llm_stage)
+    return {"score": score, "feedback": feedback, "details_count": len(details), "needs_review": len(unresolved)}
+
+def _score_hybrid(submission, answer_key, refresh=False):
+    with timed_stage("rules") as rules_stage:
+        pending = free_text_leaves(answer_key, _rule_answers(submission))
+
+    awards, llm_feedback, llm_stage, cache, cached, unresolved = {}, "", None, None, False, []
+    if pending:
+        h = _hybrid_hash(pending)
+        hit = None if refresh else _cached_output(submission, h)
+        if hit:
+            awards, llm_feedback, llm_stage, cached = dict(hit["awards"]), hit["feedback"], _hit_stage(), True
+        else:
+            with timed_stage(OPENROUTER_MODEL, cache="miss") as llm_stage:
+                awards, llm_feedback, llm_stage["llm"], unresolved = _grade_free_text(pending)
+            # pairs, not a dict: leaf ids are JSON text and may contain "." or "$"
+            cache = _cache_doc(h, "hybrid", {"awards": sorted(awards.items()), "feedback": llm_feedback})
+
+    out = _save_hybrid(submission, answer_key, awards, llm_feedback, rules_stage, llm_stage, cache, unresolved)
+    return {**out, "mode": "hybrid", "llm_leaves": len(pending), "cached": cached}
+
+def _save_llm(submission_id, result, stage, cache=None):
+    fields = {"score": result["score"], "feedback": result["feedback"], "grading_mode": "llm"}
+    if cache:
+        fields["llm_cache"] = cache
+    submissions_collection.update_one({"_id": submission_id}, {"$set": fields})
+    record_stage(submissions_collection, submission_id, "grading_llm", stage)
+
+def _score_llm(submission, answer_key, refresh=False):
+    h = _llm_hash(answer_key, submission)
+    hit = None if refresh else _cached_output(submission, h)
+    if hit:
+        _save_llm(submission["_id"], hit, _hit_stage())
+        return {**hit, "cached": True}
+
+    with timed_stage(OPENROUTER_MODEL, cache="miss") as stage:
+        result, stage["llm"] = _chat_parsed(single_prompt(answer_key, _llm_answers(submission)), GRADE, parse_single)
+    _save_llm(submission["_id"], result, stage, _cache_doc(h, "llm", result))
+    return {**result, "cached": False}
+
+def _batch_llm(subs, answer_key, refresh=False):
+    """Whole submissions, GRADE_BATCH_SIZE per call behind the shared answer-key prefix.
+
+    Cache hits are served first. Ids missing or invalid in a batch reply are
+    regraded one by one; a failed call fails its chunk rather than retrying
+    every submission in it.
+    """
+    graded, hits, fallbacks, failed, calls = 0, 0, 0, [], 0
+    todo = []
+    for s in subs:
+        h = _llm_hash(answer_key, s)
+        hit = None if refresh else _cached_output(s, h)
+        if hit:
+            _save_llm(s["_id"], hit, _hit_stage())
+            hits += 1
+        else:
+            todo.append((s, h))
+
+    for i in range(0, len(todo), GRADE_BATCH_SIZE):
+        chunk = {str(s["_id"]): (s, h) for s, h in todo[i:i + GRADE_BATCH_SIZE]}
+        t0 = time.perf_counter()
+        try:
+            content, call = _openrouter_chat(batch_prompt(answer_key, {sid: _llm_answers(s) for sid, (s, _) in chunk.items()}))
+            calls += 1
+            results, missing = split_batch(content, list(chunk))
+        except _CALL_ERRORS:
+            failed += list(chunk)
+            continue
+        stage = _shared_stage(time.perf_counter() - t0, [call], len(chunk))
+        for sid, result in results.items():
+            s, h = chunk[sid]
+            _save_llm(s["_id"], result, stage, _cache_doc(h, "llm", result))
+        graded += len(results)
+        for sid in missing:
+            fallbacks += 1
+            calls += 1
+            try:
+                _score_llm(chunk[sid][0], answer_key, refresh=True)
+                graded += 1
+            except Exception:
+                failed.append(sid)
+    return {"graded": graded + hits, "cache_hits": hits, "llm_calls": calls, "fallbacks": fallbacks, "failed": failed}
+
+def _batch_hybrid(subs, answer_key, refresh=False):
+    """Rules per submission, then the free-text leaves of the whole batch pooled.
+
+    Leaf ids are content-addressed, so identical answers to the same leaf are
+    judged once; GRADE_BATCH_LEAVES caps the leaves per call. Submissions whose
+    leaves hit their stored cache entry don't add to the pool. A chunk whose call
+    fails fails only the submissions with a leaf in it; the rest are saved.
+    """
+    t0 = time.perf_counter()
+    pending, plan = {}, []
+    for s in subs:
+        p = free_text_leaves(answer_key, _rule_answers(s))
+        h = _hybrid_hash(p) if p else None
+        hit = None if refresh or not p else _cached_output(s, h)
+        if p and not hit:
+            pending.update(p)
+        plan.append((s, p, h, hit))
+    rules_stage = make_stage((time.perf_counter() - t0) / max(1, len(subs)), "rules")
+
+    awards, calls, unresolved, lost = {}, [], set(), set()
+    t0 = time.perf_counter()
+    items = list(pending.items())
+    for i in range(0, len(items), GRADE_BATCH_LEAVES):
+        chunk = dict(items[i:i + GRADE_BATCH_LEAVES])
+        try:
+            chunk_awards, _, chunk_calls, chunk_unresolved = _grade_free_text(chunk)
+        except _CALL_ERRORS:
+            lost.update(chunk)  # its submissions are reported as failed and left as they were
+            continue
+        awards.update(chunk_awards)
+        calls += chunk_calls
+        unresolved.update(chunk_unresolved)
+    misses = sum(1 for _, p, _, hit in plan if p and not hit and not lost.intersection(p))
+    llm_stage = _shared_stage(time.perf_counter() - t0, calls, misses) if misses else None
+
+    hits, review, failed = 0, [], []
+    for s, p, h, hit in plan:
+        # per-student feedback comes from the rules; the pooled LLM feedback spans students
+        if p and not hit and lost.intersection(p):
+            failed.append(str(s["_id"]))
+        elif hit:
+            hits += 1
+            _save_hybrid(s, answer_key, dict(hit["awards"]), hit["feedback"], rules_stage, _hit_stage())
+        elif p:
+            own = sorted((lid, awards[lid]) for lid in p if lid in awards)
+            missing = sorted(lid for lid in p if lid in unresolved)
+            if missing:
+                review.append(str(s["_id"]))
+            _save_hybrid(s, answer_key, awards, "", rules_stage, llm_stage,
+                         _cache_doc(h, "hybrid", {"awards": own, "feedback": ""}), missing)
+        else:
+            _save_hybrid(s, answer_key, {}, "", rules_stage)
+    return {"graded": len(subs) - len(review) - len(failed), "cache_hits": hits, "llm_calls": len(calls),
+            "llm_leaves": len(pending), "fallbacks": 0, "failed": failed, "needs_review": review}
 
 def normalize_answer_keep_articles(v):
     if isinstance(v, dict):
@@ -118,84 +576,152 @@ def _clean_student_name(s: str) -> str:
         s = s.title()
     return s
 
+# ================================
+# Ingestion Helpers
+# ================================
+def _similar_submissions(exam_oid, fp):
+    """Earlier submissions of the exam whose answers look copied from (or to) this one."""
+    if not fp["sim_bands"]:
+        return []
+    candidates = submissions_collection.find(
+        {"exam_id": exam_oid, "sim_bands": {"$in": fp["sim_bands"]}, "identity": {"$ne": fp["identity"]}},
+        {"minhash": 1},
+    ).limit(SIMILAR_CANDIDATES_MAX)
+    return similar(fp, candidates)
+
+def _duplicate_submission(exam_doc, fp, answers_structured, student_name, student_number, replace):
+    """The (exam, student) pair already has a submission: same answers -> return it; else 409 unless replace.
+
+    The 409 carries the existing submission so the client can show it. A name-only
+    identity may be a namesake rather than a re-scan, so replace must then be that
+    submission's id (the one shown), not just true.
+    """
+    existing = submissions_collection.find_one(
+        {"exam_id": exam_doc["_id"], "identity": fp["identity"]},
+        {"content_hash": 1, "student_name": 1, "student_number": 1, "score": 1, "created_at": 1},
+    )
+    if existing is None:  # removed between the insert and this lookup
+        return jsonify({"error": "Submission changed concurrently; retry"}), 409
+    kind = identity_kind(fp["identity"])
+    body = {"submission_id": str(existing["_id"]), "exam_id": str(exam_doc["_id"]),
+            "exam_title": exam_doc.get("title", "Untitled Exam")}
+    if existing.get("content_hash") == fp["content_hash"]:
+        return jsonify({**body, "message": "Submission already saved", "duplicate": "exact"}), 200
+    confirmed = replace == body["submission_id"] if kind == "name" else bool(replace)
+    if not confirmed:
+        return jsonify({**body, "error": "This student already has a submission for this exam",
+                        "duplicate": "student", "identity": kind,
+                        "existing": {
+                            "student_name": existing.get("student_name"),
+                            "student_number": existing.get("student_number"),
+                            "score": existing.get("score"),
+                            "created_at": existing["created_at"].isoformat() + "Z" if existing.get("created_at") else None,
+                        }}), 409
+    # a re-scan of the same student: new answers, previous grade no longer applies
+    submissions_collection.update_one({"_id": existing["_id"]}, {
+        "$set": {
+            "student_id": student_name,
+            "student_name": student_name,
+            "student_number": student_number,
+            "answers_structured": answers_structured,
+            "manualTimeHours": manual_time_hours(answers_structured),
+            "content_hash": fp["content_hash"],
+            "minhash": fp["minhash"],
+            "sim_bands": fp["sim_bands"],
+            "score": None,
+            "feedback": None,
+            "updated_at": datetime.utcnow(),
+        },
+        "$unset": {"grading_details": "", "score_raw": "", "max_points": "", "grading_mode": "", "llm_cache": "",
+                   "needs_review": ""},
+    })
+    # answers and grade changed: the agent cache version and the cache bus read exams.updated_at
+    exams_collection.update_one({"_id": exam_doc["_id"]}, {"$set": {"updated_at": datetime.utcnow()}})
+    return jsonify({**body, "message": "Submission replaced", "duplicate": "replaced"}), 200
+
 # ================================
 # Routes
 # ================================
 @app.route("/extract-answers", methods=["POST"])
 def extract_answers():
+    """OCR one student page.
+
+    With exam_id (and page, default 1) for an exam whose key pages were saved with a
+    layout, the scan is cropped per question and the tiles read in parallel; a scan
+    that doesn't register to the template falls back to the whole page. ocr=local
+    (form field or query) reads the page with Tesseract, as does auto when the
+    provider is failing.
+    """
     if "files" not in request.files:
         return jsonify({"error": "No image file provided"}), 400
 
     image = request.files["files"]
     image_bytes = image.read()
-    image_base64 = base64.b64encode(image_bytes).decode("utf-8")
-
-    system = (
-        "You extract the student's NAME and answers from an exam photo.\n"
-        "Return STRICT JSON ONLY (no prose, no code fences).\n"
-        "Schema:\n"
-        "{\n"
-        '  "student_name": string,\n'
-        '  "student_number": string|null,\n'
-        '  "answers_structured": { "Q1": string, "Q2": string, ... }\n'
-        "}\n"
-        "Rules:\n"
-        "- Combine multi-part answers into one string.\n"
-        "- For MCQ, return only the option letter (a/b/c/d, lowercase).\n"
-        "- Number questions sequentially Q1, Q2, ...\n"
-        "- Use empty string for blank/unclear answers.\n"
-        "- 'student_name' must be the person's name, not a seat number.\n"
-    )
-
-    user_content = [
-        {"type": "text", "text": "Extract student_name, student_number and answers_structured from this exam image."},
-        {"type": "image_url", "image_url": {"url": f"data:image/jpeg;base64,{image_base64}"}},
-    ]
-
-    payload = {
-        "model": TOGETHER_MODEL,
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user", "content": user_content},
-        ],
-        "temperature": 0.1,
-        "max_tokens": 800,
-        "top_p": 0.8,
-    }
-
-    headers = {
-        "Authorization": f"Bearer {TOGETHER_API_KEY}",
-        "Content-Type": "application/json",
-    }
-
     try:
-        r = requests.post(TOGETHER_ENDPOINT, headers=headers, json=payload, timeout=60)
-        r.raise_for_status()
-        raw = r.json()["choices"][0]["message"]["content"].strip()
-        raw_json = _extract_first_json(raw)
-        data = json.loads(raw_json)
-
-        name_from_model = _clean_student_name(
-            data.get("student_name") or data.get("student_id") or data.get("name") or data.get("student") or ""
-        )
-        number_from_model = (data.get("student_number") or "").strip()
-
-        if not name_from_model or re.fullmatch(r"\d+", name_from_model):
-            if not number_from_model:
-                number_from_model = (data.get("student_id") or "").strip()
-            name_from_model = "Unknown Student"
-
-        answers_raw = data.get("answers_structured") or data.get("answers") or {}
-        answers_structured = _normalize_answers_structured(answers_raw)
+        page = int(request.form.get("page") or 1)
+    except ValueError:
+        page = 1
+    ocr = (request.form.get("ocr") or request.args.get("ocr") or "").lower() or None
+    if ocr not in (None, "auto", "remote", "local"):
+        return jsonify({"error": "ocr must be one of auto, remote, local"}), 400
+    # tiles are model-only: skip them when the page will be read locally anyway
+    tiles_ok = EXTRACT_TILES and OCR.engines(ocr)[0] is OCR.remote
+    layout = _exam_layout(request.form.get("exam_id"), page) if tiles_ok else None
 
+    try:
+        with timed_stage(TOGETHER_MODEL) as ocr_stage:
+            data, tile_calls, tiles_info = None, [], None
+            if layout and _tileable(layout):
+                try:
+                    data, tile_calls, tiles_info = _ocr_tiled(image_bytes, layout)
+                except Exception as e:
+                    app.logger.warning("tiled OCR failed, using the full page: %s", e)
+            if data is not None:
+                engine = OCR.remote.name
+                ocr_stage["llm"] = tile_calls
+                ocr_stage["cache"] = f"tiles:{tiles_info['cached']}/{tiles_info['tiles']}"
+            else:
+                tiles_info = None
+                raw, engine, call = OCR.read(
+                    image_bytes, OCR_SYSTEM,
+                    "Extract student_name, student_number and answers_structured from this exam image.",
+                    max_tokens=800, engine=ocr,
+                )
+                # tiles read before falling back were paid for too
+                ocr_stage["llm"] = tile_calls + [call] if call else tile_calls
+                if engine == "local":
+                    ocr_stage["model"] = "tesseract"
+                    data = parse_answer_sheet(raw)
+                else:
+                    data = extract(raw, OCR_REPLY)
+
+            name_from_model = _clean_student_name(
+                data.get("student_name") or data.get("student_id") or data.get("name") or data.get("student") or ""
+            )
+            number_from_model = (data.get("student_number") or "").strip()
+
+            if not name_from_model or re.fullmatch(r"\d+", name_from_model):
+                if not number_from_model:
+                    number_from_model = (data.get("student_id") or "").strip()
+                name_from_model = "Unknown Student"
+
+            answers_raw = data.get("answers_structured") or data.get("answers") or {}
+            answers_structured = _normalize_answers_structured(answers_raw)
+
+        # The client echoes `pipeline` back to /api/submit-student so OCR timing lands on the submission
         return jsonify({
             "student_id": name_from_model,
             "student_name": name_from_model,
             "student_number": number_from_model or None,
-            "answers_structured": answers_structured
+            "answers_structured": answers_structured,
+            "tiles": tiles_info,
+            "engine": engine,
+            "pipeline": {"ocr": public_stage(ocr_stage)},
         }), 200
 
-    except (json.JSONDecodeError, KeyError) as e:
+    except OcrUnavailable as e:
+        return jsonify({"error": str(e)}), 503
+    except (ValueError, KeyError) as e:
         return jsonify({"error": f"Failed to parse model JSON: {e}", "raw": raw if 'raw' in locals() else ""}), 500
     except requests.exceptions.RequestException as e:
         return jsonify({"error": str(e)}), 502
@@ -216,6 +742,7 @@ def my_latest_exam():
 
 @app.route("/api/submit-student", methods=["POST"])
 def submit_student():
+    ingest_t0 = time.perf_counter()
     user = _user_or_none()
     data = request.json or {}
 
@@ -251,28 +778,51 @@ def submit_student():
             return jsonify({"error": "No exams found for this user"}), 404
 
     answers_structured = _normalize_answers_structured(answers_in)
+    student_number = (data.get("student_number") or "").strip() or None
+    fp = fingerprint(student_name, student_number, answers_structured, exam_doc.get("answer_key"))
+    if data.get("separate"):  # the client confirmed a namesake, not a re-scan
+        fp = separate_identity(fp)
+    near = _similar_submissions(exam_doc["_id"], fp)
 
-    ins = submissions_collection.insert_one({
-        "student_id": student_name,
-        "student_name": student_name,
-        "student_number": (data.get("student_number") or "").strip() or None,
-        "exam_id": exam_doc["_id"],
-        "answers_structured": answers_structured,
-        "score": None,
-        "feedback": None,
-        "created_at": datetime.utcnow(),
-    })
-
-    exams_collection.update_one(
-        {"_id": exam_doc["_id"]},
-        {"$inc": {"stats.submissions": 1}, "$set": {"updated_at": datetime.utcnow()}},
-    )
+    try:
+        submission_id = dal.insert_submission({
+            "student_id": student_name,
+            "student_name": student_name,
+            "student_number": student_number,
+            "exam_id": exam_doc["_id"],
+            "created_by": exam_doc.get("created_by"),
+            "answers_structured": answers_structured,
+            "score": None,
+            "feedback": None,
+            "manualTimeHours": manual_time_hours(answers_structured),
+            **fp,
+            "similar_to": near,
+            "created_at": datetime.utcnow(),
+        })
+    except DuplicateKeyError:
+        return _duplicate_submission(exam_doc, fp, answers_structured, student_name, student_number,
+                                     data.get("replace"))
+
+    if near:
+        # flag both sides, so either sheet shows the pair
+        submissions_collection.bulk_write([
+            UpdateOne({"_id": n["submission_id"]},
+                      {"$addToSet": {"similar_to": {"submission_id": submission_id, "jaccard": n["jaccard"]}}})
+            for n in near
+        ], ordered=False)
+
+    ocr_stage = sanitize_client_stage((data.get("pipeline") or {}).get("ocr"))
+    if ocr_stage:
+        record_stage(submissions_collection, submission_id, "ocr", ocr_stage)
+
+    record_stage(submissions_collection, submission_id, "ingest", make_stage(time.perf_counter() - ingest_t0))
 
     return jsonify({
         "message": "✅ Submission saved",
-        "submission_id": str(ins.inserted_id),
+        "submission_id": str(submission_id),
         "exam_id": str(exam_doc["_id"]),
         "exam_title": exam_doc.get("title", "Untitled Exam"),
+        "similar_to": [{"submission_id": str(n["submission_id"]), "jaccard": n["jaccard"]} for n in near],
     }), 201
 
 @app.route("/api/score-submission/<submission_id>", methods=["POST"])
@@ -290,49 +840,66 @@ def score_submission(submission_id):
     if not exam:
         return jsonify({"error": "Exam not found"}), 404
 
-    try:
-        answer_key = exam["answer_key"]
-        student_answers = submission["answers_structured"]
-    except KeyError:
+    if "answer_key" not in exam or "answers_structured" not in submission:
         return jsonify({"error": "Missing answer_key or answers_structured"}), 500
+    answer_key = exam["answer_key"]
 
-    student_answers = _normalize_answers_structured(student_answers)
-    student_answers_for_grading = {k: normalize_answer_keep_articles(v) for k, v in student_answers.items()}
+    mode = (request.args.get("mode") or GRADING_MODE).lower()
+    refresh = request.args.get("refresh", "").lower() in ("1", "true", "yes")
+    try:
+        if mode == "hybrid" and isinstance(answer_key, list) and answer_key:
+            result = _score_hybrid(submission, answer_key, refresh)
+        else:
+            result = _score_llm(submission, answer_key, refresh)
+        exams_collection.update_one({"_id": exam["_id"]}, {"$set": {"updated_at": datetime.utcnow()}})
+        return jsonify(result)
 
-    prompt = (
-        f"Exam Answer Key:\n{json.dumps(answer_key, indent=2)}\n\n"
-        f"Student Submission:\n{json.dumps(student_answers_for_grading, indent=2)}\n\n"
-        "Grade out of 20 and provide feedback.\n"
-        'Return only: { "score": number, "feedback": string }'
-    )
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
 
-    headers = {
-        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-        "Content-Type": "application/json",
-    }
+@app.route("/api/exams/<exam_id>/score-batch", methods=["POST"])
+def score_batch(exam_id):
+    """Grades several submissions of one exam with batched LLM calls.
 
+    Body (optional): {"submission_ids": [...], "mode": "hybrid" | "llm", "refresh": bool}.
+    Without ids, the exam's ungraded submissions are picked, up to GRADE_BATCH_MAX.
+    """
+    user = _user_or_none()
+    if not user:
+        return jsonify({"error": "Unauthorized"}), 401
+    body = request.get_json(silent=True) or {}
     try:
-        response = requests.post(
-            OPENROUTER_ENDPOINT,
-            headers=headers,
-            json={"model": OPENROUTER_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.2},
-            timeout=60,
-        )
-        response.raise_for_status()
-        content = response.json()["choices"][0]["message"]["content"]
-        m = re.search(r"\{.*\}", content, re.DOTALL)
-        if not m:
-            raise ValueError("Model response does not contain valid JSON")
-        result = json.loads(m.group(0))
-
-        submissions_collection.update_one(
-            {"_id": object_id},
-            {"$set": {"score": result.get("score"), "feedback": result.get("feedback")}},
-        )
-        return jsonify(result)
+        exam = dal.find_exam(user, exam_id, {"answer_key": 1})
+    except PermissionError as e:
+        return jsonify({"error": str(e)}), 403
+    if not exam:
+        return jsonify({"error": "Exam not found"}), 404
+    answer_key = exam.get("answer_key")
+    if not answer_key:
+        return jsonify({"error": "Exam has no answer key"}), 400
+
+    extra = {"exam_id": exam["_id"], "answers_structured": {"$nin": [None, {}]}}
+    ids = body.get("submission_ids")
+    if isinstance(ids, list) and ids:
+        extra["_id"] = {"$in": [oid for oid in map(dal.as_oid, ids) if oid]}
+    else:
+        extra["score"] = None
+    subs = list(dal.find_submissions(user, extra, {"answers_structured": 1, "llm_cache": 1}).limit(GRADE_BATCH_MAX))
+    if not subs:
+        return jsonify({"graded": 0, "cache_hits": 0, "llm_calls": 0, "fallbacks": 0, "failed": []})
 
+    mode = (body.get("mode") or request.args.get("mode") or GRADING_MODE).lower()
+    t0 = time.perf_counter()
+    try:
+        if mode == "hybrid" and isinstance(answer_key, list):
+            out = _batch_hybrid(subs, answer_key, bool(body.get("refresh")))
+        else:
+            mode = "llm"
+            out = _batch_llm(subs, answer_key, bool(body.get("refresh")))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    exams_collection.update_one({"_id": exam["_id"]}, {"$set": {"updated_at": datetime.utcnow()}})
+    return jsonify({**out, "mode": mode, "submissions": len(subs), "wall_s": round(time.perf_counter() - t0, 3)})
 
 @app.route("/api/exams/latest", methods=["GET"])
 def get_latest_exam():
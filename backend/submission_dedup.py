@@ -0,0 +1,127 @@
+# submission_dedup.py — ingestion-time identity keys and answer fingerprints (no I/O)
+#
+#   fp = fingerprint(student_name, student_number, answers_structured, answer_key)
+#   doc.update(fp)                       # identity, content_hash, minhash, sim_bands
+#   near = similar(fp, candidates)       # candidates: same exam, any sim_band in common
+#
+# identity is unique per exam (partial unique index in mongo.py), so a double-click or
+# re-upload of the same student collides on insert instead of creating a second
+# submission. Pages whose name the OCR couldn't read fall back to the answer content
+# ("anon:<hash>"), which still catches the same sheet uploaded twice. A name-only
+# identity ("name:<folded>") can belong to two students of one class: submit-student
+# only replaces it when the client names the submission it was shown, and
+# separate_identity() keys a second same-named student by name and answers.
+#
+# The similarity fingerprint is a MinHash signature over the answers that differ from
+# the key: correct answers are expected to coincide, shared wrong or unusual answers
+# are what make two sheets look copied. It is stored as SIM_BANDS bands of SIM_ROWS
+# values each (LSH); an index on (exam_id, sim_bands) returns every earlier sheet
+# sharing a band in one lookup per band, and the signatures then estimate Jaccard
+# overlap exactly enough to flag pairs at or above SIM_MIN_JACCARD.
+import hashlib
+import os
+import re
+import unicodedata
+
+SIM_BANDS = 8
+SIM_ROWS = 4                      # P(candidate) = 1 - (1 - J^4)^8: ~0.98 at J=0.8, ~0.06 at J=0.3
+SIM_MIN_JACCARD = float(os.getenv("SIM_MIN_JACCARD", "0.7"))
+SIM_MIN_FEATURES = int(os.getenv("SIM_MIN_FEATURES", "3"))   # off-key answers needed before fingerprinting
+UNKNOWN_NAMES = {"", "unknown", "unknown student", "student", "name"}
+
+def _fold(s) -> str:
+    s = unicodedata.normalize("NFKD", str(s or ""))
+    s = "".join(c for c in s if not unicodedata.combining(c)).lower()
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s]", " ", s)).strip()
+
+def identity_key(name, number, content_hash) -> str:
+    num = re.sub(r"[^0-9a-z]", "", _fold(number))
+    if num:
+        return f"num:{num}"
+    folded = _fold(name)
+    if folded not in UNKNOWN_NAMES and not folded.isdigit():
+        return f"name:{folded}"
+    return f"anon:{content_hash[:16]}"
+
+def identity_kind(identity: str) -> str:
+    """"num", "name" or "anon"."""
+    return (identity or "").split(":", 1)[0]
+
+def separate_identity(fp: dict) -> dict:
+    """fp for a different student who shares a name (and has no number) with an earlier submission."""
+    if identity_kind(fp["identity"]) != "name":
+        return fp
+    return {**fp, "identity": f"{fp['identity']}#{fp['content_hash'][:16]}"}
+
+def _answer_text(v) -> str:
+    if isinstance(v, dict):
+        return " ".join(_answer_text(v[k]) for k in sorted(v))
+    if isinstance(v, list):
+        return " ".join(_answer_text(x) for x in v)
+    return _fold(v)
+
+def content_hash(answers: dict) -> str:
+    rows = sorted((str(k).upper(), _answer_text(v)) for k, v in (answers or {}).items())
+    return hashlib.sha256(repr(rows).encode("utf-8")).hexdigest()
+
+def _expected(answer_key) -> dict:
+    """{question id: folded expected answer} for flat key items; subpart items aren't compared."""
+    out = {}
+    for it in answer_key or []:
+        if isinstance(it, dict) and it.get("question_id") and isinstance(it.get("expected_answer"), (str, int, float)):
+            out[str(it["question_id"]).upper()] = _fold(it["expected_answer"])
+    return out
+
+def _features(answers: dict, answer_key) -> list:
+    expected = _expected(answer_key)
+    feats = []
+    for qid, v in sorted((answers or {}).items()):
+        q = str(qid).upper()
+        text = _answer_text(v)
+        if not text or expected.get(q) == text:
+            continue
+        words = text.split()
+        feats.append(f"{q}={text}")
+        feats += [f"{q}~{a} {b}" for a, b in zip(words, words[1:])]
+    return feats
+
+_MASK32 = (1 << 32) - 1
+_SEEDS = [(_i * 0x9E3779B1 + 0x7F4A7C15) & _MASK32 for _i in range(1, SIM_BANDS * SIM_ROWS + 1)]
+
+def _h64(s: str) -> int:
+    return int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=8).digest(), "big")
+
+def minhash(features) -> list:
+    """One 32-bit minimum per seed (fits a BSON int); seeds are xor-then-multiply permutations."""
+    hs = [_h64(f) for f in set(features)]
+    return [min(((h ^ seed) * 0xFF51AFD7ED558CCD >> 32) & _MASK32 for h in hs) for seed in _SEEDS]
+
+def bands(sig) -> list:
+    out = []
+    for b in range(SIM_BANDS):
+        rows = sig[b * SIM_ROWS:(b + 1) * SIM_ROWS]
+        out.append(f"{b}:" + hashlib.blake2b(repr(rows).encode("ascii"), digest_size=6).hexdigest())
+    return out
+
+def fingerprint(name, number, answers, answer_key=None) -> dict:
+    ch = content_hash(answers)
+    fp = {"identity": identity_key(name, number, ch), "content_hash": ch, "minhash": None, "sim_bands": []}
+    feats = _features(answers, answer_key)
+    if sum(1 for f in feats if "=" in f) >= SIM_MIN_FEATURES:
+        sig = minhash(feats)
+        fp.update(minhash=sig, sim_bands=bands(sig))
+    return fp
+
+def jaccard(a, b) -> float:
+    return sum(x == y for x, y in zip(a, b)) / len(a) if a and b and len(a) == len(b) else 0.0
+
+def similar(fp: dict, candidates, min_jaccard=SIM_MIN_JACCARD) -> list:
+    """[{"submission_id", "jaccard"}] for candidates (docs with _id, minhash) close to fp, closest first."""
+    if not fp.get("minhash"):
+        return []
+    out = []
+    for c in candidates:
+        j = jaccard(fp["minhash"], c.get("minhash"))
+        if j >= min_jaccard:
+            out.append({"submission_id": c["_id"], "jaccard": round(j, 3)})
+    return sorted(out, key=lambda r: -r["jaccard"])
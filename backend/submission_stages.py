@@ -0,0 +1,79 @@
+# submission_stages.py — per-stage wall time / model / token records on submissions
+#
+# Each stage lands under `pipeline.<stage>` on the submission document:
+#   {"wall_s", "model", "prompt_tokens", "completion_tokens", "cache", "at"}
+# and `aiTimeHours` is recomputed from all stage walls, feeding the dashboard's
+# timeSaved chart.
+import os
+import time
+from datetime import datetime
+from contextlib import contextmanager
+
+MANUAL_MINUTES_PER_QUESTION = float(os.getenv("MANUAL_MINUTES_PER_QUESTION", "1.5"))
+
+def make_stage(wall_s, model=None, prompt_tokens=0, completion_tokens=0, cache="n/a"):
+    return {
+        "wall_s": round(float(wall_s), 4),
+        "model": model,
+        "prompt_tokens": int(prompt_tokens or 0),
+        "completion_tokens": int(completion_tokens or 0),
+        "cache": cache,
+        "at": datetime.utcnow(),
+    }
+
+@contextmanager
+def timed_stage(model=None, cache="n/a"):
+    """Yields a dict that is filled with the stage record on exit.
+
+    Set `llm` on it to a metrics.observe_llm call (or a list of them, e.g. a
+    reply plus its repair round-trip) to pick up token usage, or override
+    `cache` before leaving the block.
+    """
+    rec = {"model": model, "cache": cache, "llm": None}
+    t0 = time.perf_counter()
+    try:
+        yield rec
+    finally:
+        llm = rec.pop("llm")
+        calls = llm if isinstance(llm, list) else [llm] if llm else []
+        rec.update(make_stage(
+            time.perf_counter() - t0,
+            model=rec["model"],
+            prompt_tokens=sum(c.prompt_tokens for c in calls),
+            completion_tokens=sum(c.completion_tokens for c in calls),
+            cache=rec["cache"],
+        ))
+
+def sanitize_client_stage(raw):
+    """Validates a stage record echoed back by the client (e.g. OCR timing from /extract-answers)."""
+    if not isinstance(raw, dict):
+        return None
+    try:
+        return make_stage(
+            max(0.0, min(float(raw.get("wall_s", 0)), 3600.0)),
+            model=str(raw.get("model"))[:120] if raw.get("model") else None,
+            prompt_tokens=max(0, int(raw.get("prompt_tokens") or 0)),
+            completion_tokens=max(0, int(raw.get("completion_tokens") or 0)),
+            cache=str(raw.get("cache") or "n/a")[:16],
+        )
+    except (TypeError, ValueError):
+        return None
+
+def public_stage(stage: dict) -> dict:
+    return {**stage, "at": stage["at"].isoformat() + "Z"}
+
+def manual_time_hours(answers_structured) -> float:
+    n = len(answers_structured) if isinstance(answers_structured, dict) else 0
+    return round(n * MANUAL_MINUTES_PER_QUESTION / 60.0, 4)
+
+AI_TIME_UPDATE = {"$set": {"aiTimeHours": {"$divide": [
+    {"$sum": {"$map": {"input": {"$objectToArray": "$pipeline"}, "in": "$$this.v.wall_s"}}},
+    3600,
+]}}}
+
+def record_stage(collection, submission_id, name: str, stage: dict):
+    """Stores one stage and recomputes aiTimeHours from every stage in a single update."""
+    collection.update_one({"_id": submission_id}, [
+        {"$set": {f"pipeline.{name}": {"$literal": stage}}},  # client-sent strings (ocr stage) are data, not expressions
+        AI_TIME_UPDATE,
+    ])
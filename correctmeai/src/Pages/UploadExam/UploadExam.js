@@ -7,6 +7,7 @@ export default function UploadExam() {
     const [filesWithIndex, setFilesWithIndex] = useState([]);
     const [extractedText, setExtractedText] = useState("");
     const [loading, setLoading] = useState(false);
+    const [pagesDone, setPagesDone] = useState(0);
     const [error, setError] = useState("");
     const [dragActive, setDragActive] = useState(false);
 
@@ -28,39 +29,76 @@ export default function UploadExam() {
 
     const handleFileChange = (e) => addFiles(e.target.files);
 
+    // Pages stream back as NDJSON lines ({event: "page", page, filename, text|error, layout})
+    // in completion order; the preview is rebuilt in upload order as each one lands.
+    const renderPages = (pages) =>
+        pages
+            .filter(Boolean)
+            .map((p) =>
+                p.error
+                    ? `❌ Error with ${p.filename}: ${p.error}\n\n`
+                    : `🖼️ Page ${p.page} (${p.filename})\n${p.text}\n\n`
+            )
+            .join("");
+
     const handleSubmit = async () => {
         if (filesWithIndex.length === 0) return;
         setLoading(true);
         setError("");
+        setExtractedText("");
+        setPagesDone(0);
 
         const finalOrder = [...filesWithIndex];
-        let finalText = "";
-
-        for (const item of finalOrder) {
-            const formData = new FormData();
-            formData.append("files", item.file);
-
-            try {
-                const response = await fetch("http://localhost:5000/extract", {
-                    method: "POST",
-                    body: formData,
-                });
-                const data = await response.json();
-
-                if (response.ok) {
-                    finalText += `📄 From: ${item.file.name}\n${data.text}\n\n`;
-                } else {
-                    finalText += `❌ Error with ${item.file.name}: ${
-                        data.error || "Failed to extract"
-                    }\n\n`;
+        const formData = new FormData();
+        finalOrder.forEach((item) => formData.append("files", item.file));
+        const pages = new Array(finalOrder.length).fill(null);
+
+        try {
+            const response = await fetch("http://localhost:5000/extract?stream=ndjson", {
+                method: "POST",
+                body: formData,
+            });
+            if (!response.ok || !response.body) {
+                const data = await response.json().catch(() => ({}));
+                throw new Error(data.error || "Failed to extract");
+            }
+
+            const reader = response.body.getReader();
+            const decoder = new TextDecoder();
+            let buffered = "";
+            for (;;) {
+                const { value, done } = await reader.read();
+                buffered += decoder.decode(value || new Uint8Array(), { stream: !done });
+                const lines = buffered.split("\n");
+                buffered = done ? "" : lines.pop();
+                for (const line of lines) {
+                    if (!line.trim()) continue;
+                    const msg = JSON.parse(line);
+                    if (msg.event === "page") {
+                        pages[msg.page - 1] = {
+                            ...msg,
+                            filename: msg.filename || finalOrder[msg.page - 1]?.file.name,
+                        };
+                        setExtractedText(renderPages(pages));
+                        setPagesDone(pages.filter(Boolean).length);
+                    }
                 }
-            } catch {
-                finalText += `❌ Server error with ${item.file.name}\n\n`;
+                if (done) break;
             }
+        } catch (e) {
+            setLoading(false);
+            setError(e.message || "Server error");
+            return;
         }
 
         setLoading(false);
-        navigate("/key", { state: { extractedText: finalText } });
+        // layouts are stored on exam.pages so student scans can be cropped per question
+        const pageMeta = pages.map((p, i) => ({
+            index: i + 1,
+            filename: p?.filename || finalOrder[i]?.file.name,
+            layout: p?.layout || null,
+        }));
+        navigate("/key", { state: { extractedText: renderPages(pages), pages: pageMeta } });
     };
 
     const handleClear = () => {
@@ -215,11 +253,17 @@ export default function UploadExam() {
 
                 <div className="actions">
                     <button onClick={handleSubmit} disabled={loading || filesWithIndex.length === 0}>
-                        {loading ? "Submitting..." : "Submit"}
+                        {loading
+                            ? `Extracting... ${pagesDone}/${filesWithIndex.length}`
+                            : "Submit"}
                     </button>
                 </div>
 
                 {error && <p className="error-text">❌ {error}</p>}
+
+                {loading && extractedText && (
+                    <pre className="extract-preview">{extractedText}</pre>
+                )}
             </div>
         </div>
     );
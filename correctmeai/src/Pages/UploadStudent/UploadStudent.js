@@ -89,6 +89,7 @@ export default function UploadStudent() {
             const first = filesWithIndex[0];
             const fd = new FormData();
             fd.append("files", first.file);
+            fd.append("exam_id", selectedExamId);
 
             const ocrRes = await fetch(`${OCR_BASE}/extract-answers`, {
                 method: "POST",
@@ -100,19 +101,56 @@ export default function UploadStudent() {
             const student = ocr.student_name || ocr.student_id || "Unknown Student";
             const answers = ocr.answers || ocr.answers_structured || {};
 
-            const saveRes = await fetch(`${OCR_BASE}/api/submit-student`, {
-                method: "POST",
-                headers: { "Content-Type": "application/json" },
-                body: JSON.stringify({
-                    student_id: student,
-                    exam_id: selectedExamId,
-                    answers_structured: answers,
-                }),
-            });
-            const saved = await saveRes.json();
+            const save = (replace, separate = false) =>
+                fetch(`${OCR_BASE}/api/submit-student`, {
+                    method: "POST",
+                    headers: { "Content-Type": "application/json" },
+                    body: JSON.stringify({
+                        student_id: student,
+                        student_number: ocr.student_number,
+                        exam_id: selectedExamId,
+                        answers_structured: answers,
+                        pipeline: ocr.pipeline,
+                        replace,
+                        separate,
+                    }),
+                });
+            let saveRes = await save(false);
+            let saved = await saveRes.json();
+            // 409: this student already has a different submission for the exam
+            if (saveRes.status === 409 && saved?.duplicate === "student") {
+                const ex = saved.existing || {};
+                const existingId = saved.submission_id;
+                const shown =
+                    `Existing submission: ${ex.student_name || student}` +
+                    (ex.student_number ? ` (no. ${ex.student_number})` : "") +
+                    (ex.created_at ? `, saved ${new Date(ex.created_at).toLocaleString()}` : "") +
+                    `, ${ex.score == null ? "not graded yet" : `score ${ex.score}`}.`;
+                if (saved.identity === "name") {
+                    // matched on the name alone: it may be a different student with the same name
+                    if (window.confirm(`${shown}\n\nNo student number was read, so this may be another student named ${student}.\n\nOK: same student, replace the existing answers and grade with this scan.\nCancel: choose another option.`)) {
+                        saveRes = await save(existingId);
+                    } else if (window.confirm(`Save this scan as a different student named ${student}?\n\nCancel: open the existing submission instead.`)) {
+                        saveRes = await save(false, true);
+                    } else {
+                        navigate(`/result/${existingId}`);
+                        return;
+                    }
+                } else {
+                    if (!window.confirm(`${shown}\n\n${student} already has a submission for this exam. Replace it with this scan?`)) {
+                        navigate(`/result/${existingId}`);
+                        return;
+                    }
+                    saveRes = await save(true);
+                }
+                saved = await saveRes.json();
+            }
             if (!saveRes.ok || !saved?.submission_id) {
                 throw new Error(saved?.error || "Failed to save submission.");
             }
+            if (saved.similar_to?.length) {
+                alert(`⚠️ These answers closely match ${saved.similar_to.length} other submission(s) for this exam.`);
+            }
 
             navigate(`/result/${saved.submission_id}`);
         } catch (e) {